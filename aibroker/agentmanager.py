@@ -127,6 +127,8 @@ async def main() -> None:
                 "callback": summon_agent_request,
             },
         },
+        # Set if the world is hosted alongside others, e.g. its name (passed on to the agents too)
+        namespace=os.environ.get("ORCHESTRATOR_NAMESPACE", ""),
     )
 
     # Create AI Worker
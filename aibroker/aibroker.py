@@ -38,6 +38,8 @@ class AIBroker:
         self.error_count: Dict[str] = {}
         self.max_error_count: int = 10
         self.user_name: str = ""
+        # Subject of the current room's messages, if the Orchestrator publishes them per room
+        self.room_subject: str = ""
 
         this_system_message: str = self.get_ai_instructions()
         if system_message and system_message.strip():
@@ -67,12 +69,15 @@ class AIBroker:
                 "shutdown": {"mode": "subscribe", "callback": self.shutdown},
                 "logout": {"mode": "both", "callback": self.logout},
                 "room_update": {"mode": "subscribe", "callback": self.room_update},
+                "room": {"mode": "subscribe", "callback": self.room_message},
                 "world_data_update": {
                     "mode": "subscribe",
                     "callback": self.world_data_update,
                 },
                 "name_invalid": {"mode": "subscribe", "callback": self.name_invalid},
             },
+            # Set if the world is hosted alongside others, e.g. its name
+            namespace=environ.get("ORCHESTRATOR_NAMESPACE", ""),
         )
 
         # Start consuming messages
@@ -108,8 +113,25 @@ class AIBroker:
 
     # Room update event handler
     async def room_update(self, data: Dict) -> None:
-        # For now nothing, do not even log - this consists of the room description, and the image URL, not relevant to AI
-        pass
+        # Do not even log - this consists of the room description, and the image URL, not relevant to AI.
+        # But if room messages are published per room, follow the person into the new room.
+        room_subject: str = (
+            data.get("room_subject", "") if isinstance(data, dict) else ""
+        )
+        if room_subject != self.room_subject:
+            if self.room_subject:
+                await self.mbh.unsubscribe(self.room_subject)
+            if room_subject:
+                await self.mbh.subscribe(room_subject, self.room_message)
+            self.room_subject = room_subject
+
+    # Message to everyone in the current room, treated like a world update unless it's about me
+    async def room_message(self, data: Dict) -> None:
+        if not isinstance(data, dict) or "message" not in data:
+            logger.warning(f"Ignoring unexpected room message: {data}")
+            return
+        if self.user_id not in data.get("exclude", []):
+            await self.world_update(data["message"])
 
     # Person update event handler
     async def world_data_update(self, data: Dict) -> None:
@@ -214,7 +236,7 @@ class AIBroker:
             while not ai_name or not ai_name.isalpha():
                 # Keep trying til they get the name right
                 ai_name = (
-                    self.ai_manager.submit_request(request, history=False)
+                    (await self.ai_manager.submit_request_async(request, history=False))
                     .strip()
                     .strip(".")
                     .strip("!")
@@ -271,7 +293,7 @@ class AIBroker:
         self.event_log = []
 
     # Submit the world's updates as input to the AI manager
-    def submit_input(self) -> str:
+    async def submit_input(self) -> str:
         # TODO #60 Improve transactionality of event log management when submitting to AI
         # Grab and clear the log quickly to minimise threading issue risk
         tmp_log = self.event_log.copy()
@@ -287,13 +309,13 @@ class AIBroker:
         command_text = "Please enter a single valid command phrase, one line only:"
         message_text += command_text
 
-        return self.ai_manager.submit_request(message_text)
+        return await self.ai_manager.submit_request_async(message_text)
 
     # Check the event log for new events to process
     async def poll_event_log(self) -> None:
         if self.event_log and self.active:
             # OK, time to process the events that have built up
-            response = self.submit_input()
+            response = await self.submit_input()
             # TODO #64 improve AI event log polling
             # Check again we are still running (due to wait on model)
             if self.time_to_die:
@@ -1,5 +1,6 @@
 import unittest
-from unittest.mock import patch, call
+from unittest.mock import patch, call, AsyncMock
+import asyncio
 from aibroker import AIBroker
 
 
@@ -37,23 +38,53 @@ class TestAIBroker(unittest.TestCase):
         # Check that the AIManager was called with the expected system_message
         self.mock_ai_manager.set_system_message.assert_called_once()
 
+    def test_room_subject_messages(self):
+        self.ai_broker.mbh = AsyncMock()
+        self.ai_broker.user_id = "validius"
+        asyncio.run(
+            self.ai_broker.room_update({"title": "Road", "room_subject": "room.w.road"})
+        )
+        self.ai_broker.mbh.subscribe.assert_awaited_once_with(
+            "room.w.road", self.ai_broker.room_message
+        )
+        # Moving on unsubscribes from the previous room
+        asyncio.run(
+            self.ai_broker.room_update({"title": "Lane", "room_subject": "room.w.lane"})
+        )
+        self.ai_broker.mbh.unsubscribe.assert_awaited_once_with("room.w.road")
+        self.assertEqual(self.ai_broker.room_subject, "room.w.lane")
+
+        # Room messages are logged unless they are about this person
+        asyncio.run(
+            self.ai_broker.room_message({"message": "Bob waves.", "exclude": ["bob"]})
+        )
+        asyncio.run(
+            self.ai_broker.room_message(
+                {"message": "Validius waves.", "exclude": ["validius"]}
+            )
+        )
+        self.assertIn("Bob waves.", self.ai_broker.event_log)
+        self.assertNotIn("Validius waves.", self.ai_broker.event_log)
+
     def test_get_ai_instructions(self):
         # Check that the user_name was set correctly
         self.assertIn("instructions", self.ai_broker.get_ai_instructions().lower())
 
     async def test_set_ai_name(self):
         # Set up side_effect to return a name with a space, then a valid name
-        self.mock_ai_manager.submit_request.user_ide_effect = [
-            self.test_invalid_name,
-            self.test_valid_name,
-        ]
+        self.mock_ai_manager.submit_request_async = AsyncMock(
+            side_effect=[
+                self.test_invalid_name,
+                self.test_valid_name,
+            ]
+        )
 
         # Call set_ai_name and check the result
         ai_name = await self.ai_broker.set_ai_name()
         self.assertEqual(ai_name, self.test_valid_name)
 
-        # Check that submit_request was called three times (including in setup when constructor was called)
-        self.assertEqual(self.mock_ai_manager.submit_request.call_count, 3)
+        # Check that submit_request_async was called until a valid name was given
+        self.assertEqual(self.mock_ai_manager.submit_request_async.await_count, 2)
 
     def test_log_event(self):
         print("test_log_event", self.ai_broker.event_log)
@@ -85,14 +116,18 @@ class TestAIBroker(unittest.TestCase):
     def test_submit_input(self):
         # Set up side_effect to return a name with a space, then a valid name
         test_ai_output = "Test output"
-        self.mock_ai_manager.submit_request.return_value = test_ai_output
+        self.mock_ai_manager.submit_request_async = AsyncMock(
+            return_value=test_ai_output
+        )
 
         # Call submit_input and check the result
         ai_input = "Test input"
         self.ai_broker.log_event(ai_input)
-        ai_output = self.ai_broker.submit_input()
-        # Check ai_input is part of the request to submit_request
-        self.assertIn(ai_input, self.mock_ai_manager.submit_request.call_args[0][0])
+        ai_output = asyncio.run(self.ai_broker.submit_input())
+        # Check ai_input is part of the request to submit_request_async
+        self.assertIn(
+            ai_input, self.mock_ai_manager.submit_request_async.call_args[0][0]
+        )
         # Check ai_input is part of the return value
         self.assertIn(ai_output, test_ai_output)
         # Check event log cleared
@@ -105,7 +140,9 @@ class TestAIBroker(unittest.TestCase):
         self.ai_broker.log_event(test_event)
         # Poll the event log
         test_ai_output = "Test output"
-        self.mock_ai_manager.submit_request.return_value = test_ai_output
+        self.mock_ai_manager.submit_request_async = AsyncMock(
+            return_value=test_ai_output
+        )
 
         await self.ai_broker.poll_event_log()
 
@@ -1,6 +1,7 @@
 from typing import Dict
 from os import environ
 import asyncio
+import time
 from utils import get_critical_env_variable, set_up_logger, exit
 
 # Set up logger here BEFORE importing AI manager
@@ -11,6 +12,24 @@ from aimanager import AIManager
 from messagebroker_helper import MessageBrokerHelper
 
 
+# Spaces out requests to stay within a requests-per-minute limit (0 = unlimited)
+class RateLimiter:
+
+    def __init__(self, requests_per_minute: float) -> None:
+        self.interval: float = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.next_time: float = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        # Reserve the next slot, then wait for it
+        now: float = time.monotonic()
+        wait_time: float = self.next_time - now
+        self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+
 # Class to manage the AI's interaction with the Orchestrator
 class AIRequester:
 
@@ -27,15 +46,33 @@ class AIRequester:
             model_name=model_name,
             system_message=system_message,
         )
+        # Rate limiters keyed by model API / provider
+        self.rate_limiters: Dict[str, RateLimiter] = {}
+
+    # Get the rate limiter for a provider, configured by e.g. AIREQUESTER_GPT_REQUESTS_PER_MINUTE
+    def get_rate_limiter(self, model_api: str) -> RateLimiter:
+        if model_api not in self.rate_limiters:
+            requests_per_minute: float = float(
+                environ.get(
+                    f"AIREQUESTER_{str(model_api).upper()}_REQUESTS_PER_MINUTE",
+                    environ.get("AIREQUESTER_REQUESTS_PER_MINUTE", 0),
+                )
+            )
+            logger.info(
+                f"Rate limit for {model_api}: {requests_per_minute or 'unlimited'} requests per minute"
+            )
+            self.rate_limiters[model_api] = RateLimiter(requests_per_minute)
+        return self.rate_limiters[model_api]
 
     async def submit_request(self, prompt: str, system_message: str = "") -> str:
         this_system_message: str = (
             system_message if system_message else self.system_message
         )
+        await self.get_rate_limiter(self.ai_manager.get_model_api()).acquire()
         logger.info(
             f"Submitting request: {prompt} with system message: {this_system_message}"
         )
-        response = self.ai_manager.submit_request(
+        response = await self.ai_manager.submit_request_async(
             request=prompt, system_message=this_system_message, history=False
         )
         return response
@@ -51,30 +88,32 @@ async def main() -> None:
         if data:
             if "prompt" not in data:
                 exit(logger, "Received invalid AI request")
-            # Submit the request to the AI
-            ai_response = await ai_requester.submit_request(
-                prompt=data["prompt"],
-                system_message=data.get(
-                    "system_message",
-                    "You are a helpful AI assistant for an Orchestrator.",
-                ),
-            )
-            if ai_response:
-                response_package = {
-                    "ai_response": ai_response,
-                    "request_id": data["request_id"],
-                }
-                # Emit event back to server
-                await mbh.publish(
-                    "ai_response",
-                    response_package,
-                )
-            else:
-                exit(logger, "AI request returned no response")
-
+            await process_request(data)
         else:
             exit(logger, "Received invalid event")
 
+    async def process_request(data: Dict) -> None:
+        # Submit the request to the AI
+        ai_response = await ai_requester.submit_request(
+            prompt=data["prompt"],
+            system_message=data.get(
+                "system_message",
+                "You are a helpful AI assistant for an Orchestrator.",
+            ),
+        )
+        if ai_response:
+            response_package = {
+                "ai_response": ai_response,
+                "request_id": data["request_id"],
+            }
+            # Emit event back to server
+            await mbh.publish(
+                "ai_response",
+                response_package,
+            )
+        else:
+            exit(logger, "AI request returned no response")
+
     # Create AI Worker
     airequester_model_name: str = environ.get(
         "AIREQUESTER_MODEL_NAME", get_critical_env_variable("MODEL_NAME")
@@ -89,7 +128,14 @@ async def main() -> None:
         get_critical_env_variable("ORCHESTRATOR_HOSTNAME"),
         get_critical_env_variable("ORCHESTRATOR_PORT"),
         {
-            "ai_request": {"mode": "subscribe", "callback": catch_all},
+            # Requests wait in the message broker until an AI Requester has capacity for them.
+            # Replicas share the requests through the same durable consumer.
+            "ai_request": {
+                "mode": "pull",
+                "callback": catch_all,
+                "durable": "airequester",
+                "max_in_flight": int(environ.get("AIREQUESTER_MAX_IN_FLIGHT", 4)),
+            },
             "ai_response": {"mode": "publish"},
         },
     )
@@ -0,0 +1,65 @@
+import unittest
+import asyncio
+import time
+from os import environ
+from unittest.mock import AsyncMock, patch
+from airequester import AIRequester, RateLimiter
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_unlimited(self):
+        rate_limiter = RateLimiter(0)
+        start_time = time.monotonic()
+        for i in range(10):
+            await rate_limiter.acquire()
+        self.assertLess(time.monotonic() - start_time, 0.01)
+
+    async def test_requests_spaced_out(self):
+        # One request every 10ms
+        rate_limiter = RateLimiter(6000)
+        start_time = time.monotonic()
+        await asyncio.gather(*[rate_limiter.acquire() for i in range(4)])
+        # The first goes straight away, the others each wait for their own slot
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.03)
+
+
+class TestAIRequester(unittest.IsolatedAsyncioTestCase):
+
+    @patch("openai_client.get_model_client")
+    def setUp(self, MockModelClient) -> None:
+        self.ai_requester = AIRequester(
+            model_name="gpt-mock", system_message="This is a unit test"
+        )
+
+    @patch.dict(
+        environ,
+        {
+            "AIREQUESTER_GPT_REQUESTS_PER_MINUTE": "30",
+            "AIREQUESTER_REQUESTS_PER_MINUTE": "60",
+        },
+    )
+    def test_rate_limit_per_provider(self):
+        self.assertEqual(self.ai_requester.get_rate_limiter("GPT").interval, 2.0)
+        self.assertEqual(self.ai_requester.get_rate_limiter("Groq").interval, 1.0)
+        # Each provider has one rate limiter, shared by its requests
+        self.assertIs(
+            self.ai_requester.get_rate_limiter("GPT"),
+            self.ai_requester.get_rate_limiter("GPT"),
+        )
+
+    async def test_submit_request(self):
+        self.ai_requester.ai_manager.submit_request_async = AsyncMock(
+            return_value="Hello there"
+        )
+        self.assertEqual(await self.ai_requester.submit_request("Hello"), "Hello there")
+        self.assertEqual(
+            self.ai_requester.ai_manager.submit_request_async.call_args.kwargs[
+                "system_message"
+            ],
+            "This is a unit test",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,12 +3,15 @@ import traceback
 from os import path, makedirs, environ, sep
 import json
 import time
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
 import gemini_client
 import groq_client
 import stability_client
 import anthropic_client
 import openai_client
-from utils import set_up_logger, exit, get_logs_folder
+from utils import set_up_logger, exit, get_logs_folder, get_image_file_name
 
 # NOTE: Model-specific clients are imported dynamically in the StabilityAI section
 
@@ -25,6 +28,10 @@ class AIManager:
         # Static variables
         self.max_history: int = 40
         self.max_wait: int = 7  # secs
+        # Retry policy for model errors such as rate limiting
+        self.max_tries: int = 10
+        self.min_retry_wait: float = 1.0  # secs
+        self.max_retry_wait: float = 30.0  # secs
         self.last_time: float = time.time()
         self.active: bool = True
         self.input_token_count: int = 0
@@ -170,7 +177,7 @@ class AIManager:
     def build_message(self, role: str, content: str):
         return {"role": role, self.content_word: content}
 
-    # Submit a request to the model
+    # Submit a request to the model (blocking)
     def submit_request(
         self,
         request: str,
@@ -180,10 +187,88 @@ class AIManager:
         history: bool = True,
         system_message: Optional[str] = None,
         cleanup_output: bool = True,
+        timeout: Optional[float] = None,
     ) -> str:
+        request_coroutine = self.submit_request_async(
+            request,
+            model_name=model_name,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            history=history,
+            system_message=system_message,
+            cleanup_output=cleanup_output,
+            timeout=timeout,
+        )
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(request_coroutine)
+        # Called from async code (e.g. during start-up), so run on a loop of its own in another thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, request_coroutine).result()
+
+    # Submit a request to the model without blocking the event loop.
+    # The model call runs in a worker thread and back-off uses asyncio.sleep, so other
+    # messages keep being handled meanwhile. Cancelling the calling task abandons the request.
+    # The timeout is applied by the model's client, so each attempt has ended before the next starts.
+    async def submit_request_async(
+        self,
+        request: str,
+        model_name: Optional[str] = None,
+        max_tokens: Optional[int] = 1000,
+        temperature: float = 0.7,
+        history: bool = True,
+        system_message: Optional[str] = None,
+        cleanup_output: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        model_name = model_name or self.model_name
+        max_tokens = max_tokens or self.max_tokens
+        messages: List = self.build_request_messages(request, system_message, history)
+
+        # Get model response, retrying if necessary
+        model_response: Optional[str] = None
+        prompt_tokens: int = 0
+        response_tokens: int = 0
         try_count: int = 0
-        max_tries: int = 10
-        wait_time: float = 3.0
+        wait_time: float = self.min_retry_wait
+        while not model_response and try_count < self.max_tries:
+            try_count += 1
+            try:
+                model_response, prompt_tokens, response_tokens = (
+                    await asyncio.to_thread(
+                        self.do_model_request,
+                        messages,
+                        model_name,
+                        max_tokens,
+                        temperature,
+                        timeout,
+                    )
+                )
+                if cleanup_output:
+                    model_response = self.clean_up_response(model_response)
+            except Exception as e:
+                retry_wait_time: Optional[float] = self.get_retry_wait_time(
+                    e, try_count, wait_time
+                )
+                if retry_wait_time is None:
+                    return ""
+                wait_time = retry_wait_time
+                await asyncio.sleep(self.add_jitter(wait_time))
+
+        return self.record_response(
+            request,
+            model_response,
+            model_name,
+            history,
+            prompt_tokens,
+            response_tokens,
+        )
+
+    # Build the list of messages for model input from the system message, history and request
+    def build_request_messages(
+        self, request: str, system_message: Optional[str], history: bool
+    ) -> List:
         this_system_message: str = (
             system_message
             or self.system_message
@@ -194,10 +279,6 @@ class AIManager:
             f"Received request to submit: {request} with system message: {this_system_message}"
         )
 
-        # Use default values if not provided
-        model_name = model_name or self.model_name
-        max_tokens = max_tokens or self.max_tokens
-
         # Gemini has special message builder
         messages: List = []
         if self.get_model_api() == "Gemini":
@@ -236,95 +317,124 @@ class AIManager:
         logger.info(
             f"About to submit to model, with system message: {this_system_message}"
         )
+        return messages
 
-        # Get model response, retrying if necessary
+    # Make a single request to the model, returning the response and token counts
+    def do_model_request(
+        self,
+        messages: List,
+        model_name: str,
+        max_tokens: int,
+        temperature: float,
+        timeout: Optional[float] = None,
+    ) -> Tuple[Optional[str], int, int]:
         model_response: Optional[str] = None
         prompt_tokens: int = 0
         response_tokens: int = 0
-        wait_time: float = 0
+        # Behaviour varies according to model type.
+        if self.model_name.startswith("gpt"):
 
-        while not model_response and try_count < max_tries:
-            try_count += 1
-            try:
-                # Behaviour varies according to model type.
-                if self.model_name.startswith("gpt"):
-
-                    model_response, prompt_tokens, response_tokens = (
-                        openai_client.do_model_request(
-                            model_client=self.model_client,
-                            model_name=model_name,
-                            max_tokens=max_tokens,
-                            temperature=temperature,
-                            messages=messages,
-                        )
-                    )
-                elif self.get_model_api() == "Gemini":
-                    model_response = gemini_client.do_request(
-                        model_client=self.model_client, messages=messages
-                    )
-                elif self.get_model_api() == "Anthropic":
-                    model_response = anthropic_client.do_model_request(
-                        model_client=self.model_client,
-                        messages=messages,
-                        model_name=model_name,
-                        max_tokens=max_tokens,
-                        system_message=self.system_message,
-                    )
-                elif self.get_model_api() == "Groq":
-                    model_response = groq_client.do_model_request(
-                        model_client=self.model_client,
-                        messages=messages,
-                        model_name=model_name,
-                        max_tokens=max_tokens,
+            model_response, prompt_tokens, response_tokens = (
+                openai_client.do_model_request(
+                    model_client=self.model_client,
+                    model_name=model_name,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    messages=messages,
+                    timeout=timeout,
+                )
+            )
+        elif self.get_model_api() == "Gemini":
+            # Gemini's client takes no timeout
+            model_response = gemini_client.do_request(
+                model_client=self.model_client, messages=messages
+            )
+        elif self.get_model_api() == "Anthropic":
+            model_response = anthropic_client.do_model_request(
+                model_client=self.model_client,
+                messages=messages,
+                model_name=model_name,
+                max_tokens=max_tokens,
+                system_message=self.system_message,
+                timeout=timeout,
+            )
+        elif self.get_model_api() == "Groq":
+            model_response = groq_client.do_model_request(
+                model_client=self.model_client,
+                messages=messages,
+                model_name=model_name,
+                max_tokens=max_tokens,
+                timeout=timeout,
+            )
+        else:
+            exit(logger, f"Unsupported model type: {self.model_name}")
+        return model_response, prompt_tokens, response_tokens
+
+    # Decide whether a model error is worth retrying.
+    # Returns the time to wait before the next attempt, or None to give up.
+    def get_retry_wait_time(
+        self, e: Exception, try_count: int, wait_time: float
+    ) -> Optional[float]:
+        traceback.print_exc()
+        logger.info(f"Error from model: {str(e)}")
+        if (
+            "timed out" in str(e)
+            or "server is overloaded" in str(e)
+            or "The response was blocked." in str(e)
+            or "list index out of range" in str(e)
+            or "rate_limit_error" in str(e)
+            or "rate_limit_exceeded" in str(e)
+            or "Please try again later." in str(e)
+        ) and try_count < self.max_tries:
+            # Check for a substring like Please try again in 940.714285ms, if so, extract that wait time
+            if "Please try again in" in str(e):
+                wait_time = 0.1 + (
+                    float(
+                        str(e)
+                        .split("Please try again in ")[1]
+                        .split("ms")[0]
+                        .split("s")[0]
                     )
-                else:
-                    exit(logger, f"Unsupported model type: {self.model_name}")
+                    / 1000
+                )
+            elif try_count > 1:
+                wait_time = min(wait_time * 2, self.max_retry_wait)
+            logger.info(
+                f"Retrying in {wait_time} seconds... (attempt {try_count+1}/{self.max_tries})"
+            )
+            return wait_time
+        return None
 
-                # Clean up response
-                if cleanup_output and model_response:
-                    if "```" in model_response:
-                        model_response = model_response.split("```")[0].strip()
+    # Spread out retries so that many clients hitting a rate limit don't all retry at once
+    def add_jitter(self, wait_time: float) -> float:
+        return wait_time * random.uniform(0.5, 1.5)
 
-                    # Remove any emojis
-                    model_response = model_response.encode("ascii", "ignore").decode()
+    # Clean up a model response (remove code blocks, emojis, trailing comments)
+    def clean_up_response(self, model_response: Optional[str]) -> Optional[str]:
+        if model_response:
+            if "```" in model_response:
+                model_response = model_response.split("```")[0].strip()
 
-                    # Remove any leading hash
-                    model_response = model_response.lstrip("# ")
+            # Remove any emojis
+            model_response = model_response.encode("ascii", "ignore").decode()
 
-                    if "#" in model_response:
-                        model_response = model_response.split("#")[0].strip()
+            # Remove any leading hash
+            model_response = model_response.lstrip("# ")
 
-            except Exception as e:
-                traceback.print_exc()
-                logger.info(f"Error from model: {str(e)}")
-                if (
-                    "server is overloaded" in str(e)
-                    or "The response was blocked." in str(e)
-                    or "list index out of range" in str(e)
-                    or "rate_limit_error" in str(e)
-                    or "rate_limit_exceeded" in str(e)
-                    or "Please try again later." in str(e)
-                ) and try_count < max_tries:
-                    # Check for a substring like Please try again in 940.714285ms, if so, extract that wait time
-                    if "Please try again in" in str(e):
-                        wait_time = 0.1 + (
-                            float(
-                                str(e)
-                                .split("Please try again in ")[1]
-                                .split("ms")[0]
-                                .split("s")[0]
-                            )
-                            / 1000
-                        )
-                    else:
-                        wait_time = wait_time * 2
-                    logger.info(
-                        f"Retrying in {wait_time} seconds... (attempt {try_count+1}/{max_tries})"
-                    )
-                    time.sleep(int(wait_time))
-                else:
-                    return ""
+            if "#" in model_response:
+                model_response = model_response.split("#")[0].strip()
+        return model_response
 
+    # Log a model response and add it to the history
+    def record_response(
+        self,
+        request: str,
+        model_response: Optional[str],
+        model_name: str,
+        history: bool,
+        prompt_tokens: int,
+        response_tokens: int,
+    ) -> Optional[str]:
         if model_response:
             # Save response to file for fine-tuning purposes
             # TODO #24 Store log input/output better
@@ -449,25 +559,27 @@ class AIManager:
 
         # TODO #94 Handle quota exceeded errors esp from Gemini - different per model?
 
-        # Common filename definition, kept with the image generation to ensure consistency of format.
-        file_name: str = image_name.lower().replace(" ", "_").replace("'", "") + ".png"
         """Create an image from description and return the data"""
+        image_data: Optional[bytes] = None
         if self.get_model_api() == "GPT":
-            return file_name, openai_client.do_image_request(
+            image_data = openai_client.do_image_request(
                 model_client=self.model_client, prompt=description
             )
         elif self.get_model_api() == "StabilityAI":
-            return file_name, stability_client.do_image_request(
+            image_data = stability_client.do_image_request(
                 model_client=self.model_client, prompt=description
             )
         elif self.get_model_api() == "Gemini":
-            return file_name, gemini_client.do_image_request(prompt=description)
+            image_data = gemini_client.do_image_request(prompt=description)
         else:
             exit(
                 logger,
                 "Image generation using other model APIs than OpenAI and StabilityAI not yet supported!",
             )
-        return None, None
+        if not image_data:
+            return None, None
+        # Common filename definition, kept with the image generation to ensure consistency of format.
+        return get_image_file_name(image_name, image_data), image_data
 
     # Graceful exit, specific to AI management cases
     def dump_chat_history(self) -> None:
@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from utils import get_critical_env_variable, set_up_logger
 
 
@@ -23,6 +23,7 @@ def do_model_request(
     model_name: str,
     max_tokens: int,
     system_message: str,
+    timeout: Optional[float] = None,
 ) -> str:
 
     model_response = model_client.messages.create(
@@ -30,5 +31,7 @@ def do_model_request(
         max_tokens=max_tokens,
         messages=messages,
         system=system_message,
+        # Without one, the client's default timeout applies
+        **({"timeout": timeout} if timeout else {}),
     )
     return model_response.content[0].text
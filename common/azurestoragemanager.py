@@ -1,9 +1,17 @@
 from storagemanager import StorageManager
 from azure.core.credentials import AzureNamedKeyCredential
 from azure.storage.blob import BlobServiceClient, ContainerClient
-from azure.data.tables import TableServiceClient, UpdateMode
+from azure.data.tables import TableClient, TableServiceClient, UpdateMode
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from utils import get_critical_env_variable, set_up_logger, exit, debug
-from typing import Optional, Dict, List, Any
+from worldsnapshot import WorldSnapshot
+from typing import Optional, Dict, List, Any, Set, Tuple
+from os import environ
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import atexit
+import threading
+import time
 
 # Set up logger
 logger = set_up_logger()
@@ -14,8 +22,21 @@ import logging
 
 class AzureStorageManager(StorageManager):
 
+    # Maximum number of entities in one table transaction (Azure limit)
+    max_transaction_size: int = 100
+
+    # Table in which all world objects are stored
+    objects_table_name: str = "PythonObjects"
+
     # Constructor
-    def __init__(self, image_only: bool = False) -> None:
+    # With write_behind, stored objects are queued and written in batches by a background thread.
+    # With a snapshot folder, worlds are also kept on local disk, and only changes are loaded from the table.
+    def __init__(
+        self,
+        image_only: bool = False,
+        write_behind: bool = False,
+        snapshot_folder: str = "",
+    ) -> None:
         # Call parent constructor
         super().__init__(image_only)
         # Get and remember credential
@@ -50,6 +71,61 @@ class AzureStorageManager(StorageManager):
         # Cache of data types to convert to/from JSON to strings when storing
         self.complex_variable_cache: dict = {}
 
+        # Clients are created once and reused, so each operation reuses the same connections
+        self.objects_client: Optional[TableClient] = None
+        self.container_client: Optional[ContainerClient] = None
+        self.clients_lock: threading.Lock = threading.Lock()
+
+        # Calls and round trips to storage, by operation
+        self.operation_counts: Dict[str, int] = {}
+        self.round_trip_counts: Dict[str, int] = {}
+        self.counts_lock: threading.Lock = threading.Lock()
+
+        # Write-behind queue of entities to store, keyed by (PartitionKey, RowKey)
+        # so that repeated writes to the same object are coalesced
+        self.write_behind: bool = write_behind and not image_only
+        self.pending_writes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Keys of the queued writes that only have changed fields, to be merged into the stored entity
+        self.pending_merges: Set[Tuple[str, str]] = set()
+        # Queued deletes, with the location the object must still be at to be deleted ("" for anywhere)
+        self.pending_deletes: Dict[Tuple[str, str], str] = {}
+        # Writes and deletes taken from the queue by the flush in progress, until they reach the table
+        self.flushing_writes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.flushing_merges: Set[Tuple[str, str]] = set()
+        self.flushing_deletes: Dict[Tuple[str, str], str] = {}
+        self.pending_writes_lock: threading.Lock = threading.Lock()
+        # Only one flush at a time, so writes reach the table in order
+        self.flush_lock: threading.Lock = threading.Lock()
+        self.write_behind_secs: float = float(
+            environ.get("STORAGE_WRITE_BEHIND_SECS", 1.0)
+        )
+        self.write_event: threading.Event = threading.Event()
+        self.write_behind_active: bool = False
+
+        # Local snapshots of the worlds loaded, by world name
+        self.snapshot_folder: str = "" if image_only else snapshot_folder
+        self.snapshots: Dict[str, WorldSnapshot] = {}
+        # Snapshots older than this are not worth bringing up to date
+        self.snapshot_max_age_secs: float = float(
+            environ.get("STORAGE_SNAPSHOT_MAX_AGE_SECS", 24 * 60 * 60)
+        )
+        # Allowance for the difference between this clock and the table's timestamps
+        self.snapshot_clock_margin: timedelta = timedelta(
+            seconds=float(environ.get("STORAGE_SNAPSHOT_CLOCK_MARGIN_SECS", 300))
+        )
+        # With write-behind, snapshots are also saved this often, not just on close
+        self.snapshot_secs: float = float(environ.get("STORAGE_SNAPSHOT_SECS", 60))
+        self.last_snapshot_time: float = time.monotonic()
+
+        if self.write_behind:
+            self.start_write_behind()
+        elif self.snapshot_folder:
+            # Save snapshots on a normal exit (write-behind does this itself)
+            atexit.register(self.close)
+
+        # Entities per page when loading whole partitions (Azure returns at most 1000)
+        self.page_size: int = int(environ.get("STORAGE_PAGE_SIZE", 1000))
+
     # Return Azure credential
     def get_azure_credential(self):
         return AzureNamedKeyCredential(
@@ -75,40 +151,67 @@ class AzureStorageManager(StorageManager):
             credential=self.credential,
         )
 
+    # Return the client for the objects table, creating the table the first time only
+    def get_objects_client(self) -> TableClient:
+        if not self.objects_client:
+            with self.clients_lock:
+                if not self.objects_client:
+                    self.objects_client = (
+                        self.table_service_client.create_table_if_not_exists(
+                            self.objects_table_name
+                        )
+                    )
+                    self.count_round_trips("create_table", 1)
+        return self.objects_client
+
+    # Return the client for the image container, creating the container the first time only
+    def get_container_client(self) -> ContainerClient:
+        if not self.container_client:
+            with self.clients_lock:
+                if not self.container_client:
+                    container_client: ContainerClient = (
+                        self.blob_service_client.get_container_client(
+                            self.image_container_name
+                        )
+                    )
+                    round_trips: int = 1
+                    if not container_client.exists():
+                        container_client.create_container()
+                        logger.info(f"Created container '{self.image_container_name}'")
+                        round_trips += 1
+                    self.count_round_trips("create_container", round_trips)
+                    self.container_client = container_client
+        return self.container_client
+
+    # Record one call of a storage operation, and the round trips to storage it took
+    def count_round_trips(self, operation: str, round_trips: int) -> None:
+        with self.counts_lock:
+            self.operation_counts[operation] = (
+                self.operation_counts.get(operation, 0) + 1
+            )
+            self.round_trip_counts[operation] = (
+                self.round_trip_counts.get(operation, 0) + round_trips
+            )
+
+    def get_stats(self) -> str:
+        with self.counts_lock:
+            return ", ".join(
+                f"{operation}: {calls} calls, {self.round_trip_counts[operation]} round trips"
+                + f" ({self.round_trip_counts[operation] / calls:.2f} per call)"
+                for operation, calls in sorted(self.operation_counts.items())
+            )
+
     def store_image_in_cloud(
         self, world_name: str, image_name: str, image_data: bytes
     ) -> bool:
         logger.info(f"Uploading image '{image_name}' to cloud")
 
-        # Get a reference to the container
-        container_client: Optional[ContainerClient] = (
-            self.blob_service_client.get_container_client(self.image_container_name)
-        )
-
-        # Create the container if it doesn't exist
-        if not container_client:
-            try:
-                container_client.create_container()
-                logger.info(f"Created container '{self.image_container_name}'")
-            except Exception as e:
-                logger.error(
-                    f"Container '{self.image_container_name}' already exists: {e}"
-                )
-
-        # Get a reference to the blob
-        blob_client = self.blob_service_client.get_blob_client(
-            self.image_container_name, self.get_blob_name(world_name, image_name)
-        )
-
-        # Check if the blob already exists
-        if blob_client.exists():
-            logger.warning(f"Blob '{image_name}' already exists")
-            # Remove it
-            blob_client.delete_blob()
-
-        # Upload the image
+        # Upload the image, replacing any existing blob of the same name
         try:
-            blob_client.upload_blob(image_data)
+            self.get_container_client().upload_blob(
+                self.get_blob_name(world_name, image_name), image_data, overwrite=True
+            )
+            self.count_round_trips("store_image", 1)
             logger.info(f"Uploaded image '{image_name}'")
             return True
         except Exception as e:
@@ -128,56 +231,386 @@ class AzureStorageManager(StorageManager):
     def get_image_blob(self, blob_name: str) -> Optional[bytes]:
         if self.image_container_name:
             logger.info(f"Downloading {blob_name} from Azure blob storage")
-            blob_client: BlobServiceClient = self.blob_service_client.get_blob_client(
-                self.image_container_name, blob_name
+            image_data: bytes = (
+                self.get_container_client().download_blob(blob_name).readall()
             )
-            if blob_client:
-                return blob_client.download_blob().readall()
-            else:
-                logger.error("Could not resolve blob client.")
+            self.count_round_trips("get_image", 1)
+            return image_data
         return None
 
+    def list_image_blobs(self, prefix: str) -> List[str]:
+        if not self.image_container_name:
+            return []
+        blob_names: List[str] = list(
+            self.get_container_client().list_blob_names(name_starts_with=prefix)
+        )
+        # Listed in pages of up to 5000
+        self.count_round_trips("list_images", len(blob_names) // 5000 + 1)
+        return blob_names
+
+    # Write-behind management
+
+    def start_write_behind(self) -> None:
+        logger.info(
+            f"Starting write-behind storage worker, flushing every {self.write_behind_secs} seconds"
+        )
+        self.write_behind_active = True
+        self.write_behind_thread: threading.Thread = threading.Thread(
+            target=self.write_behind_loop, name="write_behind", daemon=True
+        )
+        self.write_behind_thread.start()
+        # Make sure nothing queued is lost on a normal exit
+        atexit.register(self.close)
+
+    def write_behind_loop(self) -> None:
+        while self.write_behind_active:
+            self.write_event.wait(self.write_behind_secs)
+            self.write_event.clear()
+            try:
+                self.flush_pending_writes()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+            if (
+                self.snapshots
+                and time.monotonic() - self.last_snapshot_time >= self.snapshot_secs
+            ):
+                try:
+                    self.save_snapshots()
+                except Exception as e:
+                    logger.error(f"Snapshot save failed: {e}")
+
+    # Apply all queued deletes, then write all queued entities to the table
+    def flush_pending_writes(self) -> None:
+        with self.flush_lock:
+            with self.pending_writes_lock:
+                if not self.pending_writes and not self.pending_deletes:
+                    return
+                writes: Dict[Tuple[str, str], Dict[str, Any]] = self.pending_writes
+                merges: Set[Tuple[str, str]] = self.pending_merges
+                deletes: Dict[Tuple[str, str], str] = self.pending_deletes
+                self.pending_writes = {}
+                self.pending_merges = set()
+                self.pending_deletes = {}
+                # Readers still see these until they are in the table
+                self.flushing_writes = writes
+                self.flushing_merges = merges
+                self.flushing_deletes = deletes
+            try:
+                # Deletes were queued before any write of the same object that was queued with them
+                if deletes:
+                    self.delete_entities(deletes, writes)
+                if writes:
+                    self.store_entities(writes, merges)
+            finally:
+                with self.pending_writes_lock:
+                    self.flushing_writes = {}
+                    self.flushing_merges = set()
+                    self.flushing_deletes = {}
+
+    # Write entities to the table, in batched transactions per partition
+    def store_entities(
+        self,
+        writes: Dict[Tuple[str, str], Dict[str, Any]],
+        merges: Set[Tuple[str, str]],
+    ) -> None:
+        objects_client: TableClient = self.get_objects_client()
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        batch_count: int = 0
+        for entity in writes.values():
+            partitions.setdefault(entity["PartitionKey"], []).append(entity)
+        for partition_key, entities in partitions.items():
+            for i in range(0, len(entities), self.max_transaction_size):
+                batch: List[Dict[str, Any]] = entities[
+                    i : i + self.max_transaction_size
+                ]
+                batch_count += 1
+                try:
+                    objects_client.submit_transaction(
+                        [
+                            (
+                                "upsert",
+                                entity,
+                                {"mode": self.get_update_mode(entity, merges)},
+                            )
+                            for entity in batch
+                        ]
+                    )
+                    logger.info(
+                        f"Stored batch of {len(batch)} objects in {partition_key}"
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Error storing batch of {len(batch)} objects in {partition_key}, storing one at a time: {e}"
+                    )
+                    batch_count += self.store_entities_singly(batch, merges)
+        self.count_round_trips("flush_pending_writes", batch_count)
+
+    # Store the entities of a failed transaction one at a time, so one bad entity doesn't hold up the rest.
+    # Returns the number of round trips.
+    def store_entities_singly(
+        self, entities: List[Dict[str, Any]], merges: Set[Tuple[str, str]]
+    ) -> int:
+        objects_client: TableClient = self.get_objects_client()
+        failed: List[Dict[str, Any]] = []
+        for entity in entities:
+            try:
+                objects_client.upsert_entity(
+                    mode=self.get_update_mode(entity, merges), entity=entity
+                )
+            except HttpResponseError as e:
+                if self.is_permanent_error(e):
+                    # Retrying would fail the same way, so it cannot be stored
+                    logger.error(
+                        f"Dropping {entity['PartitionKey']} - {entity['RowKey']}, rejected by storage: {e}"
+                    )
+                else:
+                    failed.append(entity)
+            except Exception as e:
+                logger.error(f"Error storing {entity['RowKey']}, will retry: {e}")
+                failed.append(entity)
+        if failed:
+            self.requeue_writes(failed, merges)
+        return len(entities)
+
+    # Delete entities from the table, each only if still at the location it was deleted from.
+    # A failed delete is queued again, unless the object was stored again after it.
+    def delete_entities(
+        self,
+        deletes: Dict[Tuple[str, str], str],
+        writes: Dict[Tuple[str, str], Dict[str, Any]],
+    ) -> None:
+        objects_client: TableClient = self.get_objects_client()
+        round_trips: int = 0
+        for (partition_key, row_key), location in deletes.items():
+            try:
+                if location:
+                    round_trips += 1
+                    if not list(
+                        objects_client.query_entities(
+                            "PartitionKey eq @pk and RowKey eq @rk and location eq @location",
+                            parameters={
+                                "pk": partition_key,
+                                "rk": row_key,
+                                "location": location,
+                            },
+                        )
+                    ):
+                        continue
+                round_trips += 1
+                objects_client.delete_entity(
+                    partition_key=partition_key, row_key=row_key
+                )
+                logger.info(f"Deleted {partition_key} - {row_key}")
+            except ResourceNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(
+                    f"Error deleting {partition_key} - {row_key}, will retry: {e}"
+                )
+                if (partition_key, row_key) not in writes:
+                    with self.pending_writes_lock:
+                        self.pending_deletes.setdefault(
+                            (partition_key, row_key), location
+                        )
+        self.count_round_trips("flush_pending_deletes", round_trips)
+
+    # Whether the table service rejected a request as invalid, rather than being unavailable or throttling
+    def is_permanent_error(self, e: HttpResponseError) -> bool:
+        return (
+            e.status_code is not None
+            and 400 <= e.status_code < 500
+            and e.status_code not in (408, 429)
+        )
+
+    # Changed fields are merged into the stored entity, whole objects replace it
+    def get_update_mode(
+        self, entity: Dict[str, Any], merges: Set[Tuple[str, str]]
+    ) -> UpdateMode:
+        if (entity["PartitionKey"], entity["RowKey"]) in merges:
+            return UpdateMode.MERGE
+        return UpdateMode.REPLACE
+
+    # Queue a write, combining it with any earlier write of the same object not yet flushed
+    def queue_write(self, entity: Dict[str, Any], merge: bool) -> None:
+        key: Tuple[str, str] = (entity["PartitionKey"], entity["RowKey"])
+        with self.pending_writes_lock:
+            if merge and key in self.pending_writes:
+                # Apply the changes to the queued write, which keeps its mode
+                self.pending_writes[key] = {**self.pending_writes[key], **entity}
+            else:
+                self.pending_writes[key] = entity
+                if merge:
+                    self.pending_merges.add(key)
+                else:
+                    self.pending_merges.discard(key)
+            if len(self.pending_writes) >= self.max_transaction_size:
+                self.write_event.set()
+
+    # Queue a delete, in place of any write of the same object not yet flushed
+    def queue_delete(self, partition_key: str, row_key: str, location: str) -> None:
+        key: Tuple[str, str] = (partition_key, row_key)
+        with self.pending_writes_lock:
+            self.pending_writes.pop(key, None)
+            self.pending_merges.discard(key)
+            self.pending_deletes[key] = location
+
+    # Changes to a partition's objects (or just one object) not yet in the table, oldest first,
+    # as (change, row key, entity or location) where the change is "replace", "merge" or "delete"
+    def get_pending_changes(
+        self, partition_key: str, row_key: Optional[str] = None
+    ) -> List[Tuple[str, str, Any]]:
+        changes: List[Tuple[str, str, Any]] = []
+        with self.pending_writes_lock:
+            # Those being flushed were queued before those still queued, and deletes before writes
+            for deletes, writes, merges in (
+                (self.flushing_deletes, self.flushing_writes, self.flushing_merges),
+                (self.pending_deletes, self.pending_writes, self.pending_merges),
+            ):
+                for (pk, rk), location in deletes.items():
+                    if pk == partition_key and row_key in (None, rk):
+                        changes.append(("delete", rk, location))
+                for (pk, rk), entity in writes.items():
+                    if pk == partition_key and row_key in (None, rk):
+                        changes.append(
+                            (
+                                "merge" if (pk, rk) in merges else "replace",
+                                rk,
+                                entity.copy(),
+                            )
+                        )
+        return changes
+
+    # Apply changes not yet in the table to the objects read from it, keyed by row key
+    def apply_pending_changes(
+        self, rows: Dict[str, Dict[str, Any]], changes: List[Tuple[str, str, Any]]
+    ) -> None:
+        for change, row_key, value in changes:
+            if change == "delete":
+                if row_key in rows and value in ("", rows[row_key].get("location")):
+                    del rows[row_key]
+            elif change == "merge":
+                rows[row_key] = {**rows.get(row_key, {}), **value}
+            else:
+                rows[row_key] = value
+
+    # Put failed writes back on the queue, under any changes queued since
+    def requeue_writes(
+        self, entities: List[Dict[str, Any]], merges: Set[Tuple[str, str]]
+    ) -> None:
+        with self.pending_writes_lock:
+            for entity in entities:
+                key: Tuple[str, str] = (entity["PartitionKey"], entity["RowKey"])
+                if key in self.pending_writes and key not in self.pending_merges:
+                    # Superseded by a later write of the whole object
+                    continue
+                self.pending_writes[key] = {
+                    **entity,
+                    **self.pending_writes.get(key, {}),
+                }
+                if key in merges:
+                    self.pending_merges.add(key)
+                else:
+                    self.pending_merges.discard(key)
+
+    # Stop the write-behind worker and durably flush anything still queued
+    def close(self) -> None:
+        logger.info(f"Storage round trips: {self.get_stats()}")
+        if self.write_behind_active:
+            logger.info("Stopping write-behind storage worker")
+            self.write_behind_active = False
+            self.write_event.set()
+            self.write_behind_thread.join()
+        self.flush_pending_writes()
+        with self.pending_writes_lock:
+            if self.pending_writes:
+                logger.error(
+                    f"{len(self.pending_writes)} objects could not be stored on close"
+                )
+            if self.pending_deletes:
+                logger.error(
+                    f"{len(self.pending_deletes)} objects could not be deleted on close"
+                )
+        # Anything that could not be stored is kept in the snapshot, to be retried next time
+        self.save_snapshots()
+
+    # Snapshot management
+
+    # Save the snapshot of each world, with any of its writes still queued
+    def save_snapshots(self) -> None:
+        self.last_snapshot_time = time.monotonic()
+        with self.pending_writes_lock:
+            pending_writes: List[Dict[str, Any]] = list(self.pending_writes.values())
+            pending_merges: Set[Tuple[str, str]] = set(self.pending_merges)
+        for world_name, snapshot in self.snapshots.items():
+            world_writes: List[Dict[str, Any]] = [
+                entity
+                for entity in pending_writes
+                if entity["PartitionKey"].startswith(world_name + "__")
+            ]
+            snapshot.save(
+                world_writes,
+                [
+                    [entity["PartitionKey"], entity["RowKey"]]
+                    for entity in world_writes
+                    if (entity["PartitionKey"], entity["RowKey"]) in pending_merges
+                ],
+            )
+
+    # Return the world's snapshot, loading it from file the first time
+    def get_snapshot(self, world_name: str) -> WorldSnapshot:
+        if world_name not in self.snapshots:
+            snapshot: WorldSnapshot = WorldSnapshot(self.snapshot_folder, world_name)
+            if snapshot.load(self.snapshot_max_age_secs):
+                # Queue again any writes that had not been stored when the snapshot was saved
+                self.requeue_writes(
+                    snapshot.pending_writes,
+                    {tuple(key) for key in snapshot.pending_merges},
+                )
+            self.snapshots[world_name] = snapshot
+        return self.snapshots[world_name]
+
     # Store all Python objects, received as actual objects
     def store_world_object(self, world_name: str, object: object) -> bool:
-        logger.debug(f"Storing python object in world {world_name}: {object.__dict__}")
+        logger.debug(f"Storing python object in world {world_name}: {object.name}")
 
-        objects_client = self.table_service_client.create_table_if_not_exists(
-            "PythonObjects"
-        )
+        # Only the fields changed since the object was last stored or loaded need storing, if any
+        changed_fields: Optional[Set[str]] = self.get_changed_fields(object)
+        if changed_fields == set():
+            logger.debug(f"No changes to store for {object.name}")
+            self.count_round_trips("store_world_object", 0)
+            return True
+        merge: bool = changed_fields is not None
 
         # Store object in Azure
         # Convert to dict
-        entity: dict = object.__dict__.copy()
-        entity["PartitionKey"] = world_name + "__" + type(object).__name__
-
+        entity: Optional[Dict[str, Any]] = self.get_storage_entity(
+            world_name, object, changed_fields
+        )
         # Don't store objects named "system" - they are transient
-        if entity["name"] == "system":
+        if not entity:
             return False
 
-        entity["RowKey"] = entity["name"]
-        if "id" in entity:
-            entity["RowKey"] += "__" + entity["id"]
-
-        # TODO #85 Don't hard-code attributes to remove on storage
-        # Override fields that contain object values lists etc
-
-        # 1. World - use the world name just for supportability
-        entity["world"] = world_name
-        # 2. Inventory - reconstituted from location
-        if "inventory" in entity:
-            del entity["inventory"]
-        # 3. Input history - not needed, we want to start fresh each session
-        if "input_history" in entity:
-            del entity["input_history"]
         # Convert fields containing lists/dicts to strings
         # This keeps the database readable/editable, simple, and cheap (can use Azure Table Storage in other words)
 
         # First, learn and cache the list of fields to convert for this type of object (partition key can be used for this)
         self.stringify_object(entity)
 
-        logger.info(f"Storing {entity['name']}")
-        print(entity)
-        objects_client.upsert_entity(mode=UpdateMode.REPLACE, entity=entity)
+        if self.write_behind:
+            # Queued writes are retried until they are stored
+            self.queue_write(entity, merge)
+            logger.debug(f"Queued {object.name} for storage")
+        else:
+            logger.info(f"Storing {object.name}")
+            self.get_objects_client().upsert_entity(
+                mode=UpdateMode.MERGE if merge else UpdateMode.REPLACE, entity=entity
+            )
+            self.count_round_trips("store_world_object", 1)
+
+        # Only once stored (or queued), so the changes are not forgotten if storing fails
+        self.mark_stored(object)
+        if world_name in self.snapshots:
+            self.snapshots[world_name].update(entity, merge)
 
         # Return true if successful
         return True
@@ -186,54 +619,238 @@ class AzureStorageManager(StorageManager):
     def delete_world_object(
         self, world_name: str, object_type: str, name: str, location: str = ""
     ) -> bool:
-        objects_client = self.table_service_client.get_table_client("PythonObjects")
-        if objects_client:
-            parameters: dict = {"pk": world_name + "__" + object_type, "rk": name}
-            query_filter: str = "PartitionKey eq @pk and RowKey eq @rk"
-            if location:
-                parameters["location"] = location
-                query_filter += " and location eq @location"
-            for entity in objects_client.query_entities(
-                query_filter, parameters=parameters
-            ):
-                logger.info(f"Deleting {entity['PartitionKey']} - {entity['name']}")
-                objects_client.delete_entity(
-                    partition_key=entity["PartitionKey"], row_key=entity["RowKey"]
+        if self.write_behind:
+            # Deleted in order with the object's queued writes, without waiting for the table
+            partition_key: str = world_name + "__" + object_type
+            self.queue_delete(partition_key, name, location)
+            if world_name in self.snapshots:
+                self.snapshots[world_name].remove(partition_key, name)
+            logger.info(f"Queued deletion of {partition_key} - {name}")
+            self.count_round_trips("delete_world_object", 0)
+            return True
+        # Queued writes must land first, or they would resurrect the deleted object
+        self.flush_pending_writes()
+        objects_client: TableClient = self.get_objects_client()
+        parameters: dict = {"pk": world_name + "__" + object_type, "rk": name}
+        query_filter: str = "PartitionKey eq @pk and RowKey eq @rk"
+        if location:
+            parameters["location"] = location
+            query_filter += " and location eq @location"
+        for entity in objects_client.query_entities(
+            query_filter, parameters=parameters
+        ):
+            logger.info(f"Deleting {entity['PartitionKey']} - {entity['name']}")
+            objects_client.delete_entity(
+                partition_key=entity["PartitionKey"], row_key=entity["RowKey"]
+            )
+            self.count_round_trips("delete_world_object", 2)
+            if world_name in self.snapshots:
+                self.snapshots[world_name].remove(
+                    entity["PartitionKey"], entity["RowKey"]
                 )
-                return True
+            return True
+        self.count_round_trips("delete_world_object", 1)
         return False
 
     # Delete all objects in a world
     def delete_world_from_db(self, world_name: str) -> None:
-        objects_client = self.table_service_client.get_table_client("PythonObjects")
-        if objects_client:
-            logger.info(f"Deleting all objects in world {world_name}")
-            parameters: dict = {"world": world_name}
-            query_filter: str = "world eq @world"
-            for entity in objects_client.query_entities(
+        objects_client: TableClient = self.get_objects_client()
+        logger.info(f"Deleting all objects in world {world_name}")
+        if world_name in self.snapshots:
+            self.snapshots[world_name].clear()
+        # Nothing queued for the world needs storing any more
+        with self.pending_writes_lock:
+            for key in [
+                key
+                for key in self.pending_writes
+                if key[0].startswith(world_name + "__")
+            ]:
+                del self.pending_writes[key]
+                self.pending_merges.discard(key)
+            for key in [
+                key
+                for key in self.pending_deletes
+                if key[0].startswith(world_name + "__")
+            ]:
+                del self.pending_deletes[key]
+        parameters: dict = {"world": world_name}
+        query_filter: str = "world eq @world"
+        round_trips: int = 0
+        # Any flush under way finishes first, so none of its writes land after the deletes
+        with self.flush_lock:
+            for page in objects_client.query_entities(
                 query_filter, parameters=parameters
-            ):
-                logger.info(f"Deleting {entity['PartitionKey']} - {entity['name']}")
-                objects_client.delete_entity(
-                    partition_key=entity["PartitionKey"], row_key=entity["RowKey"]
-                )
+            ).by_page():
+                round_trips += 1
+                for entity in page:
+                    logger.info(f"Deleting {entity['PartitionKey']} - {entity['name']}")
+                    objects_client.delete_entity(
+                        partition_key=entity["PartitionKey"], row_key=entity["RowKey"]
+                    )
+                    round_trips += 1
+        self.count_round_trips("delete_world_from_db", round_trips)
 
     # Returns all instances of a type of object, as a dict
     def get_world_objects(
         self, world_name: str, object_type: str, rowkey_value: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        objects_client = self.table_service_client.get_table_client("PythonObjects")
-        if objects_client:
-            objects: List[Dict[str, Any]] = []
-            parameters: Dict[str, str] = {"pk": world_name + "__" + object_type}
-            query_filter: str = "PartitionKey eq @pk"
-            if rowkey_value:
-                parameters["rk"] = rowkey_value
-                query_filter += " and RowKey eq @rk"
-            for entity in objects_client.query_entities(
-                query_filter, parameters=parameters
-            ):
+        partition_key: str = world_name + "__" + object_type
+        # Our own queued writes and deletes are the latest versions of the objects
+        # (e.g. a person logging back in soon after leaving), so are applied over the table's
+        changes: List[Tuple[str, str, Any]] = self.get_pending_changes(
+            partition_key, rowkey_value or None
+        )
+        rows: Dict[str, Dict[str, Any]] = {}
+        parameters: Dict[str, str] = {"pk": partition_key}
+        query_filter: str = "PartitionKey eq @pk"
+        if rowkey_value:
+            parameters["rk"] = rowkey_value
+            query_filter += " and RowKey eq @rk"
+        round_trips: int = 0
+        for page in (
+            self.get_objects_client()
+            .query_entities(query_filter, parameters=parameters)
+            .by_page()
+        ):
+            round_trips += 1
+            for entity in page:
+                rows[entity["RowKey"]] = entity.copy()
+        self.count_round_trips("get_world_objects", round_trips)
+        self.apply_pending_changes(rows, changes)
+        objects: List[Dict[str, Any]] = list(rows.values())
+        for entity in objects:
+            self.stringify_object(entity, action="destringify")
+        return objects
+
+    # Start getting all objects of several types at once, each partition fetched by its own thread
+    def start_getting_world_objects(
+        self, world_name: str, object_types: List[str]
+    ) -> Dict[str, Future]:
+        snapshot: Optional[WorldSnapshot] = None
+        if self.snapshot_folder:
+            snapshot = self.get_snapshot(world_name)
+            snapshot.loaded_at = datetime.now(timezone.utc) - self.snapshot_clock_margin
+        # Read our own queued writes
+        self.flush_pending_writes()
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=len(object_types), thread_name_prefix="world_load"
+        )
+        futures: Dict[str, Future] = {
+            object_type: executor.submit(
+                self.get_partition_objects, world_name + "__" + object_type, snapshot
+            )
+            for object_type in object_types
+        }
+        # Threads finish in the background, the futures give their results
+        executor.shutdown(wait=False)
+        return futures
+
+    # Return all objects in a partition, destringifying each page as it arrives.
+    # With a snapshot, only objects changed since it was taken are fetched, and merged into it,
+    # then objects deleted since are dropped.
+    def get_partition_objects(
+        self, partition_key: str, snapshot: Optional[WorldSnapshot] = None
+    ) -> List[Dict[str, Any]]:
+        objects: List[Dict[str, Any]] = []
+        query_filter: str = "PartitionKey eq @pk"
+        parameters: Dict[str, Any] = {"pk": partition_key}
+        snapshot_rows: Optional[Dict[str, Dict[str, Any]]] = None
+        if snapshot:
+            if partition_key in snapshot.partitions and snapshot.as_of:
+                snapshot_rows = dict(snapshot.partitions[partition_key])
+                query_filter += " and Timestamp ge @since"
+                parameters["since"] = snapshot.as_of
+            else:
+                snapshot_rows = {}
+        pages = (
+            self.get_objects_client()
+            .query_entities(
+                query_filter,
+                parameters=parameters,
+                results_per_page=self.page_size,
+            )
+            .by_page()
+        )
+        changed_count: int = 0
+        round_trips: int = 0
+        for page in pages:
+            round_trips += 1
+            for entity in page:
+                changed_count += 1
+                if snapshot_rows is not None:
+                    # Snapshots keep objects as stored
+                    snapshot_rows[entity["RowKey"]] = entity.copy()
+                else:
+                    self.stringify_object(entity, action="destringify")
+                    objects.append(entity.copy())
+        if "since" in parameters:
+            # Deleted objects don't show up as changes, so drop any the table no longer has
+            round_trips += self.remove_deleted_rows(partition_key, snapshot_rows)
+        self.count_round_trips("get_partition_objects", round_trips)
+        if snapshot_rows is not None:
+            snapshot.set_partition(partition_key, snapshot_rows)
+            for row in snapshot_rows.values():
+                entity = row.copy()
                 self.stringify_object(entity, action="destringify")
-                objects.append(entity.copy())
-            return objects
-        exit(logger, "No objects found in cloud!")
+                objects.append(entity)
+            logger.info(
+                f"Loaded {len(objects)} objects from {partition_key} ({changed_count} from storage)"
+            )
+        else:
+            logger.info(f"Loaded {len(objects)} objects from {partition_key}")
+        return objects
+
+    # Remove snapshot rows deleted from the table (e.g. by another process) since the snapshot was taken,
+    # using a query for the keys only. Returns the number of round trips.
+    def remove_deleted_rows(
+        self, partition_key: str, snapshot_rows: Dict[str, Dict[str, Any]]
+    ) -> int:
+        pages = (
+            self.get_objects_client()
+            .query_entities(
+                "PartitionKey eq @pk",
+                parameters={"pk": partition_key},
+                select=["PartitionKey", "RowKey"],
+                results_per_page=self.page_size,
+            )
+            .by_page()
+        )
+        row_keys: Set[str] = set()
+        round_trips: int = 0
+        for page in pages:
+            round_trips += 1
+            row_keys.update(entity["RowKey"] for entity in page)
+        for row_key in set(snapshot_rows) - row_keys:
+            logger.info(f"{row_key} has been deleted from {partition_key}")
+            del snapshot_rows[row_key]
+        return round_trips
+
+    # Point read of a single object by name, rather than a query
+    def get_world_object(
+        self, world_name: str, object_type: str, rowkey_value: str
+    ) -> Optional[Dict[str, Any]]:
+        partition_key: str = world_name + "__" + object_type
+        # Queued writes and deletes are the latest versions of the object
+        changes: List[Tuple[str, str, Any]] = self.get_pending_changes(
+            partition_key, rowkey_value
+        )
+        rows: Dict[str, Dict[str, Any]] = {}
+        if any(change == "replace" for change, _, _ in changes):
+            # The whole object is queued, so the table's version is not needed
+            self.count_round_trips("get_world_object", 0)
+        else:
+            self.count_round_trips("get_world_object", 1)
+            try:
+                rows[rowkey_value] = (
+                    self.get_objects_client()
+                    .get_entity(partition_key=partition_key, row_key=rowkey_value)
+                    .copy()
+                )
+            except ResourceNotFoundError:
+                pass
+        self.apply_pending_changes(rows, changes)
+        if rowkey_value not in rows:
+            return None
+        entity: Dict[str, Any] = rows[rowkey_value]
+        self.stringify_object(entity, action="destringify")
+        return entity
@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from utils import get_critical_env_variable, set_up_logger
 
 
@@ -24,12 +24,15 @@ def do_model_request(
     messages: List[Dict[str, str]],
     model_name: str = "mixtral-8x7b-32768",
     max_tokens: int = 1000,
+    timeout: Optional[float] = None,
 ) -> str:
 
     chat_completion = model_client.chat.completions.create(
         messages=messages,
         model=model_name,
         max_tokens=max_tokens,
+        # Without one, the client's default timeout applies
+        **({"timeout": timeout} if timeout else {}),
     )
     import pprint
 
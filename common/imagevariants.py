@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional, Tuple
+from io import BytesIO
+from PIL import Image, features
+from utils import set_up_logger
+
+# Set up logger
+logger = set_up_logger()
+
+# Smaller versions of each image, by size name and width, for smaller screens and thumbnails
+VARIANT_WIDTHS: Dict[str, int] = {"thumbnail": 256, "mobile": 640, "desktop": 1280}
+FULL_SIZE: str = "full"
+# Formats that images are converted to, best compression first (PNG for browsers that support neither).
+# Pillow only encodes AVIF from 11.3.
+VARIANT_FORMATS: Tuple[str, ...] = tuple(
+    image_format
+    for image_format in ("avif", "webp", "png")
+    if image_format == "png" or features.check(image_format)
+)
+# Encoder options for each format
+FORMAT_OPTIONS: Dict[str, Dict] = {
+    "avif": {"quality": 60},
+    "webp": {"quality": 80, "method": 4},
+    "png": {"optimize": True},
+}
+# Only raster images are converted
+SOURCE_EXTENSIONS: Tuple[str, ...] = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def has_variants(image_name: str) -> bool:
+    return "@" not in image_name and image_name.lower().endswith(SOURCE_EXTENSIONS)
+
+
+# A variant is named after the original image, e.g. room.png@mobile.webp,
+# so the name of the original can always be found from it
+def get_variant_name(image_name: str, size: str, image_format: str) -> str:
+    return f"{image_name}@{size}.{image_format}"
+
+
+# Return the original image name, size and format of a variant, or None if it is not a valid variant name
+def parse_variant_name(variant_name: str) -> Optional[Tuple[str, str, str]]:
+    image_name, _, variant = variant_name.rpartition("@")
+    size, _, image_format = variant.partition(".")
+    if (
+        not has_variants(image_name)
+        or (size not in VARIANT_WIDTHS and size != FULL_SIZE)
+        or image_format not in VARIANT_FORMATS
+    ):
+        return None
+    return image_name, size, image_format
+
+
+# Sizes at least as wide as the original would be the same as the full size, so the full size is used instead
+def get_stored_size(size: str, width: int) -> str:
+    if size in VARIANT_WIDTHS and VARIANT_WIDTHS[size] >= width:
+        return FULL_SIZE
+    return size
+
+
+def get_image_width(image_data: bytes) -> int:
+    return Image.open(BytesIO(image_data)).width
+
+
+# Convert an image to the given size (never larger than the original) and format
+def create_variant(image_data: bytes, size: str, image_format: str) -> bytes:
+    image: Image.Image = Image.open(BytesIO(image_data))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    width: int = VARIANT_WIDTHS.get(size, image.width)
+    if width < image.width:
+        image = image.resize(
+            (width, max(1, round(image.height * width / image.width))),
+            Image.Resampling.LANCZOS,
+        )
+    output: BytesIO = BytesIO()
+    image.save(output, format=image_format, **FORMAT_OPTIONS[image_format])
+    return output.getvalue()
+
+
+# All the variants of an image, by variant name
+def create_variants(image_name: str, image_data: bytes) -> Dict[str, bytes]:
+    if not has_variants(image_name):
+        return {}
+    width: int = get_image_width(image_data)
+    sizes: List[str] = [
+        size for size in VARIANT_WIDTHS if get_stored_size(size, width) == size
+    ]
+    variants: Dict[str, bytes] = {}
+    for size in sizes + [FULL_SIZE]:
+        for image_format in VARIANT_FORMATS:
+            # The full size original is already stored as PNG
+            if size == FULL_SIZE and image_format == "png":
+                continue
+            variant_name: str = get_variant_name(image_name, size, image_format)
+            # One format failing doesn't lose the others
+            try:
+                variants[variant_name] = create_variant(image_data, size, image_format)
+            except Exception as e:
+                logger.error(f"Error creating image variant {variant_name} ({e})")
+    return variants
@@ -1,27 +1,73 @@
 import asyncio
 import json
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from os import environ
+from typing import Any, Dict, List, Optional, Tuple
 from nats.aio.client import Client as NATS
 from nats.aio.errors import ErrConnectionClosed, ErrTimeout, ErrNoServers
+from nats.errors import TimeoutError as NATSTimeoutError
+from nats.js.api import ConsumerConfig, RetentionPolicy, StorageType
 from logger import set_up_logger, exit
 
 logger = set_up_logger("Message Broker Helper")
 
+# Publish buffer for the current task, if it is inside a buffered publishing block.
+# A context variable keeps concurrent event handlers from flushing each other's messages.
+current_publish_buffer: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "current_publish_buffer", default=None
+)
+
 
 class MessageBrokerHelper:
     """Simplify exchanging messages with other back-end services."""
 
-    def __init__(self, host: str, port: int, queue_map: dict):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        queue_map: dict,
+        buffer_callback_publishes: bool = False,
+        namespace: str = "",
+    ):
         """Initialise the MessageBrokerHelper."""
         self.host = host or "localhost"
         self.port = port or 4222
-        self.queue_map = queue_map
+        self.queue_map = {}
         self.callback_functions = {}
+        # Optional prefix for all subjects, e.g. to talk to one of several worlds hosted together
+        self.namespace: str = namespace
+
+        # If set, messages published while handling a received message are flushed once at the end
+        self.buffer_callback_publishes: bool = buffer_callback_publishes
+        # Caps on how much / how long buffered messages can wait before a flush is forced
+        self.max_buffered_messages: int = int(
+            environ.get("MBH_MAX_BUFFERED_MESSAGES", 100)
+        )
+        self.max_buffer_secs: float = float(environ.get("MBH_MAX_BUFFER_SECS", 0.1))
+        # Flushes started when buffered messages reach the time cap
+        self.flush_tasks: set = set()
 
         self.nc = NATS()
         self.publisher_queues = {}
+        # Optional NATS queue group per subscribed queue, so replicas share the messages
+        self.queue_groups: Dict[str, str] = {}
+        # Subscriptions by queue name, so they can be ended
+        self.subscriptions: Dict[str, Any] = {}
         self.am_consumer = False
         self.startup_messages = []
+        # Queues whose messages wait in a JetStream stream until there is capacity to handle them
+        self.pull_queues: Dict[str, Dict[str, Any]] = {}
+        self.pull_tasks: set = set()
+        # How long each fetch from a stream waits for a message
+        self.pull_timeout: float = float(environ.get("MBH_PULL_TIMEOUT_SECS", 5))
 
+        self.add_queues(queue_map)
+
+    def add_queues(self, queue_map: dict) -> None:
+        """Register more queues, before NATS is set up."""
+        self.queue_map.update(queue_map)
         for queue_name, queue_properties in queue_map.items():
             if queue_properties.get("mode", "") in ("publish", "both"):
                 self.publisher_queues[queue_name] = True
@@ -35,6 +81,22 @@ class MessageBrokerHelper:
                 self.callback_functions[queue_name] = queue_properties.get(
                     "callback", None
                 )
+                if queue_properties.get("queue_group"):
+                    self.queue_groups[queue_name] = queue_properties["queue_group"]
+            if queue_properties.get("mode", "") == "pull":
+                self.pull_queues[queue_name] = queue_properties
+
+    def get_subject(self, queue_name: str) -> str:
+        """Return the subject a queue is sent on, within the namespace if there is one."""
+        if self.namespace:
+            return f"{self.namespace}.{queue_name}"
+        return queue_name
+
+    def get_queue_name(self, subject: str) -> str:
+        """Return the queue name for a received subject, without the namespace."""
+        if self.namespace and subject.startswith(f"{self.namespace}."):
+            return subject[len(self.namespace) + 1 :]
+        return subject
 
     async def set_up_nats(self):
         try:
@@ -47,6 +109,8 @@ class MessageBrokerHelper:
 
             if self.am_consumer:
                 await self.start_consuming()
+            if self.pull_queues:
+                await self.start_pulling()
 
         except ErrNoServers as e:
             logger.error(f"Could not connect to NATS server: {e}")
@@ -54,8 +118,88 @@ class MessageBrokerHelper:
     async def start_consuming(self):
         if self.am_consumer:
             for queue_name in self.callback_functions.keys():
-                await self.nc.subscribe(queue_name, cb=self.global_callback)
-                logger.info(f"Subscribed to queue {queue_name}")
+                queue_group: str = self.queue_groups.get(queue_name, "")
+                self.subscriptions[queue_name] = await self.nc.subscribe(
+                    self.get_subject(queue_name),
+                    queue=queue_group,
+                    cb=self.global_callback,
+                )
+                logger.info(
+                    f"Subscribed to queue {queue_name}"
+                    + (f" in queue group {queue_group}" if queue_group else "")
+                )
+
+    async def start_pulling(self):
+        """Start fetching the messages of each pull queue from its stream, creating the stream if necessary.
+
+        Each queue's stream keeps its messages until a consumer has handled them, and consumers sharing
+        the same durable name share the messages, so replicas only take what they have capacity for.
+        """
+        js = self.nc.jetstream()
+        for queue_name, queue_properties in self.pull_queues.items():
+            subject: str = self.get_subject(queue_name)
+            stream: str = queue_properties.get("stream", subject.replace(".", "_"))
+            await js.add_stream(
+                name=stream,
+                subjects=[subject],
+                retention=RetentionPolicy.WORK_QUEUE,
+                storage=StorageType.MEMORY,
+            )
+            subscription = await js.pull_subscribe(
+                subject,
+                durable=queue_properties.get("durable", stream),
+                stream=stream,
+                # Unacknowledged messages, e.g. of a consumer that stopped, are delivered again after this
+                config=ConsumerConfig(ack_wait=queue_properties.get("ack_wait", 300)),
+            )
+            task: asyncio.Task = asyncio.create_task(
+                self.pull_messages(
+                    subscription, queue_properties.get("max_in_flight", 1)
+                )
+            )
+            self.pull_tasks.add(task)
+            task.add_done_callback(self.pull_tasks.discard)
+            logger.info(f"Pulling queue {queue_name} from stream {stream}")
+
+    async def pull_messages(self, subscription, max_in_flight: int) -> None:
+        """Fetch and handle messages, at most max_in_flight at once. The rest stay in the stream."""
+        in_flight: asyncio.Semaphore = asyncio.Semaphore(max_in_flight)
+        handler_tasks: set = set()
+        while True:
+            await in_flight.acquire()
+            try:
+                msgs = await subscription.fetch(1, timeout=self.pull_timeout)
+            except NATSTimeoutError:
+                in_flight.release()
+                continue
+            except ErrConnectionClosed:
+                logger.info("Connection closed, no longer pulling messages")
+                return
+            except Exception as e:
+                logger.error(f"Error fetching messages, will try again: {e}")
+                in_flight.release()
+                await asyncio.sleep(self.pull_timeout)
+                continue
+            if not msgs:
+                in_flight.release()
+            for msg in msgs:
+                task: asyncio.Task = asyncio.create_task(
+                    self.handle_pulled_message(msg, in_flight)
+                )
+                handler_tasks.add(task)
+                task.add_done_callback(handler_tasks.discard)
+
+    async def handle_pulled_message(self, msg, in_flight: asyncio.Semaphore) -> None:
+        """Handle a fetched message, then acknowledge it so it is removed from the stream."""
+        try:
+            await self.global_callback(msg)
+            await msg.ack()
+        except Exception as e:
+            logger.error(f"Error handling message with subject {msg.subject}: {e}")
+            # Not worth delivering again
+            await msg.term()
+        finally:
+            in_flight.release()
 
     async def subscribe(self, queue_name: str, callback):
         """Subscribe to a queue and set the callback function."""
@@ -69,11 +213,18 @@ class MessageBrokerHelper:
             return
 
         self.callback_functions[queue_name] = callback
-        await self.nc.subscribe(queue_name, cb=self.global_callback)
+        self.subscriptions[queue_name] = await self.nc.subscribe(
+            self.get_subject(queue_name), cb=self.global_callback
+        )
         logger.info(f"Subscribed to queue {queue_name}")
 
     async def unsubscribe(self, queue_name: str):
-        await self.nc.unsubscribe(queue_name)
+        """End the subscription to a queue."""
+        subscription = self.subscriptions.pop(queue_name, None)
+        if not subscription:
+            logger.warning(f"Not subscribed to queue {queue_name}")
+            return
+        await subscription.unsubscribe()
         logger.info(f"Unsubscribed from queue {queue_name}")
 
     async def global_callback(self, msg):
@@ -81,7 +232,10 @@ class MessageBrokerHelper:
         body = msg.data.decode()
         logger.info(f"Global callback invoked for message with subject: {msg.subject}")
         logger.info(f"Message body: <{body}>")
-        callback = self.callback_functions.get(msg.subject, None)
+        queue_name: str = self.get_queue_name(msg.subject)
+        callback = self.callback_functions.get(queue_name) or self.pull_queues.get(
+            queue_name, {}
+        ).get("callback")
         # Check callback is a function
         if not callback:
             exit(logger, f"No callback function for queue {msg.subject}")
@@ -92,29 +246,79 @@ class MessageBrokerHelper:
         logger.info(f"Invoking callback function: {callback.__name__}...")
 
         # Convert body to dictionary if possible
+        callback_data: Any
         try:
             body_dict = json.loads(body)
             if isinstance(body_dict, dict):
-                await callback(body_dict)
+                callback_data = body_dict
             else:
                 logger.warning(
                     f"Message not a dictionary: {body}, passing to callback function as string"
                 )
-                await callback(body)
+                callback_data = body
         except json.JSONDecodeError:
             if ("{" in body and "}" in body) or ("[" in body and "]" in body):
                 logger.warning(f"JSONDecodeError: {body}")
             # If message is not JSON, this is normal (simple message), pass it to the callback function as a string
-            await callback(body)
+            callback_data = body
 
-    async def publish(self, queue: str, message: any, user_id: str = None):
-        """Publish a message to a queue."""
+        if self.buffer_callback_publishes:
+            async with self.buffered_publishing():
+                await callback(callback_data)
+        else:
+            await callback(callback_data)
+
+    @asynccontextmanager
+    async def buffered_publishing(self):
+        """Defer flushing of messages published within this block until it ends."""
+        if current_publish_buffer.get() is not None:
+            # Already buffering - the outermost block does the flush
+            yield
+            return
+        token = current_publish_buffer.set(
+            {"count": 0, "first_time": 0.0, "timer": None}
+        )
+        try:
+            yield
+        finally:
+            publish_buffer: Dict[str, Any] = current_publish_buffer.get()
+            current_publish_buffer.reset(token)
+            if publish_buffer["count"]:
+                await self.flush(publish_buffer)
+
+    async def flush(self, publish_buffer: Optional[Dict[str, Any]] = None) -> None:
+        """Flush published messages to the NATS server (one round trip)."""
+        if publish_buffer:
+            if publish_buffer["timer"]:
+                publish_buffer["timer"].cancel()
+                publish_buffer["timer"] = None
+            logger.debug(f"Flushed {publish_buffer['count']} buffered messages")
+            publish_buffer["count"] = 0
+            publish_buffer["first_time"] = 0.0
+        if self.nc.is_connected:
+            await self.nc.flush()
+
+    def flush_when_due(self, publish_buffer: Dict[str, Any]) -> None:
+        """Flush buffered messages that have waited for the time cap, even if nothing more is published."""
+        publish_buffer["timer"] = None
+        if publish_buffer["count"]:
+            # Keep a reference to the task until it is done, so it is not garbage collected
+            task: asyncio.Task = asyncio.get_running_loop().create_task(
+                self.flush(publish_buffer)
+            )
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+    def prepare_message(
+        self, queue: str, message: Any, user_id: Optional[str] = None
+    ) -> Optional[Tuple[str, str]]:
+        """Validate a message and resolve the subject it is to be sent on."""
         if not message:
             exit(logger, "Message is empty")
 
         if queue not in self.publisher_queues:
             logger.error(f"Queue {queue} not registered as a publisher")
-            return
+            return None
 
         if isinstance(message, dict):
             message = json.dumps(message)
@@ -128,12 +332,95 @@ class MessageBrokerHelper:
             # Add user ID to queue
             queue = f"{queue}.{user_id.lower()}"
 
+        return self.get_subject(queue), message
+
+    async def publish(self, queue: str, message: any, user_id: str = None):
+        """Publish a message to a queue."""
+        prepared_message: Optional[Tuple[str, str]] = self.prepare_message(
+            queue, message, user_id
+        )
+        if not prepared_message:
+            return
+        queue, message = prepared_message
+
         await self.nc.publish(queue, message.encode())
-        await self.nc.flush()
         logger.info(f"Sent message to queue {queue}: {message}")
 
+        publish_buffer: Optional[Dict[str, Any]] = current_publish_buffer.get()
+        if publish_buffer is None:
+            await self.nc.flush()
+            return
+
+        # Buffered: only flush once the size or time cap is reached
+        if not publish_buffer["count"]:
+            publish_buffer["first_time"] = time.monotonic()
+            publish_buffer["timer"] = asyncio.get_running_loop().call_later(
+                self.max_buffer_secs, self.flush_when_due, publish_buffer
+            )
+        publish_buffer["count"] += 1
+        if (
+            publish_buffer["count"] >= self.max_buffered_messages
+            or time.monotonic() - publish_buffer["first_time"] >= self.max_buffer_secs
+        ):
+            await self.flush(publish_buffer)
+
+    async def publish_many(
+        self, messages: List[Tuple[str, Any, Optional[str]]]
+    ) -> None:
+        """Publish a batch of (queue, message, user_id) messages with a single flush."""
+        async with self.buffered_publishing():
+            for queue, message, user_id in messages:
+                await self.publish(queue, message, user_id)
+
     def close(self):
         """Close the NATS connection."""
         if self.nc.is_connected:
             asyncio.run(self.nc.close())
             logger.info("Closed NATS connection")
+
+
+class MessageBrokerNamespace:
+    """Exchange messages in one namespace of a MessageBrokerHelper shared by several (e.g. worlds hosted together).
+
+    Queues registered through the namespace are sent on namespaced subjects. Any others, such as requests to
+    back-end services shared by all the namespaces, are sent on the queue's own subject.
+    """
+
+    def __init__(
+        self, mbh: MessageBrokerHelper, namespace: str, queue_map: dict
+    ) -> None:
+        """Register the namespace's queues with the shared MessageBrokerHelper."""
+        self.mbh = mbh
+        self.namespace = namespace
+        self.queue_names = set(queue_map.keys())
+        mbh.add_queues(
+            {
+                self.get_subject(queue_name): queue_properties
+                for queue_name, queue_properties in queue_map.items()
+            }
+        )
+
+    def get_subject(self, queue_name: str) -> str:
+        """Return the subject a queue is sent on."""
+        if queue_name.split(".")[0] in self.queue_names:
+            return f"{self.namespace}.{queue_name}"
+        return queue_name
+
+    async def publish(self, queue: str, message: any, user_id: str = None):
+        """Publish a message to a queue."""
+        await self.mbh.publish(self.get_subject(queue), message, user_id)
+
+    async def publish_many(
+        self, messages: List[Tuple[str, Any, Optional[str]]]
+    ) -> None:
+        """Publish a batch of (queue, message, user_id) messages with a single flush."""
+        await self.mbh.publish_many(
+            [
+                (self.get_subject(queue), message, user_id)
+                for queue, message, user_id in messages
+            ]
+        )
+
+    def buffered_publishing(self):
+        """Defer flushing of messages published within this block until it ends."""
+        return self.mbh.buffered_publishing()
@@ -23,6 +23,7 @@ def do_model_request(
     max_tokens: int,
     temperature: float,
     messages: List[Dict[str, str]],
+    timeout: Optional[float] = None,
 ) -> Tuple[str, int, int]:
 
     # Set response format according to the last message containing JSON or not
@@ -36,6 +37,8 @@ def do_model_request(
         max_tokens=max_tokens,
         temperature=temperature,
         response_format=response_format,
+        # Without one, the client's default timeout applies
+        **({"timeout": timeout} if timeout else {}),
     )
     # Extract response content
     for choice in response.choices:
@@ -0,0 +1,175 @@
+from storagemanager import StorageManager
+from utils import set_up_logger
+from typing import Optional, Dict, List, Any, Tuple
+from os import path, makedirs
+import json
+import sqlite3
+import threading
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Local storage in a single SQLite database file, e.g. for offline running, load testing and CI.
+# Objects are stored the same way as in Azure (partition key = world and type, row key = name),
+# but as JSON documents, so lists and dicts need no converting to strings.
+class SQLiteStorageManager(StorageManager):
+
+    # Constructor
+    def __init__(
+        self, database_path: str = "corvid.db", image_only: bool = False
+    ) -> None:
+        # Call parent constructor
+        super().__init__(image_only)
+        if path.dirname(database_path):
+            makedirs(path.dirname(database_path), exist_ok=True)
+        logger.info(f"Using SQLite database {database_path}")
+        # One connection, shared between threads (e.g. world loading) one statement at a time.
+        # The same few statements are used throughout, so its statement cache prepares each only once.
+        self.connection: sqlite3.Connection = sqlite3.connect(
+            database_path, check_same_thread=False
+        )
+        self.lock: threading.Lock = threading.Lock()
+        with self.lock, self.connection:
+            # Write-ahead logging lets readers carry on while a write is in progress,
+            # and only needs a full sync at checkpoints
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS objects (
+                    partition_key TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    world TEXT NOT NULL,
+                    object_type TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    location TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (partition_key, row_key)
+                )""")
+            self.connection.execute(
+                """CREATE INDEX IF NOT EXISTS objects_world_type_name_location
+                ON objects (world, object_type, name, location)"""
+            )
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS images (
+                    blob_name TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                )""")
+
+    # Return the row for an object, in the column order of the objects table
+    def get_row(
+        self, world_name: str, object: object
+    ) -> Optional[Tuple[str, str, str, str, str, Optional[str], str]]:
+        entity: Optional[Dict[str, Any]] = self.get_storage_entity(world_name, object)
+        # Don't store objects named "system" - they are transient
+        if not entity:
+            return None
+        return (
+            entity["PartitionKey"],
+            entity["RowKey"],
+            world_name,
+            type(object).__name__,
+            entity["name"],
+            entity.get("location"),
+            json.dumps(entity),
+        )
+
+    # Store all Python objects, received as actual objects.
+    # Rows are small and local, so a changed object is always written whole.
+    def store_world_object(self, world_name: str, object: object) -> bool:
+        if self.get_changed_fields(object) == set():
+            logger.debug(f"No changes to store for {object.name}")
+            return True
+        row: Optional[Tuple] = self.get_row(world_name, object)
+        if not row:
+            return False
+        logger.debug(f"Storing {row[4]}")
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)", row
+            )
+        # Only once committed, so the changes are not forgotten if storing fails
+        self.mark_stored(object)
+        return True
+
+    # Store many objects in one transaction
+    def store_world_objects(self, world_name: str, objects: List[object]) -> None:
+        rows: List[Tuple] = [
+            row for row in (self.get_row(world_name, o) for o in objects) if row
+        ]
+        logger.info(f"Storing {len(rows)} objects")
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        for o in objects:
+            self.mark_stored(o)
+
+    # Delete a world object
+    def delete_world_object(
+        self, world_name: str, object_type: str, name: str, location: str = ""
+    ) -> bool:
+        query: str = "DELETE FROM objects WHERE partition_key = ? AND row_key = ?"
+        parameters: List[str] = [world_name + "__" + object_type, name]
+        if location:
+            query += " AND location = ?"
+            parameters.append(location)
+        with self.lock, self.connection:
+            deleted_count: int = self.connection.execute(query, parameters).rowcount
+        if deleted_count:
+            logger.info(f"Deleted {object_type} {name}")
+        return deleted_count > 0
+
+    # Delete all objects in a world
+    def delete_world_from_db(self, world_name: str) -> None:
+        logger.info(f"Deleting all objects in world {world_name}")
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM objects WHERE world = ?", (world_name,)
+            )
+
+    # Returns all instances of a type of object, as a dict
+    def get_world_objects(
+        self, world_name: str, object_type: str, rowkey_value: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        query: str = "SELECT data FROM objects WHERE partition_key = ?"
+        parameters: List[str] = [world_name + "__" + object_type]
+        if rowkey_value:
+            query += " AND row_key = ?"
+            parameters.append(rowkey_value)
+        with self.lock:
+            rows: List[Tuple[str]] = self.connection.execute(
+                query + " ORDER BY row_key", parameters
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def store_image_in_cloud(
+        self, world_name: str, image_name: str, image_data: bytes
+    ) -> bool:
+        blob_name: str = self.get_blob_name(world_name, image_name)
+        logger.info(f"Storing image '{blob_name}'")
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?)", (blob_name, image_data)
+            )
+        return True
+
+    def get_image_blob(self, blob_name: str) -> Optional[bytes]:
+        with self.lock:
+            row: Optional[Tuple[bytes]] = self.connection.execute(
+                "SELECT data FROM images WHERE blob_name = ?", (blob_name,)
+            ).fetchone()
+        if not row:
+            logger.error(f"Image {blob_name} not found")
+            return None
+        return row[0]
+
+    def list_image_blobs(self, prefix: str) -> List[str]:
+        with self.lock:
+            rows: List[Tuple[str]] = self.connection.execute(
+                "SELECT blob_name FROM images WHERE substr(blob_name, 1, ?) = ? ORDER BY blob_name",
+                (len(prefix), prefix),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,29 @@
+from storagemanager import StorageManager
+from utils import set_up_logger, exit
+from os import environ
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Create the storage manager for the backend chosen by STORAGE_BACKEND (azure or sqlite)
+def create_storage_manager(
+    image_only: bool = False, write_behind: bool = False, snapshot_folder: str = ""
+) -> StorageManager:
+    backend: str = environ.get("STORAGE_BACKEND", "azure").lower()
+    if backend == "sqlite":
+        # Imported here so neither backend's dependencies are needed to use the other
+        from sqlitestoragemanager import SQLiteStorageManager
+
+        return SQLiteStorageManager(
+            environ.get("STORAGE_SQLITE_PATH", "corvid.db"), image_only=image_only
+        )
+    if backend == "azure":
+        from azurestoragemanager import AzureStorageManager
+
+        return AzureStorageManager(
+            image_only=image_only,
+            write_behind=write_behind,
+            snapshot_folder=snapshot_folder,
+        )
+    exit(logger, f"Unknown storage backend: {backend}")
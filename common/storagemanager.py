@@ -1,4 +1,5 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Union
+from concurrent.futures import Future
 from utils import get_critical_env_variable, set_up_logger, exit
 import json
 from os import path
@@ -56,6 +57,11 @@ class StorageManager:
         logger.info(f"Abstract method - does not return image: {blob_name}")
         return None
 
+    # Names of the stored images starting with a prefix, e.g. all the images of a world
+    def list_image_blobs(self, prefix: str) -> List[str]:
+        logger.info(f"Abstract method - does not list images: {prefix}")
+        return []
+
     def get_default_world_data(
         self, world_name: str, object_type: str
     ) -> List[Dict[str, Any]]:
@@ -107,13 +113,76 @@ class StorageManager:
         for object in self.get_world_objects(world_name, object_type, rowkey_value):
             return object
 
+    # Fields of an object changed since it was last stored, or None if it has to be stored in full
+    def get_changed_fields(self, object: object) -> Optional[Set[str]]:
+        return getattr(object, "changed_fields", None)
+
+    # Once an object is stored, only later changes to it need storing
+    def mark_stored(self, object: object) -> None:
+        if hasattr(object, "mark_stored"):
+            object.mark_stored()
+
+    # Convert an object to the form in which it is stored, or None if it is not to be stored.
+    # If fields are given, the entity only has those, e.g. to patch the stored object with its changes.
+    def get_storage_entity(
+        self, world_name: str, object: object, fields: Optional[Set[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        entity: Dict[str, Any]
+        if fields is None:
+            # World objects convert themselves, anything else is taken as it is
+            entity = (
+                object.to_dict() if hasattr(object, "to_dict") else vars(object).copy()
+            )
+        else:
+            entity = {field: getattr(object, field) for field in fields}
+        entity["PartitionKey"] = world_name + "__" + type(object).__name__
+
+        # Don't store objects named "system" - they are transient
+        if object.name == "system":
+            return None
+
+        entity["RowKey"] = object.name
+        if hasattr(object, "id"):
+            entity["RowKey"] += "__" + object.id
+
+        # TODO #85 Don't hard-code attributes to remove on storage
+        # Override fields that contain object values lists etc
+
+        # 1. World - use the world name just for supportability
+        entity["world"] = world_name
+        # 2. Inventory - reconstituted from location
+        if "inventory" in entity:
+            del entity["inventory"]
+        # 3. Input history - not needed, we want to start fresh each session
+        if "input_history" in entity:
+            del entity["input_history"]
+        # 4. Changed fields - only used to decide what to store
+        if "changed_fields" in entity:
+            del entity["changed_fields"]
+        return entity
+
+    # Start getting all objects of several types, returning a future for each type's objects.
+    # Subclasses can fetch them concurrently, this superclass just gets them one after another.
+    def start_getting_world_objects(
+        self, world_name: str, object_types: List[str]
+    ) -> Dict[str, Future]:
+        futures: Dict[str, Future] = {}
+        for object_type in object_types:
+            futures[object_type] = Future()
+            futures[object_type].set_result(
+                self.get_world_objects(world_name, object_type)
+            )
+        return futures
+
     def store_world_object(self, world_name: str, object: object) -> None:
         # Unit testing will use this superclass method hence not abstract
-        logger.info(
-            f"NOT storing python object in world {world_name}: {object.__dict__}"
-        )
+        logger.info(f"NOT storing python object in world {world_name}: {object.name}")
         return True
 
+    # Flush any outstanding writes before shutdown (nothing buffered in this superclass)
+    def close(self) -> None:
+        pass
+
     def delete_world_object(
         self, world_name: str, object_type: str, name: str, location: str
     ) -> bool:
@@ -1,4 +1,5 @@
 import unittest
+import asyncio
 from unittest.mock import patch
 from aimanager import AIManager
 
@@ -49,6 +50,58 @@ class TestAIManagerOpenAI(TestAIManager):
         self.assertEqual(self.ai_manager.model_name, self.test_model_name)
 
 
+class TestAIManagerAsyncRequest(TestAIManager):
+
+    @patch("openai_client.get_model_client")
+    def setUp(self, MockModelClient) -> None:
+        self.test_model_name = "gpt-mock"
+        super().setUp()
+        # Don't actually wait between retries
+        self.ai_manager.min_retry_wait = 0
+
+    @patch("openai_client.do_model_request")
+    def test_submit_request_async_retries(self, mock_do_model_request):
+        mock_do_model_request.side_effect = [
+            Exception("rate_limit_exceeded"),
+            ("Hello there", 10, 2),
+        ]
+        response = asyncio.run(
+            self.ai_manager.submit_request_async("Hello", history=False)
+        )
+        self.assertEqual(response, "Hello there")
+        self.assertEqual(mock_do_model_request.call_count, 2)
+
+    @patch("openai_client.do_model_request")
+    def test_submit_request_gives_up_on_other_errors(self, mock_do_model_request):
+        mock_do_model_request.side_effect = Exception("invalid_api_key")
+        self.assertEqual(self.ai_manager.submit_request("Hello", history=False), "")
+        self.assertEqual(mock_do_model_request.call_count, 1)
+
+    @patch("openai_client.do_model_request")
+    def test_submit_request_timeout(self, mock_do_model_request):
+        mock_do_model_request.side_effect = [
+            Exception("Request timed out."),
+            ("Hello there", 10, 2),
+        ]
+        response = asyncio.run(
+            self.ai_manager.submit_request_async("Hello", history=False, timeout=5)
+        )
+        self.assertEqual(response, "Hello there")
+        # The client times out each attempt itself, so attempts never overlap
+        self.assertEqual(mock_do_model_request.call_args.kwargs["timeout"], 5)
+        self.assertEqual(mock_do_model_request.call_count, 2)
+
+    @patch("openai_client.do_model_request")
+    def test_submit_request_in_event_loop(self, mock_do_model_request):
+        mock_do_model_request.return_value = ("Hello there", 10, 2)
+
+        # The blocking call also works from async code
+        async def submit_request():
+            return self.ai_manager.submit_request("Hello", history=False)
+
+        self.assertEqual(asyncio.run(submit_request()), "Hello there")
+
+
 class TestAIManagerStabilityAI(TestAIManager):
 
     @patch("stability_client.get_model_client")
@@ -59,6 +112,17 @@ class TestAIManagerStabilityAI(TestAIManager):
     def test_stabilityai(self):
         self.assertEqual(self.ai_manager.model_name, self.test_model_name)
 
+    @patch("stability_client.do_image_request")
+    def test_create_image(self, mock_do_image_request):
+        # Each new image of a room gets a new name, so cached copies of the old one are never stale
+        mock_do_image_request.return_value = b"first image"
+        first_name, image_data = self.ai_manager.create_image("Joe's Cafe", "A cafe")
+        self.assertEqual(image_data, b"first image")
+        self.assertRegex(first_name, r"^joes_cafe-[0-9a-f]{12}\.png$")
+        mock_do_image_request.return_value = b"second image"
+        second_name, _ = self.ai_manager.create_image("Joe's Cafe", "A cafe")
+        self.assertNotEqual(first_name, second_name)
+
 
 class TestAIManagerGroq(TestAIManager):
 
@@ -0,0 +1,358 @@
+import unittest
+import tempfile
+from os import environ
+from unittest.mock import MagicMock
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.data.tables import UpdateMode
+from azurestoragemanager import AzureStorageManager
+
+
+class TestAzureStorageManager(unittest.TestCase):
+    def setUp(self) -> None:
+        environ.setdefault("AZURE_STORAGE_ACCOUNT_NAME", "unittest")
+        environ.setdefault("AZURE_STORAGE_ACCOUNT_KEY", "dW5pdHRlc3Q=")
+        self.storage_manager = AzureStorageManager()
+        # Replace the table client so no storage account is needed
+        self.objects_client = MagicMock()
+        self.storage_manager.table_service_client = MagicMock()
+        self.storage_manager.table_service_client.create_table_if_not_exists.return_value = (
+            self.objects_client
+        )
+
+    def test_start_getting_world_objects(self):
+        def query_entities(query_filter, parameters, results_per_page):
+            partition_key = parameters["pk"]
+            pages = [
+                [
+                    {
+                        "PartitionKey": partition_key,
+                        "name": f"{partition_key} {page}.{row}",
+                        "exits": '{"north": "Road"}',
+                    }
+                    for row in range(2)
+                ]
+                for page in range(3)
+            ]
+            result = MagicMock()
+            result.by_page.return_value = iter(pages)
+            return result
+
+        self.objects_client.query_entities.side_effect = query_entities
+        futures = self.storage_manager.start_getting_world_objects(
+            "unittest", ["Room", "WorldItem"]
+        )
+        rooms = futures["Room"].result()
+        self.assertEqual(len(rooms), 6)
+        self.assertEqual(rooms[0]["name"], "unittest__Room 0.0")
+        # Complex fields are converted back from strings
+        self.assertEqual(rooms[0]["exits"], {"north": "Road"})
+        self.assertEqual(len(futures["WorldItem"].result()), 6)
+
+    def test_get_world_object(self):
+        self.objects_client.get_entity.return_value = {
+            "PartitionKey": "unittest__Person",
+            "RowKey": "Jay",
+            "name": "Jay",
+            "location": "Road",
+        }
+        self.assertEqual(
+            self.storage_manager.get_world_object("unittest", "Person", "Jay")[
+                "location"
+            ],
+            "Road",
+        )
+        self.objects_client.get_entity.assert_called_once_with(
+            partition_key="unittest__Person", row_key="Jay"
+        )
+        self.objects_client.query_entities.assert_not_called()
+
+        self.objects_client.get_entity.side_effect = ResourceNotFoundError()
+        self.assertIsNone(
+            self.storage_manager.get_world_object("unittest", "Person", "Nobody")
+        )
+
+    def test_get_world_object_queued(self):
+        # A write not yet flushed is returned without going to the table
+        self.storage_manager.pending_writes[("unittest__Person", "Jay")] = {
+            "PartitionKey": "unittest__Person",
+            "RowKey": "Jay",
+            "name": "Jay",
+            "location": "Kitchen",
+        }
+        self.assertEqual(
+            self.storage_manager.get_world_object("unittest", "Person", "Jay")[
+                "location"
+            ],
+            "Kitchen",
+        )
+        self.objects_client.get_entity.assert_not_called()
+
+    def test_table_created_once(self):
+        class Room:
+            def __init__(self, name):
+                self.name = name
+                self.world = None
+
+        for name in ("Road", "Kitchen", "Garden"):
+            self.storage_manager.store_world_object("unittest", Room(name))
+        self.objects_client.get_entity.return_value = {
+            "PartitionKey": "unittest__Room",
+            "name": "Road",
+        }
+        self.storage_manager.get_world_object("unittest", "Room", "Road")
+        self.storage_manager.table_service_client.create_table_if_not_exists.assert_called_once_with(
+            "PythonObjects"
+        )
+        self.assertEqual(self.objects_client.upsert_entity.call_count, 3)
+        self.assertEqual(self.storage_manager.operation_counts["store_world_object"], 3)
+        self.assertEqual(self.storage_manager.round_trip_counts["create_table"], 1)
+        self.assertIn(
+            "store_world_object: 3 calls, 3 round trips",
+            self.storage_manager.get_stats(),
+        )
+
+    def test_store_changes_only(self):
+        class Room:
+            def __init__(self, name):
+                self.name = name
+                self.exits = {"north": "Kitchen"}
+                self.description = "A road."
+                self.changed_fields = None
+
+            def mark_stored(self):
+                self.changed_fields = set()
+
+        room = Room("Road")
+        self.storage_manager.store_world_object("unittest", room)
+        self.assertEqual(
+            self.objects_client.upsert_entity.call_args.kwargs["mode"],
+            UpdateMode.REPLACE,
+        )
+        # Nothing has changed since, so nothing is written
+        self.storage_manager.store_world_object("unittest", room)
+        self.assertEqual(self.objects_client.upsert_entity.call_count, 1)
+
+        room.exits["south"] = "Garden"
+        room.changed_fields.add("exits")
+        self.storage_manager.store_world_object("unittest", room)
+        call = self.objects_client.upsert_entity.call_args.kwargs
+        self.assertEqual(call["mode"], UpdateMode.MERGE)
+        self.assertEqual(
+            call["entity"],
+            {
+                "PartitionKey": "unittest__Room",
+                "RowKey": "Road",
+                "world": "unittest",
+                "exits": '{"north": "Kitchen", "south": "Garden"}',
+            },
+        )
+
+        # If storing fails, the changes are kept to be stored next time
+        room.description = "A wet road."
+        room.changed_fields.add("description")
+        self.objects_client.upsert_entity.side_effect = HttpResponseError("Busy")
+        with self.assertRaises(HttpResponseError):
+            self.storage_manager.store_world_object("unittest", room)
+        self.assertEqual(room.changed_fields, {"description"})
+
+    def test_write_behind_merges(self):
+        self.storage_manager.write_behind = True
+        entity = {"PartitionKey": "unittest__Room", "RowKey": "Road", "name": "Road"}
+        # Changes to an object queued in full are folded into it
+        self.storage_manager.queue_write(entity, merge=False)
+        self.storage_manager.queue_write(
+            {"PartitionKey": "unittest__Room", "RowKey": "Road", "image": "road.png"},
+            merge=True,
+        )
+        # Changes alone are merged when written
+        self.storage_manager.queue_write(
+            {"PartitionKey": "unittest__Room", "RowKey": "Kitchen", "image": "k.png"},
+            merge=True,
+        )
+        self.storage_manager.flush_pending_writes()
+        operations = self.objects_client.submit_transaction.call_args.args[0]
+        self.assertEqual(
+            [(op[1]["RowKey"], op[2]["mode"]) for op in operations],
+            [("Road", UpdateMode.REPLACE), ("Kitchen", UpdateMode.MERGE)],
+        )
+        self.assertEqual(operations[0][1]["image"], "road.png")
+
+    def test_write_behind_failed_batch(self):
+        for name in ("Road", "Bad", "Busy"):
+            self.storage_manager.queue_write(
+                {"PartitionKey": "unittest__Room", "RowKey": name, "name": name},
+                merge=False,
+            )
+        self.objects_client.submit_transaction.side_effect = HttpResponseError(
+            "Batch failed"
+        )
+
+        def upsert_entity(mode, entity):
+            if entity["RowKey"] == "Bad":
+                error = HttpResponseError("Invalid property")
+                error.status_code = 400
+                raise error
+            if entity["RowKey"] == "Busy":
+                error = HttpResponseError("Server busy")
+                error.status_code = 503
+                raise error
+
+        self.objects_client.upsert_entity.side_effect = upsert_entity
+        self.storage_manager.flush_pending_writes()
+        # Each entity of the failed batch is tried on its own
+        self.assertEqual(
+            [
+                call.kwargs["entity"]["RowKey"]
+                for call in self.objects_client.upsert_entity.call_args_list
+            ],
+            ["Road", "Bad", "Busy"],
+        )
+        # The rejected one is dropped, and only the one that may yet succeed is retried
+        self.assertEqual(
+            list(self.storage_manager.pending_writes), [("unittest__Room", "Busy")]
+        )
+
+    def test_write_behind_delete(self):
+        self.storage_manager.write_behind = True
+        self.storage_manager.queue_write(
+            {"PartitionKey": "unittest__WorldItem", "RowKey": "Lamp", "name": "Lamp"},
+            merge=False,
+        )
+        # The delete is queued, replacing the write, without waiting for the table
+        self.assertTrue(
+            self.storage_manager.delete_world_object(
+                "unittest", "WorldItem", "Lamp", location="Road"
+            )
+        )
+        self.objects_client.query_entities.assert_not_called()
+        self.objects_client.delete_entity.assert_not_called()
+        self.assertEqual(self.storage_manager.pending_writes, {})
+        # Stored again after the delete
+        self.storage_manager.queue_write(
+            {"PartitionKey": "unittest__WorldItem", "RowKey": "Lamp", "name": "Lamp"},
+            merge=False,
+        )
+        self.objects_client.query_entities.return_value = iter(
+            [{"PartitionKey": "unittest__WorldItem", "RowKey": "Lamp"}]
+        )
+        self.storage_manager.flush_pending_writes()
+        # The delete reaches the table before the later write
+        self.assertEqual(
+            [
+                call[0]
+                for call in self.objects_client.mock_calls
+                if not call[0].startswith("__")
+            ],
+            ["query_entities", "delete_entity", "submit_transaction"],
+        )
+        self.objects_client.delete_entity.assert_called_once_with(
+            partition_key="unittest__WorldItem", row_key="Lamp"
+        )
+
+    def test_write_behind_reads(self):
+        self.storage_manager.write_behind = True
+        self.objects_client.query_entities.return_value.by_page.return_value = iter(
+            [
+                [
+                    {
+                        "PartitionKey": "unittest__Room",
+                        "RowKey": "Road",
+                        "name": "Road",
+                        "image": "old.png",
+                    },
+                    {
+                        "PartitionKey": "unittest__Room",
+                        "RowKey": "Garden",
+                        "name": "Garden",
+                        "exits": '{"north": "Road"}',
+                    },
+                ]
+            ]
+        )
+        self.storage_manager.queue_write(
+            {"PartitionKey": "unittest__Room", "RowKey": "Road", "image": "new.png"},
+            merge=True,
+        )
+        self.storage_manager.queue_write(
+            {"PartitionKey": "unittest__Room", "RowKey": "Kitchen", "name": "Kitchen"},
+            merge=False,
+        )
+        self.storage_manager.delete_world_object("unittest", "Room", "Garden")
+        # Queued changes are applied over the table's objects, without flushing them
+        rooms = {
+            room["name"]: room
+            for room in self.storage_manager.get_world_objects("unittest", "Room")
+        }
+        self.assertEqual(sorted(rooms), ["Kitchen", "Road"])
+        self.assertEqual(rooms["Road"]["image"], "new.png")
+        self.objects_client.submit_transaction.assert_not_called()
+        self.objects_client.delete_entity.assert_not_called()
+
+        # Changes alone are merged into the table's version of the object
+        self.objects_client.get_entity.return_value = {
+            "PartitionKey": "unittest__Room",
+            "RowKey": "Road",
+            "name": "Road",
+            "image": "old.png",
+        }
+        road = self.storage_manager.get_world_object("unittest", "Room", "Road")
+        self.assertEqual((road["name"], road["image"]), ("Road", "new.png"))
+        self.assertIsNone(
+            self.storage_manager.get_world_object("unittest", "Room", "Garden")
+        )
+        self.objects_client.submit_transaction.assert_not_called()
+
+    def test_snapshot_restart(self):
+        # Rows in the table, and those changed since the snapshot was taken
+        table = {name: {"RowKey": name, "name": name} for name in ("A", "B")}
+        changed = set(table)
+
+        def query_entities(query_filter, parameters, results_per_page, select=None):
+            result = MagicMock()
+            names = sorted(changed if "Timestamp" in query_filter else table)
+            rows = [{"PartitionKey": parameters["pk"], **table[name]} for name in names]
+            if select:
+                rows = [{key: row[key] for key in select} for row in rows]
+            result.by_page.return_value = iter([rows])
+            return result
+
+        with tempfile.TemporaryDirectory() as snapshot_folder:
+            self.storage_manager.snapshot_folder = snapshot_folder
+            self.objects_client.query_entities.side_effect = query_entities
+            futures = self.storage_manager.start_getting_world_objects(
+                "unittest", ["Room"]
+            )
+            self.assertEqual(len(futures["Room"].result()), 2)
+            # A change made while running is kept in the snapshot
+            table["C"] = {"RowKey": "C", "name": "C"}
+            self.storage_manager.snapshots["unittest"].update(
+                {"PartitionKey": "unittest__Room", "RowKey": "C", "name": "C"}
+            )
+            self.storage_manager.close()
+
+            # Meanwhile another process changes B and deletes A
+            table["B"]["name"] = "B2"
+            del table["A"]
+            changed = {"B"}
+
+            # Restart
+            restarted = AzureStorageManager(snapshot_folder=snapshot_folder)
+            restarted.table_service_client = self.storage_manager.table_service_client
+            futures = restarted.start_getting_world_objects("unittest", ["Room"])
+            self.assertEqual(
+                sorted(room["name"] for room in futures["Room"].result()),
+                ["B2", "C"],
+            )
+            queries = self.objects_client.query_entities.call_args_list
+            self.assertIn("Timestamp ge @since", queries[-2].args[0])
+            # Deletes are found with a query for the keys only
+            self.assertEqual(queries[-1].kwargs["select"], ["PartitionKey", "RowKey"])
+            self.assertNotIn(
+                "A", restarted.snapshots["unittest"].partitions["unittest__Room"]
+            )
+            # Nothing to save on exit, the folder is about to go
+            restarted.snapshots = {}
+
+
+if __name__ == "__main__":
+    unittest.main()
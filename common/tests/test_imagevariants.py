@@ -0,0 +1,81 @@
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+from PIL import Image
+from imagevariants import (
+    create_variant,
+    create_variants,
+    get_variant_name,
+    parse_variant_name,
+)
+
+
+def make_png(width: int, height: int) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (width, height), (40, 120, 200)).save(output, format="png")
+    return output.getvalue()
+
+
+class TestImageVariants(unittest.TestCase):
+    def test_variant_names(self):
+        variant_name = get_variant_name("corvid.room.png", "mobile", "webp")
+        self.assertEqual(variant_name, "corvid.room.png@mobile.webp")
+        self.assertEqual(
+            parse_variant_name(variant_name), ("corvid.room.png", "mobile", "webp")
+        )
+        self.assertIsNone(parse_variant_name("corvid.room.png"))
+        self.assertIsNone(parse_variant_name("corvid.room.png@huge.webp"))
+        self.assertIsNone(parse_variant_name("corvid.room.png@mobile.gif"))
+        self.assertIsNone(parse_variant_name("corvid.room.svg@mobile.webp"))
+
+    def test_create_variant(self):
+        image = Image.open(
+            BytesIO(create_variant(make_png(1024, 512), "thumbnail", "webp"))
+        )
+        self.assertEqual(image.format, "WEBP")
+        self.assertEqual(image.size, (256, 128))
+        # Never made larger than the original
+        image = Image.open(BytesIO(create_variant(make_png(100, 50), "mobile", "avif")))
+        self.assertEqual(image.size, (100, 50))
+
+    def test_create_variants(self):
+        variants = create_variants("room.png", make_png(800, 800))
+        # Desktop would be no smaller than the original, and it is already stored as PNG
+        self.assertEqual(
+            sorted(variants),
+            sorted(
+                [
+                    "room.png@thumbnail.avif",
+                    "room.png@thumbnail.webp",
+                    "room.png@thumbnail.png",
+                    "room.png@mobile.avif",
+                    "room.png@mobile.webp",
+                    "room.png@mobile.png",
+                    "room.png@full.avif",
+                    "room.png@full.webp",
+                ]
+            ),
+        )
+        self.assertEqual(create_variants("room.svg", b"<svg/>"), {})
+
+    def test_create_variants_format_fails(self):
+        real_create_variant = create_variant
+
+        def create_variant_without_avif(image_data, size, image_format):
+            if image_format == "avif":
+                raise KeyError("AVIF")
+            return real_create_variant(image_data, size, image_format)
+
+        # The other formats are still created
+        with patch(
+            "imagevariants.create_variant", side_effect=create_variant_without_avif
+        ), patch("imagevariants.VARIANT_FORMATS", ("avif", "webp", "png")):
+            variants = create_variants("room.png", make_png(300, 300))
+        self.assertEqual(
+            sorted(variants),
+            ["room.png@full.webp", "room.png@thumbnail.png", "room.png@thumbnail.webp"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
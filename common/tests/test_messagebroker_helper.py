@@ -0,0 +1,119 @@
+import unittest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from messagebroker_helper import MessageBrokerHelper, MessageBrokerNamespace
+
+
+class TestMessageBrokerHelper(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.mbh = MessageBrokerHelper(
+            "localhost", 4222, {"world_update": {"mode": "publish"}}
+        )
+        # Replace the NATS client so no server is needed
+        self.mbh.nc = MagicMock()
+        self.mbh.nc.publish = AsyncMock()
+        self.mbh.nc.flush = AsyncMock()
+        self.mbh.nc.is_connected = True
+
+    async def test_publish_flushes_each_message(self):
+        await self.mbh.publish("world_update", "Hello", "user1")
+        await self.mbh.publish("world_update", "Hello again", "user1")
+        self.assertEqual(self.mbh.nc.publish.await_count, 2)
+        self.assertEqual(self.mbh.nc.flush.await_count, 2)
+        self.mbh.nc.publish.assert_awaited_with("world_update.user1", b"Hello again")
+
+    async def test_publish_many_flushes_once(self):
+        await self.mbh.publish_many(
+            [("world_update", "Hello", f"user{i}") for i in range(10)]
+        )
+        self.assertEqual(self.mbh.nc.publish.await_count, 10)
+        self.assertEqual(self.mbh.nc.flush.await_count, 1)
+
+    async def test_buffered_publishing_size_cap(self):
+        self.mbh.max_buffered_messages = 4
+        self.mbh.max_buffer_secs = 60
+        async with self.mbh.buffered_publishing():
+            for i in range(10):
+                await self.mbh.publish("world_update", "Hello", "user1")
+        # Two flushes on reaching the cap, one for the remainder at the end
+        self.assertEqual(self.mbh.nc.flush.await_count, 3)
+
+    async def test_buffered_publishing_time_cap(self):
+        self.mbh.max_buffer_secs = 0.01
+        async with self.mbh.buffered_publishing():
+            await self.mbh.publish("world_update", "Hello", "user1")
+            # Flushed once the time cap is reached, without waiting for another publish
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.mbh.nc.flush.await_count, 1)
+        # Nothing left to flush at the end
+        self.assertEqual(self.mbh.nc.flush.await_count, 1)
+
+    async def test_unregistered_queue_not_published(self):
+        async with self.mbh.buffered_publishing():
+            await self.mbh.publish("not_a_queue", "Hello")
+        self.mbh.nc.publish.assert_not_awaited()
+        self.mbh.nc.flush.assert_not_awaited()
+
+    async def test_pull_in_flight_limit(self):
+        handling = []
+        done = asyncio.Event()
+
+        async def callback(data):
+            handling.append(data["n"])
+            await done.wait()
+
+        self.mbh.add_queues(
+            {"ai_request": {"mode": "pull", "callback": callback, "max_in_flight": 2}}
+        )
+        msgs = []
+        for n in range(3):
+            msg = MagicMock()
+            msg.subject = "ai_request"
+            msg.data = f'{{"n": {n}}}'.encode()
+            msg.ack = AsyncMock()
+            msgs.append(msg)
+        subscription = MagicMock()
+        subscription.fetch = AsyncMock(side_effect=[[msg] for msg in msgs])
+        pull_task = asyncio.create_task(self.mbh.pull_messages(subscription, 2))
+        await asyncio.sleep(0.01)
+        # No more are fetched while the limit is being handled, so the rest wait in the stream
+        self.assertEqual(handling, [0, 1])
+        self.assertEqual(subscription.fetch.await_count, 2)
+        done.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(handling, [0, 1, 2])
+        for msg in msgs:
+            msg.ack.assert_awaited_once()
+        pull_task.cancel()
+
+    async def test_subscribe_and_unsubscribe(self):
+        async def room_message(data):
+            pass
+
+        self.mbh.add_queues({"room": {"mode": "subscribe", "callback": room_message}})
+        subscription = MagicMock()
+        subscription.unsubscribe = AsyncMock()
+        self.mbh.nc.subscribe = AsyncMock(return_value=subscription)
+        await self.mbh.subscribe("room.unittest.road", room_message)
+        self.mbh.nc.subscribe.assert_awaited_once_with(
+            "room.unittest.road", cb=self.mbh.global_callback
+        )
+        await self.mbh.unsubscribe("room.unittest.road")
+        subscription.unsubscribe.assert_awaited_once()
+        # Already ended
+        await self.mbh.unsubscribe("room.unittest.road")
+        subscription.unsubscribe.assert_awaited_once()
+
+    async def test_namespace(self):
+        namespace = MessageBrokerNamespace(
+            self.mbh, "jaysgame", {"room_update": {"mode": "publish"}}
+        )
+        await namespace.publish("room_update", "Hello", "user1")
+        self.mbh.nc.publish.assert_awaited_with("jaysgame.room_update.user1", b"Hello")
+        # Queues not registered in the namespace are shared
+        await namespace.publish("world_update", "Hello", "user1")
+        self.mbh.nc.publish.assert_awaited_with("world_update.user1", b"Hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
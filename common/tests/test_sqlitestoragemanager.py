@@ -0,0 +1,125 @@
+import unittest
+import tempfile
+import sqlite3
+from os import path
+from unittest.mock import MagicMock
+from sqlitestoragemanager import SQLiteStorageManager
+
+
+# Minimal stand-ins for the world's objects, which are stored by class name
+class Room:
+    def __init__(self, name: str, exits: dict) -> None:
+        self.name = name
+        self.exits = exits
+        self.world = None
+
+
+class WorldItem:
+    def __init__(self, name: str, location: str) -> None:
+        self.name = name
+        self.location = location
+        self.world = None
+
+
+class TestSQLiteStorageManager(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.database_path = path.join(self.folder.name, "unittest.db")
+        self.storage_manager = SQLiteStorageManager(self.database_path)
+
+    def tearDown(self) -> None:
+        self.storage_manager.close()
+        self.folder.cleanup()
+
+    def test_store_and_get(self):
+        self.storage_manager.store_world_objects(
+            "unittest",
+            [Room("Road", {"north": "Kitchen"}), Room("Kitchen", {"south": "Road"})],
+        )
+        self.storage_manager.store_world_object("unittest", WorldItem("Lamp", "Road"))
+        rooms = self.storage_manager.get_world_objects("unittest", "Room")
+        self.assertEqual([room["name"] for room in rooms], ["Kitchen", "Road"])
+        self.assertEqual(rooms[1]["exits"], {"north": "Kitchen"})
+        self.assertEqual(rooms[1]["world"], "unittest")
+        self.assertEqual(
+            self.storage_manager.get_world_object("unittest", "WorldItem", "Lamp")[
+                "location"
+            ],
+            "Road",
+        )
+        # Storing again replaces
+        self.storage_manager.store_world_object(
+            "unittest", WorldItem("Lamp", "Kitchen")
+        )
+        items = self.storage_manager.get_world_objects("unittest", "WorldItem")
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]["location"], "Kitchen")
+        # Other worlds are separate
+        self.assertEqual(self.storage_manager.get_world_objects("other", "Room"), [])
+
+    def test_store_fails(self):
+        class TrackedRoom(Room):
+            def mark_stored(self) -> None:
+                self.changed_fields = set()
+
+        room = TrackedRoom("Road", {"north": "Kitchen"})
+        room.changed_fields = None
+        connection = self.storage_manager.connection
+        self.addCleanup(setattr, self.storage_manager, "connection", connection)
+        self.storage_manager.connection = MagicMock()
+        self.storage_manager.connection.execute.side_effect = sqlite3.OperationalError
+        self.storage_manager.connection.executemany.side_effect = (
+            sqlite3.OperationalError
+        )
+        # Not marked as stored, so it is stored in full next time
+        with self.assertRaises(sqlite3.OperationalError):
+            self.storage_manager.store_world_object("unittest", room)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.storage_manager.store_world_objects("unittest", [room])
+        self.assertIsNone(room.changed_fields)
+
+    def test_survives_reopen(self):
+        self.storage_manager.store_world_object("unittest", Room("Road", {}))
+        self.storage_manager.close()
+        self.storage_manager = SQLiteStorageManager(self.database_path)
+        self.assertEqual(
+            len(self.storage_manager.get_world_objects("unittest", "Room")), 1
+        )
+
+    def test_delete(self):
+        self.storage_manager.store_world_object("unittest", WorldItem("Lamp", "Road"))
+        self.storage_manager.store_world_object("unittest", Room("Road", {}))
+        self.assertFalse(
+            self.storage_manager.delete_world_object(
+                "unittest", "WorldItem", "Lamp", "Kitchen"
+            )
+        )
+        self.assertTrue(
+            self.storage_manager.delete_world_object(
+                "unittest", "WorldItem", "Lamp", "Road"
+            )
+        )
+        self.assertEqual(
+            self.storage_manager.get_world_objects("unittest", "WorldItem"), []
+        )
+        self.storage_manager.delete_world_from_db("unittest")
+        self.assertEqual(self.storage_manager.get_world_objects("unittest", "Room"), [])
+
+    def test_images(self):
+        self.assertTrue(
+            self.storage_manager.store_image("unittest", "road.png", b"image data")
+        )
+        self.assertEqual(
+            self.storage_manager.get_image_blob("unittest.road.png"), b"image data"
+        )
+        self.assertIsNone(self.storage_manager.get_image_blob("unittest.none.png"))
+        self.storage_manager.store_image("unittest", "road.png@mobile.webp", b"webp")
+        self.storage_manager.store_image("other", "road.png", b"image data")
+        self.assertEqual(
+            self.storage_manager.list_image_blobs("unittest."),
+            ["unittest.road.png", "unittest.road.png@mobile.webp"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
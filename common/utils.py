@@ -1,6 +1,8 @@
 from os import environ
 from typing import Optional
 import sys
+import hashlib
+import re
 
 
 import logging
@@ -124,3 +126,17 @@ def get_critical_env_variable(env_var_name: str) -> Optional[str]:
     # Otherwise, exit
     print(f"{env_var_name} not set. Exiting.")
     sys.exit(1)
+
+
+# Generated images are named after what they show plus a hash of their content, e.g. road-3f2a9c1b7d4e.png,
+# so a new image of the same room never replaces an old one under the same name
+def get_image_file_name(image_name: str, image_data: bytes) -> str:
+    content_hash: str = hashlib.sha256(image_data).hexdigest()[:12]
+    return (
+        image_name.lower().replace(" ", "_").replace("'", "") + f"-{content_hash}.png"
+    )
+
+
+# Whether an image (or a variant of it) is named after its content, so never changes
+def is_content_named(image_name: str) -> bool:
+    return re.search(r"-[0-9a-f]{12}\.png(@|$)", image_name) is not None
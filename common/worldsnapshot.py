@@ -0,0 +1,119 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from os import path, makedirs, replace
+from utils import set_up_logger
+import json
+import threading
+import time
+import zlib
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Local copy of a world's stored objects, so that a restart only needs to fetch what has changed since.
+# Saved as zlib-compressed JSON. Objects are kept as stored (i.e. stringified), keyed by partition then row.
+class WorldSnapshot:
+
+    # Snapshots saved in any other format are ignored
+    format_version: int = 2
+
+    def __init__(self, folder: str, world_name: str) -> None:
+        self.world_name: str = world_name
+        self.file_path: str = path.join(folder, f"{world_name}.snapshot")
+        # Storage changes from this time on are not in the snapshot
+        self.as_of: Optional[datetime] = None
+        # Start of the latest load from storage, which becomes as_of when the snapshot is saved
+        self.loaded_at: Optional[datetime] = None
+        self.partitions: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Writes that were still queued when the snapshot was saved
+        self.pending_writes: List[Dict[str, Any]] = []
+        # Partition and row keys of those writes that only have changed fields
+        self.pending_merges: List[List[str]] = []
+        # Objects are updated by the storage manager while a background thread saves them
+        self.lock: threading.Lock = threading.Lock()
+
+    # Load the snapshot file if there is one, and it is recent enough to be worth bringing up to date
+    def load(self, max_age_secs: float) -> bool:
+        if not path.exists(self.file_path):
+            logger.info(f"No snapshot found at {self.file_path}")
+            return False
+        try:
+            with open(self.file_path, "rb") as f:
+                data: Dict[str, Any] = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error) as e:
+            logger.error(f"Could not read snapshot {self.file_path}: {e}")
+            return False
+        if data.get("format_version") != self.format_version:
+            logger.info(f"Ignoring snapshot in old format: {self.file_path}")
+            return False
+        if time.time() - data["saved_at"] > max_age_secs:
+            logger.info(f"Ignoring snapshot more than {max_age_secs} seconds old")
+            return False
+        with self.lock:
+            self.as_of = datetime.fromisoformat(data["as_of"])
+            self.partitions = data["partitions"]
+            self.pending_writes = data["pending_writes"]
+            self.pending_merges = data["pending_merges"]
+        logger.info(
+            f"Loaded snapshot of world {self.world_name} as of {self.as_of}: "
+            + ", ".join(
+                f"{len(rows)} {partition_key}"
+                for partition_key, rows in self.partitions.items()
+            )
+        )
+        return True
+
+    # Save the snapshot, replacing the file in one step so a crash never leaves half a snapshot
+    def save(
+        self, pending_writes: List[Dict[str, Any]], pending_merges: List[List[str]]
+    ) -> None:
+        if not self.loaded_at:
+            return
+        with self.lock:
+            data: bytes = json.dumps(
+                {
+                    "format_version": self.format_version,
+                    "world_name": self.world_name,
+                    "as_of": self.loaded_at.isoformat(),
+                    "saved_at": time.time(),
+                    "partitions": self.partitions,
+                    "pending_writes": pending_writes,
+                    "pending_merges": pending_merges,
+                },
+                default=str,
+            ).encode()
+        makedirs(path.dirname(self.file_path) or ".", exist_ok=True)
+        with open(self.file_path + ".tmp", "wb") as f:
+            f.write(zlib.compress(data))
+        replace(self.file_path + ".tmp", self.file_path)
+        logger.info(f"Saved snapshot of world {self.world_name} to {self.file_path}")
+
+    # Whole partitions only, as anything missing from a partition is taken to have been deleted
+    def set_partition(
+        self, partition_key: str, rows: Dict[str, Dict[str, Any]]
+    ) -> None:
+        with self.lock:
+            self.partitions[partition_key] = rows
+
+    # Keep the snapshot up to date with a stored object, if its partition is kept.
+    # With merge, the entity only has the object's changed fields.
+    def update(self, entity: Dict[str, Any], merge: bool = False) -> None:
+        with self.lock:
+            rows: Optional[Dict[str, Dict[str, Any]]] = self.partitions.get(
+                entity["PartitionKey"]
+            )
+            if rows is None:
+                return
+            if not merge:
+                rows[entity["RowKey"]] = entity.copy()
+            elif entity["RowKey"] in rows:
+                rows[entity["RowKey"]] = {**rows[entity["RowKey"]], **entity}
+
+    def remove(self, partition_key: str, row_key: str) -> None:
+        with self.lock:
+            self.partitions.get(partition_key, {}).pop(row_key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.partitions = {}
@@ -194,6 +194,9 @@ resource "docker_container" "imageserver_container" {
   env = [
     "IMAGESERVER_HOSTNAME=${data.terraform_remote_state.droplet.outputs.droplet_ip}",
     "IMAGESERVER_PORT=3002",
+    "IMAGESERVER_PREWARM_WORLDS=${var.ORCHESTRATOR_WORLD_NAME}",
+    "ORCHESTRATOR_HOSTNAME=${data.terraform_remote_state.droplet.outputs.droplet_ip}",
+    "ORCHESTRATOR_PORT=4222",
     "AZURE_STORAGE_ACCOUNT_NAME=${var.AZURE_STORAGE_ACCOUNT_NAME}",
     "AZURE_STORAGE_ACCOUNT_KEY=${var.AZURE_STORAGE_ACCOUNT_KEY}"
   ]
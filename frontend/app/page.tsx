@@ -36,6 +36,17 @@ function replaceAfterLastColon(
   return input.slice(0, lastIndex + 1) + replacement;
 }
 
+// Set if the world is hosted alongside others, e.g. its name
+const orchestratorNamespace: string =
+  process.env.NEXT_PUBLIC_ORCHESTRATOR_NAMESPACE || "";
+
+// Subject a queue is sent on, within the world's namespace if it has one
+function getSubject(queueName: string): string {
+  return orchestratorNamespace
+    ? `${orchestratorNamespace}.${queueName}`
+    : queueName;
+}
+
 export default function HomePage() {
   const [worldLog, setWorldLog] = useState<string[]>([]);
   const [userInput, setUserInput] = useState("");
@@ -103,18 +114,37 @@ export default function HomePage() {
       }
     };
 
+    // Function to handle messages published to everyone in the current room
+    const handleRoomMessages = async (sub: any) => {
+      for await (const msg of sub) {
+        const roomMessage = JSON.parse(sc.decode(msg.data));
+        // Skip messages about this person's own actions
+        if ((roomMessage["exclude"] || []).includes(personID)) continue;
+        let message = roomMessage["message"].replace(/[{|}]/g, "");
+        setWorldLog((prevLog) => {
+          const newLog = [...prevLog, message];
+          return newLog.slice(-10);
+        });
+      }
+    };
+
     // Subscribe to world updates
-    handleWorldUpdate(natsConnection.current.subscribe("world_update"));
+    handleWorldUpdate(
+      natsConnection.current.subscribe(getSubject("world_update"))
+    );
 
     // Subscribe to person-specific world updates
     let instructionSub: any, roomSub: any, logoutSub: any, nameInvalidSub: any;
+    let roomMessageSub: any;
     if (userName) {
       handleWorldUpdate(
-        natsConnection.current.subscribe(`world_update.${personID}`)
+        natsConnection.current.subscribe(
+          getSubject(`world_update.${personID}`)
+        )
       );
 
       // Subscribe to person-specific instructions
-      instructionSub = nc.subscribe(`instructions.${personID}`);
+      instructionSub = nc.subscribe(getSubject(`instructions.${personID}`));
       (async () => {
         for await (const msg of instructionSub) {
           setWorldLog((prev) => [...prev, sc.decode(msg.data)]);
@@ -122,7 +152,7 @@ export default function HomePage() {
       })();
 
       // Subscribe to person-specific room updates
-      roomSub = nc.subscribe(`room_update.${personID}`);
+      roomSub = nc.subscribe(getSubject(`room_update.${personID}`));
       (async () => {
         for await (const msg of roomSub) {
           const message = JSON.parse(sc.decode(msg.data));
@@ -130,11 +160,20 @@ export default function HomePage() {
           setRoomTitle(message["title"]);
           setRoomDescription(message["description"].replace(/[{|}]/g, ""));
           setRoomExits(message["exits"]);
+          // If room messages are published per room, follow the person into the new room
+          const roomSubject = message["room_subject"]
+            ? getSubject(message["room_subject"])
+            : "";
+          if (roomSubject !== (roomMessageSub?.getSubject() || "")) {
+            roomMessageSub?.unsubscribe();
+            roomMessageSub = roomSubject ? nc.subscribe(roomSubject) : undefined;
+            if (roomMessageSub) handleRoomMessages(roomMessageSub);
+          }
         }
       })();
 
       // Subscribe to person-specific logout
-      logoutSub = nc.subscribe(`logout.${personID}`);
+      logoutSub = nc.subscribe(getSubject(`logout.${personID}`));
       (async () => {
         for await (const msg of logoutSub) {
           console.log("logout event");
@@ -143,12 +182,15 @@ export default function HomePage() {
           // Unsubscribe from all subscriptions
           instructionSub.unsubscribe();
           roomSub.unsubscribe();
+          roomMessageSub?.unsubscribe();
           logoutSub.unsubscribe();
         }
       })();
 
       // Subscribe to person-specific name invalid
-      const nameInvalidSub = nc.subscribe(`name_invalid.${personID}`);
+      const nameInvalidSub = nc.subscribe(
+        getSubject(`name_invalid.${personID}`)
+      );
       (async () => {
         for await (const msg of nameInvalidSub) {
           alert(sc.decode(msg.data));
@@ -168,6 +210,7 @@ export default function HomePage() {
     return () => {
       instructionSub?.unsubscribe();
       roomSub?.unsubscribe();
+      roomMessageSub?.unsubscribe();
       logoutSub?.unsubscribe();
       nameInvalidSub?.unsubscribe();
     };
@@ -184,7 +227,7 @@ export default function HomePage() {
     if (natsConnection.current && userName.trim() !== "") {
       const sc = StringCodec();
       natsConnection.current.publish(
-        "set_user_name",
+        getSubject("set_user_name"),
         sc.encode(
           JSON.stringify({
             name: userName,
@@ -205,7 +248,7 @@ export default function HomePage() {
         user_input: userInput,
       };
       natsConnection.current.publish(
-        "user_action",
+        getSubject("user_action"),
         sc.encode(JSON.stringify(message))
       );
       setUserInput("");
@@ -260,7 +303,13 @@ export default function HomePage() {
       )}
       {nameSet && roomImageURL && (
         <div style={{ display: "flex", flexDirection: "row" }}>
-          <img src={roomImageURL ?? ""} alt={roomTitle ?? ""} width="512" />
+          <img
+            src={roomImageURL ?? ""}
+            srcSet={`${roomImageURL}?size=mobile 640w, ${roomImageURL}?size=desktop 1280w`}
+            sizes="512px"
+            alt={roomTitle ?? ""}
+            width="512"
+          />
           <div
             style={{
               display: "flex",
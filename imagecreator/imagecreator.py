@@ -7,7 +7,9 @@ from utils import get_critical_env_variable, set_up_logger, exit
 logger = set_up_logger("Image Creator")
 from messagebroker_helper import MessageBrokerHelper
 from aimanager import AIManager
-from azurestoragemanager import AzureStorageManager
+from storagemanager import StorageManager
+from storagefactory import create_storage_manager
+from imagevariants import create_variants
 import random
 from PIL import Image
 
@@ -53,14 +55,14 @@ class ImageCreator:
             logger.info("No text model provided: text AI manager not set up")
 
         # Set up the storage manager
-        self.storage_manager: AzureStorageManager = AzureStorageManager()
+        self.storage_manager: StorageManager = create_storage_manager()
 
     async def process_image_request(self, data: Dict) -> None:
         logger.info(f"Processing work request: {data}")
 
         if data and "room_name" in data and "description" in data:
             # Do some work here
-            success, image_filename = self.create_room_image(
+            success, image_filename = await self.create_room_image(
                 data["world_name"],
                 data["room_name"],
                 data["description"],
@@ -73,6 +75,7 @@ class ImageCreator:
             await self.mbh.publish(
                 "image_creation_response",
                 {
+                    "world_name": data["world_name"],
                     "room_name": data["room_name"],
                     "image_filename": image_filename,
                     "success": success,
@@ -84,7 +87,7 @@ class ImageCreator:
 
         logger.info("Work request processed.")
 
-    def convert_description_to_prompt(
+    async def convert_description_to_prompt(
         self, world_name: str, description: str, landscape: str
     ) -> str:
         # Convert the description into a more suitable prompt for image generation
@@ -102,7 +105,7 @@ class ImageCreator:
             + f" Description:\n{description}"
         )
         try:
-            response = self.text_ai_manager.submit_request(
+            response = await self.text_ai_manager.submit_request_async(
                 request=instruction, history=False, cleanup_output=False
             )
             logger.info(f"Response from text AI manager: {response}")
@@ -111,7 +114,7 @@ class ImageCreator:
             logger.error(f"Error generating prompt ({e})")
             return ""
 
-    def create_room_image(
+    async def create_room_image(
         self,
         world_name: str,
         room_name: str,
@@ -156,7 +159,7 @@ class ImageCreator:
             if self.text_ai_manager:
                 # Convert the description into a more suitable prompt for image generation
                 try:
-                    prompt = self.convert_description_to_prompt(
+                    prompt = await self.convert_description_to_prompt(
                         world_name, description, landscape
                     )
                     logger.info(f"Generated better prompt for image creation: {prompt}")
@@ -169,8 +172,9 @@ class ImageCreator:
 
             try:
                 image_data: bytes
-                image_filename, image_data = self.image_ai_manager.create_image(
-                    room_name, prompt
+                # Image generation is slow, so keep it off the event loop
+                image_filename, image_data = await asyncio.to_thread(
+                    self.image_ai_manager.create_image, room_name, prompt
                 )
                 logger.info(f"AI Image created: {image_filename}")
             except Exception as e:
@@ -181,16 +185,37 @@ class ImageCreator:
         logger.info(f"Image data length: {len(image_data)} bytes")
         if image_data and image_filename:
             logger.info("Saving image to storage")
-            return (
-                self.storage_manager.store_image(
-                    world_name, image_filename, image_data
-                ),
-                image_filename,
+            success: bool = self.storage_manager.store_image(
+                world_name, image_filename, image_data
             )
+            if success:
+                # Encoding is slow, so keep it off the event loop
+                await asyncio.to_thread(
+                    self.store_image_variants, world_name, image_filename, image_data
+                )
+            return (success, image_filename)
         else:
             logger.error("Error creating/saving image - returned no data")
             return (False, image_filename)
 
+    # Store smaller and better compressed versions of an image, for the image server to choose from.
+    # If any are missing, the image server creates them from the original when first needed.
+    def store_image_variants(
+        self, world_name: str, image_filename: str, image_data: bytes
+    ) -> None:
+        try:
+            variants: Dict[str, bytes] = create_variants(image_filename, image_data)
+            for variant_name, variant_data in variants.items():
+                self.storage_manager.store_image(world_name, variant_name, variant_data)
+            logger.info(
+                f"Stored {len(variants)} variants of {image_filename}: "
+                + ", ".join(
+                    f"{name} {len(data)} bytes" for name, data in variants.items()
+                )
+            )
+        except Exception as e:
+            logger.error(f"Error creating image variants ({e})")
+
 
 async def main() -> None:
     async def process_image_request(data: Dict) -> None:
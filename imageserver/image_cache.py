@@ -0,0 +1,249 @@
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future
+from os import path, makedirs, listdir, replace, remove, fdopen
+from tempfile import mkstemp
+from werkzeug.security import safe_join
+from utils import set_up_logger
+import hashlib
+import threading
+import time
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Strong validator from the content, so a replaced image gets a new ETag
+def make_etag(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()[:32]
+
+
+# An image found in the cache: its data if held in memory, otherwise the file it is cached in
+class CachedImage(NamedTuple):
+    etag: str
+    data: Optional[bytes] = None
+    file_path: Optional[str] = None
+
+
+# Two tier cache of images: the most recently used in memory, more of them on local disk,
+# and otherwise fetched from storage. Both tiers have a size budget, and the least recently used
+# images are evicted first. Concurrent requests for an image not yet cached share one fetch.
+# Images too big to keep in memory are served from their file, which can be sent without copying.
+class ImageCache:
+
+    def __init__(
+        self,
+        folder: str,
+        fetch: Callable[[str], Optional[bytes]],
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+        max_disk_age_secs: float = 0,
+    ) -> None:
+        self.folder: str = folder
+        # Gets an image from storage, or None if it doesn't exist
+        self.fetch: Callable[[str], Optional[bytes]] = fetch
+        self.max_memory_bytes: int = max_memory_bytes
+        self.max_disk_bytes: int = max_disk_bytes
+        # Images cached on disk for longer than this are fetched again (0 for no limit)
+        self.max_disk_age_secs: float = max_disk_age_secs
+
+        self.lock: threading.Lock = threading.Lock()
+        # Image data and ETag by name, least recently used first
+        self.memory: OrderedDict[str, Tuple[bytes, str]] = OrderedDict()
+        self.memory_bytes: int = 0
+        # (Size, time cached, ETag if known) of images on disk by name, least recently used first
+        self.disk: OrderedDict[str, Tuple[int, float, Optional[str]]] = OrderedDict()
+        self.disk_bytes: int = 0
+        # Fetches in progress, so that other requests for the same image wait for them
+        self.fetches: Dict[str, Future] = {}
+
+        # Hit / miss counters
+        self.memory_hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+
+        makedirs(self.folder, exist_ok=True)
+        self.load_disk_index()
+
+    # Find what is already cached on disk, e.g. from before a restart, oldest first
+    def load_disk_index(self) -> None:
+        files = []
+        for file_name in listdir(self.folder):
+            file_path: str = path.join(self.folder, file_name)
+            if file_name.endswith(".tmp"):
+                # Left over from an interrupted write, unless another process is still writing it
+                if time.time() - path.getmtime(file_path) > 60:
+                    remove(file_path)
+            elif path.isfile(file_path):
+                files.append(
+                    (path.getmtime(file_path), file_name, path.getsize(file_path))
+                )
+        for cached_at, file_name, size in sorted(files):
+            self.disk[file_name] = (size, cached_at, None)
+            self.disk_bytes += size
+        logger.info(
+            f"Found {len(self.disk)} cached images ({self.disk_bytes} bytes) in {self.folder}"
+        )
+        self.evict_from_disk()
+
+    # Return an image, or None if there is no such image
+    def get(self, blob_name: str) -> Optional[bytes]:
+        cached_image: Optional[CachedImage] = self.lookup(blob_name)
+        if not cached_image:
+            return None
+        if cached_image.data:
+            return cached_image.data
+        try:
+            with open(cached_image.file_path, "rb") as f:
+                return f.read()
+        except OSError as e:
+            self.forget_evicted(blob_name, e)
+            return self.get(blob_name)
+
+    # Find an image, fetching it from storage if not cached, or return None if there is no such image
+    def lookup(self, blob_name: str) -> Optional[CachedImage]:
+        file_path: Optional[str] = safe_join(self.folder, blob_name)
+        if not file_path or blob_name.endswith(".tmp"):
+            logger.warning(f"Invalid image name {blob_name}")
+            return None
+
+        fetch: Optional[Future] = None
+        fetching: bool = False
+        with self.lock:
+            expired: bool = blob_name in self.disk and self.is_expired(blob_name)
+            if blob_name in self.memory and not expired:
+                self.memory.move_to_end(blob_name)
+                # Keep it on disk too, while it is in use
+                if blob_name in self.disk:
+                    self.disk.move_to_end(blob_name)
+                self.memory_hits += 1
+                image_data, etag = self.memory[blob_name]
+                return CachedImage(etag, data=image_data)
+            if blob_name in self.disk and not expired:
+                self.disk.move_to_end(blob_name)
+                self.disk_hits += 1
+                size, _, etag = self.disk[blob_name]
+                # Too big for memory, so serve it from the file (once its ETag is known)
+                if etag and not self.fits_in_memory(size):
+                    return CachedImage(etag, file_path=file_path)
+            elif blob_name in self.fetches:
+                # Another request is already fetching it
+                fetch = self.fetches[blob_name]
+            else:
+                fetch = self.fetches[blob_name] = Future()
+                fetching = True
+                self.misses += 1
+                self.remove_from_memory(blob_name)
+                logger.info(f"Image cache miss for {blob_name} ({self.get_stats()})")
+
+        if fetching:
+            return self.fetch_image(blob_name, file_path, fetch)
+        if fetch:
+            return fetch.result()
+        try:
+            with open(file_path, "rb") as f:
+                image_data: bytes = f.read()
+        except OSError as e:
+            self.forget_evicted(blob_name, e)
+            return self.lookup(blob_name)
+        etag: str = make_etag(image_data)
+        with self.lock:
+            if blob_name in self.disk:
+                size, cached_at, _ = self.disk[blob_name]
+                self.disk[blob_name] = (size, cached_at, etag)
+            self.add_to_memory(blob_name, image_data, etag)
+        return CachedImage(etag, data=image_data)
+
+    # Fetch an image from storage and cache it, then pass it to any other requests waiting for it
+    def fetch_image(
+        self, blob_name: str, file_path: str, fetch: Future
+    ) -> Optional[CachedImage]:
+        cached_image: Optional[CachedImage] = None
+        try:
+            image_data: Optional[bytes] = self.fetch(blob_name)
+            if image_data:
+                # Write then rename, so a partly written file is never served.
+                # Each writer has its own temporary file, as other processes may share the folder.
+                temp_file, temp_path = mkstemp(dir=self.folder, suffix=".tmp")
+                try:
+                    with fdopen(temp_file, "wb") as f:
+                        f.write(image_data)
+                    replace(temp_path, file_path)
+                except Exception:
+                    remove(temp_path)
+                    raise
+                logger.info(f"Cached {blob_name} in {self.folder}")
+                cached_image = CachedImage(make_etag(image_data), data=image_data)
+        except Exception as e:
+            logger.error(f"Could not fetch {blob_name}: {e}")
+            cached_image = None
+        finally:
+            with self.lock:
+                if cached_image:
+                    self.forget_disk(blob_name)
+                    self.disk[blob_name] = (
+                        len(cached_image.data),
+                        time.time(),
+                        cached_image.etag,
+                    )
+                    self.disk_bytes += len(cached_image.data)
+                    self.add_to_memory(blob_name, cached_image.data, cached_image.etag)
+                    self.evict_from_disk()
+                del self.fetches[blob_name]
+            fetch.set_result(cached_image)
+        return cached_image
+
+    # A cached file was evicted by another request (or process) since it was looked up
+    def forget_evicted(self, blob_name: str, e: OSError) -> None:
+        logger.warning(f"Could not read cached {blob_name}: {e}")
+        with self.lock:
+            self.forget_disk(blob_name)
+
+    def is_expired(self, blob_name: str) -> bool:
+        return bool(
+            self.max_disk_age_secs
+            and time.time() - self.disk[blob_name][1] > self.max_disk_age_secs
+        )
+
+    # Images that would take up more than a quarter of the memory budget are not kept in memory
+    def fits_in_memory(self, size: int) -> bool:
+        return size <= self.max_memory_bytes // 4
+
+    def add_to_memory(self, blob_name: str, image_data: bytes, etag: str) -> None:
+        if not self.fits_in_memory(len(image_data)) or blob_name in self.memory:
+            return
+        self.memory[blob_name] = (image_data, etag)
+        self.memory_bytes += len(image_data)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, (evicted, _) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def remove_from_memory(self, blob_name: str) -> None:
+        if blob_name in self.memory:
+            self.memory_bytes -= len(self.memory.pop(blob_name)[0])
+
+    def forget_disk(self, blob_name: str) -> None:
+        if blob_name in self.disk:
+            self.disk_bytes -= self.disk.pop(blob_name)[0]
+
+    # Delete the least recently used images from disk until within budget
+    def evict_from_disk(self) -> None:
+        while self.disk_bytes > self.max_disk_bytes and self.disk:
+            blob_name: str = next(iter(self.disk))
+            self.forget_disk(blob_name)
+            try:
+                remove(path.join(self.folder, blob_name))
+                logger.info(f"Evicted {blob_name} from {self.folder}")
+            except OSError as e:
+                logger.warning(f"Could not evict {blob_name}: {e}")
+
+    def get_stats(self) -> str:
+        requests: int = self.memory_hits + self.disk_hits + self.misses
+        hit_rate: float = (
+            (self.memory_hits + self.disk_hits) / requests if requests else 0
+        )
+        return (
+            f"{self.memory_hits} memory hits, {self.disk_hits} disk hits, {self.misses} misses, "
+            + f"hit rate {hit_rate:.0%}, {len(self.memory)} images ({self.memory_bytes} bytes) in memory, "
+            + f"{len(self.disk)} ({self.disk_bytes} bytes) on disk"
+        )
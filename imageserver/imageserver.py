@@ -1,9 +1,29 @@
-from os import path, environ, makedirs
-from typing import Optional, Union
-from flask import Flask, send_from_directory, Response
+from os import environ
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, Response, request
 from azurestoragemanager import AzureStorageManager
 from storagemanager import StorageManager
-from utils import get_critical_env_variable, set_up_logger
+from storagefactory import create_storage_manager
+from utils import get_critical_env_variable, set_up_logger, is_content_named
+from image_cache import CachedImage, ImageCache
+from imagevariants import (
+    FULL_SIZE,
+    VARIANT_FORMATS,
+    VARIANT_WIDTHS,
+    create_variant,
+    get_image_width,
+    get_stored_size,
+    get_variant_name,
+    has_variants,
+    parse_variant_name,
+)
+from messagebroker_helper import MessageBrokerHelper
+from werkzeug.utils import send_file
+import asyncio
+import mimetypes
+import threading
+import time
 
 # Set up logger
 logger = set_up_logger("Image Server")
@@ -25,39 +45,312 @@ class ImageServer:
             self.storage_manager = StorageManager(image_only=True)
 
         self.cache_folder: str = "image_cache"
-        # Create a local folder named after the container to store images
-        makedirs(self.cache_folder, exist_ok=True)
+        # Recently used images are kept in memory, and more of them in the local folder
+        self.image_cache: ImageCache = ImageCache(
+            self.cache_folder,
+            self.fetch_image,
+            max_memory_bytes=int(environ.get("IMAGESERVER_MEMORY_CACHE_MB", 64))
+            * 1024
+            * 1024,
+            max_disk_bytes=int(environ.get("IMAGESERVER_DISK_CACHE_MB", 1024))
+            * 1024
+            * 1024,
+            # Images can be replaced in storage, so optionally fetch them again after a while
+            max_disk_age_secs=float(
+                environ.get("IMAGESERVER_DISK_CACHE_MAX_AGE_SECS", 0)
+            ),
+        )
+        # How long browsers may use other images (e.g. black.png) before checking for changes
+        self.browser_cache_max_age_secs: int = int(
+            environ.get("IMAGESERVER_BROWSER_CACHE_MAX_AGE_SECS", 3600)
+        )
+
+        # Images are fetched ahead of requests by a bounded pool of threads (started as needed)
+        self.prefetch_pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=int(environ.get("IMAGESERVER_PREFETCH_THREADS", 8)),
+            thread_name_prefix="prefetch",
+        )
+        # Width of each original image seen, as sizes at least that wide are served at full size
+        self.image_widths: Dict[str, int] = {}
+        # Variants fetched along with each image, by default those the frontend shows room images as
+        # (leaving out formats this Pillow can't encode)
+        self.prefetch_variants: List[Tuple[str, str]] = [
+            tuple(variant.strip().split(".", 1))
+            for variant in environ.get(
+                "IMAGESERVER_PREFETCH_VARIANTS", "mobile.avif,desktop.avif"
+            ).split(",")
+            if "." in variant and variant.strip().split(".", 1)[1] in VARIANT_FORMATS
+        ]
 
         @self.app.route("/image/<blob_name>")
         def get_image(blob_name: str) -> Optional[Response]:
-            return self.do_get_image(blob_name)
+            return self.do_get_image(blob_name, request)
 
+    # Serve with several threads (and optionally processes), so slow downloads don't hold up other requests
     def run(self) -> None:
         port: str = get_critical_env_variable("IMAGESERVER_PORT")
-        logger.info(f"Starting up Flask server on port {port}")
-        self.app.run(host="0.0.0.0", port=port)
+        options: Dict[str, Any] = {
+            "bind": f"0.0.0.0:{port}",
+            # Each worker process has its own memory cache, and they share the disk cache
+            "workers": int(environ.get("IMAGESERVER_WORKERS", 1)),
+            "threads": int(environ.get("IMAGESERVER_THREADS", 16)),
+            "worker_class": "gthread",
+            # Browsers fetch several images in a row, so keep their connections open between requests
+            "keepalive": int(environ.get("IMAGESERVER_KEEPALIVE_SECS", 5)),
+            "sendfile": True,
+            # Threads don't survive forking, so each worker starts its own prefetching (sharing out the hints)
+            "post_worker_init": lambda worker: self.start_prefetching(),
+        }
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            # Gunicorn does not run on Windows, e.g. when running locally
+            logger.warning("Gunicorn not available, starting up Flask server instead")
+            self.start_prefetching()
+            self.app.run(host="0.0.0.0", port=port, threaded=True)
+            return
+
+        app: Flask = self.app
+
+        class GunicornApplication(BaseApplication):
+            def load_config(self) -> None:
+                for key, value in options.items():
+                    self.cfg.set(key, value)
+
+            def load(self) -> Flask:
+                return app
+
+        logger.info(f"Starting up Gunicorn server with options {options}")
+        GunicornApplication().run()
+
+    # Warm the cache in the background: with all the images of the worlds listed, and with the images
+    # the orchestrators hint at (those of the rooms next to players), so they are ready when asked for
+    def start_prefetching(self) -> None:
+        for world_name in environ.get("IMAGESERVER_PREWARM_WORLDS", "").split(","):
+            if world_name.strip():
+                threading.Thread(
+                    target=self.prewarm_world, args=(world_name.strip(),), daemon=True
+                ).start()
+        if environ.get("IMAGESERVER_PREFETCH_HINTS", "True").lower() == "true":
+            threading.Thread(
+                target=lambda: asyncio.run(self.receive_prefetch_hints()),
+                name="prefetch_hints",
+                daemon=True,
+            ).start()
+
+    async def receive_prefetch_hints(self) -> None:
+        mbh: MessageBrokerHelper = MessageBrokerHelper(
+            environ.get("ORCHESTRATOR_HOSTNAME", "localhost"),
+            environ.get("ORCHESTRATOR_PORT", 4222),
+            {
+                "image_prefetch_hint": {
+                    "mode": "subscribe",
+                    "callback": self.image_prefetch_hint,
+                    # Each hint goes to one worker process, as they share the disk cache
+                    "queue_group": "imageserver",
+                }
+            },
+        )
+        await mbh.set_up_nats()
+        if mbh.nc.is_connected:
+            await asyncio.Event().wait()  # Keeps the event loop running
+
+    # Event handler for hints of images likely to be asked for soon
+    async def image_prefetch_hint(self, data: Dict) -> None:
+        if not isinstance(data, dict):
+            logger.warning(f"Invalid image prefetch hint: {data}")
+            return
+        for blob_name in data.get("images", []):
+            if isinstance(blob_name, str):
+                self.prefetch_pool.submit(self.prefetch, blob_name)
+
+    # Fetch all the images of a world (as stored by the image creator, with any variants)
+    def prewarm_world(self, world_name: str) -> None:
+        start_time: float = time.time()
+        try:
+            blob_names: List[str] = [
+                blob_name
+                for blob_name in self.storage_manager.list_image_blobs(f"{world_name}.")
+                if not parse_variant_name(blob_name)
+            ]
+            logger.info(f"Warming cache with {len(blob_names)} images of {world_name}")
+            list(self.prefetch_pool.map(self.prefetch, blob_names))
+        except Exception as e:
+            logger.error(f"Could not warm cache with images of {world_name} ({e})")
+            return
+        logger.info(
+            f"Warmed cache with images of {world_name} in {time.time() - start_time:.1f} seconds "
+            + f"({self.image_cache.get_stats()})"
+        )
+
+    # Get an image and its usual variants into the cache, ahead of any request for them
+    def prefetch(self, blob_name: str) -> None:
+        self.image_cache.lookup(blob_name)
+        if has_variants(blob_name):
+            for size, image_format in self.prefetch_variants:
+                variant_name: Optional[str] = self.get_stored_variant_name(
+                    blob_name, size, image_format
+                )
+                if variant_name:
+                    self.image_cache.lookup(variant_name)
+
+    # Get an image from storage. Variants not in storage (e.g. of images created before there were variants)
+    # are created from the original, which is cached as well.
+    def fetch_image(self, blob_name: str) -> Optional[bytes]:
+        variant: Optional[Tuple[str, str, str]] = parse_variant_name(blob_name)
+        if not variant:
+            image_data: Optional[bytes] = self.storage_manager.get_image_blob(blob_name)
+            if image_data and has_variants(blob_name):
+                self.remember_width(blob_name, image_data)
+            return image_data
+        original_blob_name, size, image_format = variant
+        # Sizes no smaller than the original are not stored, the full size is served for them
+        if not self.is_stored_variant(blob_name):
+            return self.fetch_full_size(original_blob_name, image_format)
+        try:
+            image_data = self.storage_manager.get_image_blob(blob_name)
+            if image_data:
+                return image_data
+        except Exception as e:
+            logger.info(f"Variant {blob_name} not in storage ({e})")
+        original_data: Optional[bytes] = self.image_cache.get(original_blob_name)
+        if not original_data:
+            return None
+        self.remember_width(original_blob_name, original_data)
+        if not self.is_stored_variant(blob_name):
+            return self.fetch_full_size(original_blob_name, image_format)
+        logger.info(f"Creating variant {blob_name}")
+        return create_variant(original_data, size, image_format)
 
-    def do_get_image(self, blob_name: str) -> Optional[Response]:
+    # The full size image in a format: the original, or the variant stored with it
+    def fetch_full_size(self, blob_name: str, image_format: str) -> Optional[bytes]:
+        return self.image_cache.get(
+            self.get_stored_variant_name(blob_name, FULL_SIZE, image_format)
+            or blob_name
+        )
+
+    # Widths of original images are noted as they are fetched
+    def remember_width(self, blob_name: str, image_data: bytes) -> None:
+        try:
+            self.image_widths[blob_name] = get_image_width(image_data)
+        except Exception as e:
+            logger.warning(f"Could not read the width of {blob_name} ({e})")
+
+    # Whether a variant is one that is stored, rather than a size no smaller than the original
+    def is_stored_variant(self, variant_name: str) -> bool:
+        stored_name: Optional[str] = self.get_stored_variant_name(
+            *parse_variant_name(variant_name)
+        )
+        return stored_name == variant_name
+
+    # Name of the variant stored for a size and format, which is the full size one for sizes no smaller
+    # than the original (if its width is known yet). None if that is the original.
+    def get_stored_variant_name(
+        self, blob_name: str, size: str, image_format: str
+    ) -> Optional[str]:
+        if blob_name in self.image_widths:
+            size = get_stored_size(size, self.image_widths[blob_name])
+        if size == FULL_SIZE and image_format == "png":
+            return None
+        return get_variant_name(blob_name, size, image_format)
+
+    # The size asked for, by name or as a width in pixels (giving the smallest size at least that wide)
+    def choose_size(self, size: str) -> str:
+        if size in VARIANT_WIDTHS:
+            return size
+        if size.isdigit():
+            for size_name, width in sorted(VARIANT_WIDTHS.items(), key=lambda s: s[1]):
+                if width >= int(size):
+                    return size_name
+        return FULL_SIZE
+
+    # The variant of an image that suits the browser best: the size asked for, in the best compressed
+    # format the browser accepts. None if the original suits it best.
+    def choose_variant(self, blob_name: str, request: Request) -> Optional[str]:
+        if not has_variants(blob_name):
+            return None
+        size: str = self.choose_size(request.args.get("size", ""))
+        accepted: Set[str] = {
+            mimetype for mimetype, quality in request.accept_mimetypes if quality > 0
+        }
+        image_format: str = next(
+            (f for f in VARIANT_FORMATS if f"image/{f}" in accepted), "png"
+        )
+        return self.get_stored_variant_name(blob_name, size, image_format)
+
+    # Generated images are named after their content, so browsers never need to check them for changes.
+    # Others (e.g. black.png, or images named after their room before that) may change.
+    def is_immutable(self, blob_name: str) -> bool:
+        return is_content_named(blob_name)
+
+    def set_cache_control(self, response: Response, blob_name: str) -> None:
+        response.cache_control.public = True
+        response.cache_control.no_cache = None
+        if self.is_immutable(blob_name):
+            response.cache_control.max_age = 365 * 24 * 60 * 60
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = self.browser_cache_max_age_secs
+
+    def do_get_image(
+        self, blob_name: str, request: Optional[Request] = None
+    ) -> Optional[Response]:
         logger.info(f"Request for image {blob_name}")
-        # Check if the image is in the folder image_container_name
-        full_image_file_path: str = path.join(self.cache_folder, blob_name)
-        if not path.exists(full_image_file_path):
-            # Download the image from Azure blob storage to the local folder
-            blob = self.storage_manager.get_image_blob(blob_name)
-            if blob:
-                with open(full_image_file_path, "wb") as f:
-                    f.write(blob)
-                    logger.info(f"Cached {blob_name} in {self.cache_folder}")
-            else:
+        # From the cache, or downloaded from storage (once, however many requests are waiting for it).
+        # A smaller or better compressed variant if that suits the browser, otherwise the original.
+        served_name: str = blob_name
+        cached_image: Optional[CachedImage] = None
+        variant_name: Optional[str] = (
+            self.choose_variant(blob_name, request) if request else None
+        )
+        if variant_name:
+            cached_image = self.image_cache.lookup(variant_name)
+            if cached_image:
+                served_name = variant_name
+        if not cached_image:
+            cached_image = self.image_cache.lookup(blob_name)
+        if not cached_image:
+            return None
+        mimetype: str = (
+            mimetypes.guess_type(served_name)[0] or "application/octet-stream"
+        )
+        response: Optional[Response] = None
+        if cached_image.file_path and request:
+            try:
+                # Sent from the file without reading it in (with sendfile, under Gunicorn).
+                # Not Modified if the browser's copy has the same ETag, or Partial Content for a Range request.
+                response = send_file(
+                    cached_image.file_path,
+                    request.environ,
+                    mimetype=mimetype,
+                    etag=cached_image.etag,
+                    conditional=True,
+                )
+            except OSError as e:
+                # Evicted since it was looked up
+                logger.warning(f"Could not send cached {served_name}: {e}")
+        if not response:
+            image_data: Optional[bytes] = cached_image.data or self.image_cache.get(
+                served_name
+            )
+            if not image_data:
                 return None
-
-        # Return actual image in the local folder
-        return send_from_directory(self.cache_folder, blob_name)
+            response = Response(image_data, mimetype=mimetype)
+            response.set_etag(cached_image.etag)
+            if request:
+                response.make_conditional(
+                    request, accept_ranges=True, complete_length=len(image_data)
+                )
+        self.set_cache_control(response, blob_name)
+        if has_variants(blob_name):
+            # Which variant is sent depends on the formats the browser accepts
+            response.vary.add("Accept")
+        return response
 
 
-# Main - start the image server with real Azure storage
+# Main - start the image server with real (Azure, or local SQLite) storage
 if __name__ == "__main__":
     logger.info("Starting up Image Server")
-    storage_manager: AzureStorageManager = AzureStorageManager(image_only=True)
+    storage_manager: StorageManager = create_storage_manager(image_only=True)
     image_server: ImageServer = ImageServer(storage_manager)
     image_server.run()
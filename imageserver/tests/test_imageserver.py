@@ -1,5 +1,16 @@
 import unittest
+import asyncio
+import tempfile
+from io import BytesIO
+from PIL import Image
+import threading
+import time
+from os import listdir, path, replace
+from unittest.mock import AsyncMock, patch
 from imageserver import ImageServer
+from image_cache import ImageCache
+from storagemanager import StorageManager
+from sqlitestoragemanager import SQLiteStorageManager
 
 
 class TestImageServer(unittest.TestCase):
@@ -10,6 +21,287 @@ class TestImageServer(unittest.TestCase):
         # Check blob is none
         self.assertIsNone(blob)
 
+    def test_caching_headers(self):
+        image_server = ImageServer(StorageManager(image_only=True))
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        image_server.image_cache = ImageCache(
+            folder.name, lambda blob_name: bytes(range(100))
+        )
+        client = image_server.app.test_client()
+
+        response = client.get("/image/corvid.room-3f2a9c1b7d4e.png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/png")
+        self.assertTrue(response.cache_control.immutable)
+        etag = response.headers["ETag"]
+
+        # The browser's copy is current
+        response = client.get(
+            "/image/corvid.room-3f2a9c1b7d4e.png", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+        # Part of the image
+        response = client.get(
+            "/image/corvid.room-3f2a9c1b7d4e.png", headers={"Range": "bytes=10-19"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, bytes(range(10, 20)))
+        self.assertEqual(response.headers["Content-Range"], "bytes 10-19/100")
+
+        # Images not named after their content may change, so are checked again after a while
+        for image_name in ("black.png", "corvid.room.png"):
+            response = client.get(f"/image/{image_name}")
+            self.assertFalse(response.cache_control.immutable)
+            self.assertEqual(response.cache_control.max_age, 3600)
+            self.assertEqual(response.headers["ETag"], etag)
+
+    def test_file_response(self):
+        image_server = ImageServer(StorageManager(image_only=True))
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        # Too big to keep in memory, so sent from the cached file
+        image_server.image_cache = ImageCache(
+            folder.name, lambda blob_name: bytes(range(100)), max_memory_bytes=200
+        )
+        client = image_server.app.test_client()
+        etag = client.get("/image/corvid.big-3f2a9c1b7d4e.png").headers["ETag"]
+        self.assertIsNotNone(
+            image_server.image_cache.lookup("corvid.big-3f2a9c1b7d4e.png").file_path
+        )
+
+        response = client.get("/image/corvid.big-3f2a9c1b7d4e.png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, bytes(range(100)))
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertFalse(response.cache_control.no_cache)
+        response.close()
+
+        response = client.get(
+            "/image/corvid.big-3f2a9c1b7d4e.png", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = client.get(
+            "/image/corvid.big-3f2a9c1b7d4e.png", headers={"Range": "bytes=90-"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, bytes(range(90, 100)))
+        response.close()
+
+    def test_variants(self):
+        original = BytesIO()
+        Image.new("RGB", (1024, 1024), (90, 60, 30)).save(original, format="png")
+        fetched = []
+
+        # Storage with only the original image, so variants are created when first asked for
+        def fetch(blob_name: str):
+            fetched.append(blob_name)
+            return original.getvalue() if blob_name == "corvid.room.png" else None
+
+        image_server = ImageServer(StorageManager(image_only=True))
+        image_server.storage_manager.get_image_blob = fetch
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        image_server.image_cache = ImageCache(folder.name, image_server.fetch_image)
+        client = image_server.app.test_client()
+
+        response = client.get(
+            "/image/corvid.room.png?size=300",
+            headers={"Accept": "image/avif,image/webp,*/*"},
+        )
+        self.assertEqual(response.mimetype, "image/avif")
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (640, 640))
+        self.assertIn("Accept", response.vary)
+        self.assertEqual(fetched, ["corvid.room.png@mobile.avif", "corvid.room.png"])
+
+        response = client.get(
+            "/image/corvid.room.png?size=thumbnail", headers={"Accept": "image/webp"}
+        )
+        self.assertEqual(response.mimetype, "image/webp")
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (256, 256))
+
+        # Resized, but as PNG for browsers that accept neither format
+        response = client.get("/image/corvid.room.png?size=mobile")
+        self.assertEqual(response.mimetype, "image/png")
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (640, 640))
+
+        # The original
+        response = client.get("/image/corvid.room.png")
+        self.assertEqual(response.data, original.getvalue())
+        # The original was only fetched from storage once
+        self.assertEqual(fetched.count("corvid.room.png"), 1)
+
+    def test_sizes_no_smaller_than_original(self):
+        original = BytesIO()
+        Image.new("RGB", (1024, 1024), (90, 60, 30)).save(original, format="png")
+        fetched = []
+
+        def fetch(blob_name: str):
+            fetched.append(blob_name)
+            return original.getvalue() if blob_name == "corvid.room.png" else None
+
+        image_server = ImageServer(StorageManager(image_only=True))
+        image_server.storage_manager.get_image_blob = fetch
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        image_server.image_cache = ImageCache(folder.name, image_server.fetch_image)
+        client = image_server.app.test_client()
+        avif = {"Accept": "image/avif"}
+
+        # Desktop size is wider than the original, so it is the same as the full size
+        response = client.get("/image/corvid.room.png?size=desktop", headers=avif)
+        self.assertEqual(response.mimetype, "image/avif")
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (1024, 1024))
+        self.assertIn("corvid.room.png@full.avif", fetched)
+
+        # Now the original's width is known, such sizes go straight to the full size
+        fetched.clear()
+        for size in ("desktop", "1280", "1024"):
+            response = client.get(f"/image/corvid.room.png?size={size}", headers=avif)
+            self.assertEqual(Image.open(BytesIO(response.data)).size, (1024, 1024))
+        response = client.get("/image/corvid.room.png?size=desktop")
+        self.assertEqual(response.data, original.getvalue())
+        self.assertEqual(fetched, [])
+
+    def test_prefetching(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        storage_manager = SQLiteStorageManager(path.join(folder.name, "unittest.db"))
+        self.addCleanup(storage_manager.close)
+        image = BytesIO()
+        Image.new("RGB", (1024, 1024), (90, 60, 30)).save(image, format="png")
+        for world_name, image_name in (
+            ("unittest", "hall.png"),
+            ("unittest", "cellar.png"),
+            ("other", "hall.png"),
+        ):
+            storage_manager.store_image(world_name, image_name, image.getvalue())
+        storage_manager.store_image("unittest", "hall.png@thumbnail.webp", b"webp")
+
+        image_server = ImageServer(storage_manager)
+        image_server.image_cache = ImageCache(
+            path.join(folder.name, "cache"), image_server.fetch_image
+        )
+        image_server.prefetch_variants = [("mobile", "webp")]
+
+        # All the images of the world, with the variants usually asked for
+        image_server.prewarm_world("unittest")
+        self.assertEqual(
+            sorted(image_server.image_cache.disk),
+            [
+                "unittest.cellar.png",
+                "unittest.cellar.png@mobile.webp",
+                "unittest.hall.png",
+                "unittest.hall.png@mobile.webp",
+            ],
+        )
+
+        # Hinted images are fetched in the background
+        asyncio.run(image_server.image_prefetch_hint({"images": ["other.hall.png"]}))
+        image_server.prefetch_pool.shutdown(wait=True)
+        self.assertIn("other.hall.png@mobile.webp", image_server.image_cache.disk)
+        # Only the variant that was not prefetched has to be fetched when asked for
+        misses = image_server.image_cache.misses
+        client = image_server.app.test_client()
+        response = client.get("/image/other.hall.png?size=mobile")
+        self.assertEqual(response.mimetype, "image/png")
+        client.get(
+            "/image/other.hall.png?size=mobile", headers={"Accept": "image/webp"}
+        )
+        self.assertEqual(image_server.image_cache.misses, misses + 1)
+
+    @patch("imageserver.MessageBrokerHelper")
+    def test_prefetch_hints_shared_between_workers(self, mock_mbh_class):
+        mock_mbh_class.return_value.set_up_nats = AsyncMock()
+        mock_mbh_class.return_value.nc.is_connected = False
+        image_server = ImageServer(StorageManager(image_only=True))
+        asyncio.run(image_server.receive_prefetch_hints())
+        # Worker processes share the disk cache, so each hint is only fetched by one of them
+        queue = mock_mbh_class.call_args.args[2]["image_prefetch_hint"]
+        self.assertEqual(queue["queue_group"], "imageserver")
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.fetched = []
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    # Stand-in for storage: every image is 100 bytes
+    def fetch(self, blob_name: str):
+        self.fetched.append(blob_name)
+        time.sleep(0.05)
+        return b"x" * 100
+
+    def test_single_fetch(self):
+        image_cache = ImageCache(self.folder.name, self.fetch)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(image_cache.get("a.png")))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Ten requests at once, but only one fetch
+        self.assertEqual(self.fetched, ["a.png"])
+        self.assertEqual(results, [b"x" * 100] * 10)
+        self.assertEqual(image_cache.get("a.png"), b"x" * 100)
+        self.assertEqual(image_cache.memory_hits, 1)
+
+    def test_shared_folder(self):
+        # Two processes sharing the folder fetch the same image at once
+        image_cache = ImageCache(self.folder.name, self.fetch)
+        other_cache = ImageCache(self.folder.name, self.fetch)
+        other_results = []
+
+        # The other process fetches and caches the image between this one writing it and renaming it
+        def replace_after_other_fetch(source, destination):
+            if not other_results:
+                other_results.append(None)
+                other_results[0] = other_cache.get("a.png")
+            replace(source, destination)
+
+        with patch("image_cache.replace", side_effect=replace_after_other_fetch):
+            self.assertEqual(image_cache.get("a.png"), b"x" * 100)
+        self.assertEqual(other_results, [b"x" * 100])
+        self.assertEqual(listdir(self.folder.name), ["a.png"])
+
+    def test_eviction(self):
+        image_cache = ImageCache(
+            self.folder.name, self.fetch, max_memory_bytes=400, max_disk_bytes=300
+        )
+        for name in ("a.png", "b.png", "c.png"):
+            image_cache.get(name)
+        image_cache.get("a.png")
+        image_cache.get("d.png")
+        # b was least recently used, so is only still in memory
+        self.assertEqual(sorted(listdir(self.folder.name)), ["a.png", "c.png", "d.png"])
+        self.assertEqual(list(image_cache.memory), ["b.png", "c.png", "a.png", "d.png"])
+        image_cache.get("e.png")
+        self.assertNotIn("b.png", image_cache.memory)
+        self.assertLessEqual(image_cache.memory_bytes, 400)
+
+        # A restart finds what is on disk
+        restarted = ImageCache(self.folder.name, self.fetch, max_disk_bytes=300)
+        self.assertEqual(restarted.disk_bytes, 300)
+        self.fetched = []
+        restarted.get("e.png")
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(restarted.disk_hits, 1)
+
+    def test_missing_and_invalid(self):
+        image_cache = ImageCache(self.folder.name, lambda blob_name: None)
+        self.assertIsNone(image_cache.get("none.png"))
+        self.assertEqual(listdir(self.folder.name), [])
+        self.assertIsNone(image_cache.get("../secret.png"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -9,6 +9,9 @@ logger = set_up_logger()
 
 # Animal class
 class Animal(Entity):
+
+    __slots__ = ("action_chance", "move_chance", "actions")
+
     def __init__(
         self,
         world: "World",
@@ -0,0 +1,315 @@
+# Offline benchmark of Orchestrator command throughput and latency.
+# Drives a real Orchestrator through an in-memory stand-in for NATS and the base (in-memory) StorageManager,
+# with simulated players issuing scripted commands while animals wander about.
+# Usage (from the orchestrator folder, with common on the PYTHONPATH):
+#   python benchmark.py --players 20 --animals 10 --commands 100
+from utils import set_up_logger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from os import environ
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+# Logging is kept quiet by default so it doesn't dominate the timings
+logger = set_up_logger("Benchmark", environ.get("BENCHMARK_LOG_LEVEL", "WARNING"))
+
+from messagebroker_helper import MessageBrokerHelper
+from storagemanager import StorageManager
+from orchestrator import Orchestrator
+
+# Commands each simulated player picks from
+DEFAULT_SCRIPT: List[str] = [
+    "look",
+    "north",
+    "south",
+    "east",
+    "west",
+    "say Hello everyone!",
+    "get all",
+    "drop all",
+    "inventory",
+    "wait",
+]
+
+
+# A received message as seen by MessageBrokerHelper.global_callback
+class InMemoryMessage:
+    def __init__(self, subject: str, data: bytes) -> None:
+        self.subject: str = subject
+        self.data: bytes = data
+
+
+# Stand-in for the NATS client which keeps everything in process and counts traffic
+class InMemoryNatsClient:
+    def __init__(self) -> None:
+        self.is_connected: bool = False
+        self.subscriptions: Dict[str, Callable] = {}
+        self.published_count: int = 0
+        self.flush_count: int = 0
+
+    async def connect(self, servers: Optional[List[str]] = None) -> None:
+        self.is_connected = True
+
+    async def subscribe(self, subject: str, queue: str = "", cb: Callable = None):
+        self.subscriptions[subject] = cb
+
+    async def unsubscribe(self, subject: str) -> None:
+        self.subscriptions.pop(subject, None)
+
+    async def publish(self, subject: str, data: bytes) -> None:
+        self.published_count += 1
+        # Nothing else in process subscribes to what the Orchestrator publishes,
+        # but deliver anyway in case it ever does
+        if subject in self.subscriptions:
+            await self.subscriptions[subject](InMemoryMessage(subject, data))
+
+    async def flush(self) -> None:
+        self.flush_count += 1
+
+    async def close(self) -> None:
+        self.is_connected = False
+
+
+# MessageBrokerHelper that talks to the in-memory client rather than a NATS server
+class InMemoryMessageBrokerHelper(MessageBrokerHelper):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.nc: InMemoryNatsClient = InMemoryNatsClient()
+
+    # Deliver a message to the Orchestrator as if it had arrived from NATS
+    async def deliver(self, queue: str, data: Dict[str, Any]) -> None:
+        await self.nc.subscriptions[queue](
+            InMemoryMessage(queue, json.dumps(data).encode())
+        )
+
+
+class OrchestratorBenchmark:
+
+    def __init__(
+        self,
+        world_name: str = "jaysgame",
+        players: int = 10,
+        animals: int = 5,
+        commands: int = 50,
+        animal_every: int = 10,
+        script: Optional[List[str]] = None,
+        seed: int = 0,
+        room_subjects: bool = False,
+    ) -> None:
+        self.world_name: str = world_name
+        self.players: int = players
+        self.animals: int = animals
+        # Commands per player
+        self.commands: int = commands
+        # Animals move once every this many commands (across all players)
+        self.animal_every: int = animal_every
+        self.script: List[str] = script or DEFAULT_SCRIPT
+        self.random: random.Random = random.Random(seed)
+        # Publish room-local messages once per room rather than once per person
+        self.room_subjects: bool = room_subjects
+
+        # Per-command measurements: (latency in seconds, messages published, flushes)
+        self.samples: List[Tuple[float, int, int]] = []
+        self.command_count: int = 0
+        # Environment variables as they were before set_up, restored by tear_down
+        self.saved_environ: Dict[str, Optional[str]] = {}
+
+    def set_up(self) -> None:
+        self.saved_environ = {
+            name: environ.get(name)
+            for name in (
+                "ORCHESTRATOR_HOSTNAME",
+                "ORCHESTRATOR_PORT",
+                "IMAGESERVER_HOSTNAME",
+                "IMAGESERVER_PORT",
+                "MODEL_NAME",
+                "ANIMALS_ACTIVE",
+                "TRANSLATION_CACHE_FILE",
+                "ROOM_SUBJECTS",
+            )
+        }
+        # The message broker helper is never connected to a real server
+        environ.setdefault("ORCHESTRATOR_HOSTNAME", "localhost")
+        environ.setdefault("ORCHESTRATOR_PORT", "4222")
+        environ.setdefault("IMAGESERVER_HOSTNAME", "localhost")
+        environ.setdefault("IMAGESERVER_PORT", "5000")
+        # AI, and the random animal moves, are kept out of the measurements
+        environ.pop("MODEL_NAME", None)
+        environ["ANIMALS_ACTIVE"] = "False"
+        environ.setdefault("TRANSLATION_CACHE_FILE", "")
+        environ["ROOM_SUBJECTS"] = str(self.room_subjects)
+
+        self.orchestrator: Orchestrator = Orchestrator(
+            self.world_name,
+            mbh_class=InMemoryMessageBrokerHelper,
+            storage_manager=StorageManager(),
+        )
+        self.mbh: InMemoryMessageBrokerHelper = self.orchestrator.mbh
+        world = self.orchestrator.world_manager.world
+
+        # Add animals that always do something when their turn comes
+        rooms: List[str] = sorted(world.rooms.keys())
+        for i in range(self.animals):
+            world.spawn_entity(
+                {
+                    "type": "animal",
+                    "name": f"Benchmark Animal {i}",
+                    "location": self.random.choice(rooms),
+                    "description": "A restless animal used for benchmarking",
+                    "actions": ["sniffs the air", "scratches its ear", "yawns"],
+                    "action_chance": 1.0,
+                }
+            )
+
+    # Put the environment back as it was before set_up
+    def tear_down(self) -> None:
+        for name, value in self.saved_environ.items():
+            if value is None:
+                environ.pop(name, None)
+            else:
+                environ[name] = value
+        self.saved_environ = {}
+
+    # Person names must be alphabetical, so number players with letters (a, b, ... z, ba, bb...)
+    def get_player_name(self, player_number: int) -> str:
+        letters: str = ""
+        while True:
+            player_number, remainder = divmod(player_number, 26)
+            letters = chr(ord("a") + remainder) + letters
+            if not player_number:
+                return "Player" + letters
+
+    async def join_players(self) -> None:
+        await self.orchestrator.start_orchestrating()
+        for i in range(self.players):
+            await self.mbh.deliver(
+                "set_user_name",
+                {
+                    "user_id": f"player{i}",
+                    "name": self.get_player_name(i),
+                    "role": "player",
+                },
+            )
+        # Animals are moved by the benchmark itself, at a predictable rate
+        self.orchestrator.world_manager.deactivate_background_loop()
+
+    async def run_player(self, player_number: int) -> None:
+        for _ in range(self.commands):
+            user_input: str = self.random.choice(self.script)
+            published_before: int = self.mbh.nc.published_count
+            flushes_before: int = self.mbh.nc.flush_count
+            start_time: float = time.perf_counter()
+            await self.mbh.deliver(
+                "user_action",
+                {"user_id": f"player{player_number}", "user_input": user_input},
+            )
+            self.samples.append(
+                (
+                    time.perf_counter() - start_time,
+                    self.mbh.nc.published_count - published_before,
+                    self.mbh.nc.flush_count - flushes_before,
+                )
+            )
+            self.command_count += 1
+            if self.animal_every and self.command_count % self.animal_every == 0:
+                async with self.mbh.buffered_publishing():
+                    await self.orchestrator.world_manager.move_animals()
+            # Let other players in between commands, as they would be with a real server
+            await asyncio.sleep(0)
+
+    async def run(self) -> Dict[str, float]:
+        await self.join_players()
+        start_time: float = time.perf_counter()
+        await asyncio.gather(
+            *(self.run_player(player_number) for player_number in range(self.players))
+        )
+        elapsed_time: float = time.perf_counter() - start_time
+        published_total: int = self.mbh.nc.published_count
+        self.orchestrator.clean_up()
+        return self.get_results(elapsed_time, published_total)
+
+    def get_results(
+        self, elapsed_time: float, published_total: int
+    ) -> Dict[str, float]:
+        latencies_ms: List[float] = [sample[0] * 1000 for sample in self.samples]
+        # Percentile cut points 1..99
+        percentiles: List[float] = statistics.quantiles(
+            latencies_ms, n=100, method="inclusive"
+        )
+        return {
+            "players": self.players,
+            "animals": self.animals,
+            "commands": len(self.samples),
+            "elapsed_secs": elapsed_time,
+            "commands_per_sec": len(self.samples) / elapsed_time,
+            "latency_p50_ms": percentiles[49],
+            "latency_p95_ms": percentiles[94],
+            "latency_p99_ms": percentiles[98],
+            "latency_max_ms": max(latencies_ms),
+            "messages_per_command": statistics.mean(
+                sample[1] for sample in self.samples
+            ),
+            "flushes_per_command": statistics.mean(
+                sample[2] for sample in self.samples
+            ),
+            "messages_total": published_total,
+        }
+
+
+def print_results(results: Dict[str, float]) -> None:
+    print(
+        f"{results['players']} players, {results['animals']} animals, {results['commands']} commands "
+        + f"in {results['elapsed_secs']:.2f}s"
+    )
+    print(f"Throughput:           {results['commands_per_sec']:.1f} commands/sec")
+    print(
+        f"Latency (ms):         p50 {results['latency_p50_ms']:.3f}, p95 {results['latency_p95_ms']:.3f}, "
+        + f"p99 {results['latency_p99_ms']:.3f}, max {results['latency_max_ms']:.3f}"
+    )
+    print(f"Messages per command: {results['messages_per_command']:.2f}")
+    print(f"Flushes per command:  {results['flushes_per_command']:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Orchestrator offline")
+    parser.add_argument("--world", default="jaysgame", help="World data to load")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--animals", type=int, default=5)
+    parser.add_argument("--commands", type=int, default=50, help="Commands per player")
+    parser.add_argument(
+        "--animal-every", type=int, default=10, help="Move animals every N commands"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--room-subjects",
+        action="store_true",
+        help="Publish room-local messages once per room",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmark: OrchestratorBenchmark = OrchestratorBenchmark(
+        world_name=args.world,
+        players=args.players,
+        animals=args.animals,
+        commands=args.commands,
+        animal_every=args.animal_every,
+        seed=args.seed,
+        room_subjects=args.room_subjects,
+    )
+    benchmark.set_up()
+    try:
+        results: Dict[str, float] = asyncio.run(benchmark.run())
+    finally:
+        benchmark.tear_down()
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from typing import Dict, List, Optional, Tuple
+from difflib import SequenceMatcher
+from utils import set_up_logger
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Local, deterministic correction of typos in person input (e.g. "noth", "lok at lmp", "go kichen").
+# Only confident corrections are returned, anything else is left for the AI to translate.
+class CommandResolver:
+
+    def __init__(
+        self,
+        world_manager: "WorldManager",
+        command_functions: Dict[str, Dict],
+        synonyms: Dict[str, str],
+        directions: List[str],
+    ) -> None:
+        self.world_manager: "WorldManager" = world_manager
+        self.directions: List[str] = directions
+
+        # Minimum similarity for a correction, and how far ahead of the runner-up it must be
+        self.min_similarity: float = 0.75
+        self.min_margin: float = 0.1
+        # Words shorter than this are too ambiguous to correct
+        self.min_word_length: int = 3
+
+        # Words that can be corrected to a command, mapped to the command they mean.
+        # Hidden commands (no description) are never guessed at.
+        self.verbs: Dict[str, str] = {}
+        for command, data in command_functions.items():
+            if data.get("description"):
+                self.verbs[command] = command
+        for synonym, command in synonyms.items():
+            if command in self.verbs or command in directions:
+                self.verbs[synonym] = command
+        for direction in directions:
+            self.verbs[direction] = direction
+
+        # Commands whose argument names something in the room or inventory
+        self.object_commands: Tuple[str, ...] = ("look", "get", "drop", "buy", "sell")
+        # Words that can precede the name of the thing
+        self.object_prefixes: Tuple[str, ...] = ("at ", "the ", "up ", "to ")
+        # Only input meant for a command that moves the person, names something present or takes no argument
+        # is corrected. Other commands still count when matching, so that a word closer to one of them
+        # is left alone, e.g. "shut the door" must not become a shout to everyone.
+        self.correctable_commands: Tuple[str, ...] = (
+            tuple(directions) + ("go", "inventory", "help") + self.object_commands
+        )
+
+    # Return the unique best match for a word among the candidates (mapped to what they mean)
+    def best_match(self, word: str, candidates: Dict[str, str]) -> Optional[str]:
+        if word in candidates:
+            return candidates[word]
+        if len(word) < self.min_word_length:
+            return None
+        scores: Dict[str, float] = {}
+        for candidate, meaning in candidates.items():
+            score: float = SequenceMatcher(None, word, candidate).ratio()
+            # Several candidates can mean the same thing, keep the best score for each meaning
+            if score > scores.get(meaning, 0):
+                scores[meaning] = score
+        ranked: List[Tuple[str, float]] = sorted(
+            scores.items(), key=lambda item: item[1], reverse=True
+        )
+        if not ranked or ranked[0][1] < self.min_similarity:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.min_margin:
+            # Too close to call
+            return None
+        return ranked[0][0]
+
+    # Names of things the person could be referring to
+    def get_visible_names(self, person: "Person") -> List[str]:
+        location: str = person.get_current_location()
+        names: List[str] = [
+            item.get_name()
+            for item in self.world_manager.world.get_room_items(location)
+        ]
+        names += [item.get_name() for item in person.get_inventory()]
+        for merchant in self.world_manager.get_entities("merchant", location):
+            names += [item.get_name() for item in merchant.get_inventory()]
+        names += [
+            str(entity.name)
+            for entity in self.world_manager.get_others_in_room(
+                location, person.user_id
+            )
+        ]
+        return names
+
+    # Correct the name of the thing a command refers to, or None if not confident.
+    # Matching ignores case, but input that needs no correction is returned as it was typed.
+    def resolve_object(self, person: "Person", rest_of_response: str) -> Optional[str]:
+        prefix: str = ""
+        for object_prefix in self.object_prefixes:
+            if rest_of_response.lower().startswith(object_prefix):
+                prefix += rest_of_response[: len(object_prefix)]
+                rest_of_response = rest_of_response[len(object_prefix) :]
+        object_name: str = rest_of_response.lower()
+        if object_name in ("", "all", "everything", "*"):
+            return prefix + rest_of_response
+
+        names: List[str] = self.get_visible_names(person)
+        lower_names: Dict[str, str] = {name.lower(): name for name in names}
+        # Already matches as far as the command is concerned
+        if any(object_name in name for name in lower_names):
+            return prefix + rest_of_response
+
+        # Match against whole names, then against the individual words in names
+        match: Optional[str] = self.best_match(object_name, lower_names)
+        if not match and " " not in object_name:
+            word_candidates: Dict[str, str] = {}
+            for lower_name, name in lower_names.items():
+                for word in lower_name.split():
+                    word_candidates.setdefault(word, name)
+            match = self.best_match(object_name, word_candidates)
+        if match:
+            return prefix + match
+        return None
+
+    # Correct a direction or exit room name, or None if not confident
+    def resolve_destination(self, person: "Person", destination: str) -> Optional[str]:
+        if destination in self.directions:
+            return destination
+        candidates: Dict[str, str] = {
+            direction: direction for direction in self.directions
+        }
+        for direction, room_name in self.world_manager.world.rooms[
+            person.get_current_location()
+        ].exits.items():
+            candidates[room_name.lower()] = direction
+            # Allow e.g. "kitchen" for "Test Kitchen", as long as the word doesn't point two ways
+            for word in room_name.lower().split():
+                if len(word) >= self.min_word_length:
+                    if candidates.setdefault(word, direction) != direction:
+                        candidates[word] = ""
+        # Allow e.g. "go to the kitchen"
+        for object_prefix in self.object_prefixes:
+            if destination.startswith(object_prefix):
+                destination = destination[len(object_prefix) :]
+        return self.best_match(destination, candidates) or None
+
+    # Try to correct an unrecognised input, returning the corrected input or None
+    def resolve(
+        self, person: "Person", command: str, rest_of_response: str
+    ) -> Optional[str]:
+        rest_of_response = rest_of_response.strip()
+        # Only matched in lower case, the input itself keeps its case (e.g. the name of a new room)
+        lower_rest: str = rest_of_response.lower()
+
+        # Input that names a neighbouring room or direction on its own, e.g. "kitchen"
+        if not rest_of_response:
+            direction: Optional[str] = self.resolve_destination(person, command)
+            if direction:
+                return direction
+
+        verb: Optional[str] = self.best_match(command, self.verbs)
+        if verb not in self.correctable_commands:
+            return None
+
+        if verb in self.directions:
+            return verb if not rest_of_response else None
+        if verb == "go":
+            direction = self.resolve_destination(person, lower_rest)
+            return f"go {direction}" if direction else None
+        if verb in self.object_commands:
+            resolved_object: Optional[str] = self.resolve_object(
+                person, rest_of_response
+            )
+            if resolved_object is None:
+                return None
+            return f"{verb} {resolved_object}".strip()
+        # Anything else (e.g. inventory) takes no argument
+        return verb if not rest_of_response else None
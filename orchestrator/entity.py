@@ -1,12 +1,25 @@
 from typing import List, Optional
 from utils import set_up_logger
 from worlditem import WorldItem
+from item_index import ItemIndex
+from storedobject import StoredObject
 
 # Set up logger
 logger = set_up_logger()
 
 
-class Entity:
+class Entity(StoredObject):
+
+    __slots__ = (
+        "name",
+        "role",
+        "is_person",
+        "user_id",
+        "description",
+        "location",
+        "inventory",
+        "world",
+    )
 
     def __init__(
         self,
@@ -26,7 +39,7 @@ class Entity:
         self.location: str = location or world.get_location()
 
         # Inventory
-        self.inventory: List[WorldItem] = []
+        self.inventory: ItemIndex = ItemIndex()
 
         # Register this entity in the world it belongs in
         world.register_entity(self)
@@ -36,8 +49,10 @@ class Entity:
 
     # Setter for person's location change
     def set_location(self, next_room: str) -> None:
-        # Set new room
+        # Set new room, keeping the world's index of room occupants up to date
+        previous_room: str = self.location
         self.location = next_room
+        self.world.move_occupant(self, previous_room, next_room)
         # Store change of location
         self.world.storage_manager.store_world_object(self.world.name, self)
 
@@ -70,15 +85,11 @@ class Entity:
         dropped_items = []
         if isinstance(item_name, str):
             # Check if item is in inventory
-            for item in self.inventory.copy():
-                if (
-                    item_name.lower() in item.get_name().lower()
-                    or item_name.lower() == "all"
-                ):
-                    self.drop_item(item, dropped_items)
+            for item in self.inventory.find_all(item_name):
+                self.drop_item(item, dropped_items)
         return dropped_items
 
-    def get_inventory(self) -> List[WorldItem]:
+    def get_inventory(self) -> ItemIndex:
         return self.inventory
 
     def get_inventory_description(self) -> str:
@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from bisect import bisect_left, insort
+from itertools import count
+from worlditem import WorldItem
+
+
+# The items in one place (a room, or an entity's inventory), indexed by name.
+# Used like the list it replaces (append, remove, iterate), with fast lookup by full name,
+# by the start of any word in the name ("clo" finds "grandfather clock"), or by any part of it.
+class ItemIndex:
+
+    def __init__(self, items: Optional[Iterable[WorldItem]] = None) -> None:
+        # Items by identity, in the order they were added
+        self.items: Dict[int, WorldItem] = {}
+        # Lower case name and order added of each item, by identity
+        self.names: Dict[int, str] = {}
+        self.order: Dict[int, int] = {}
+        self.counter: count = count()
+        # Items by lower case name, in the order they were added
+        self.by_name: Dict[str, Dict[int, WorldItem]] = {}
+        # Sorted (rest of the name from the start of each word, order added, identity), for prefix searches
+        self.word_starts: List[Tuple[str, int, int]] = []
+        for item in items or []:
+            self.append(item)
+
+    # The name from the start of each of its words
+    def get_word_starts(self, name: str) -> List[str]:
+        return [
+            name[i:]
+            for i in range(len(name))
+            if name[i] != " " and (i == 0 or name[i - 1] == " ")
+        ]
+
+    def append(self, item: WorldItem) -> None:
+        identity: int = id(item)
+        if identity in self.items:
+            return
+        name: str = item.get_name().lower()
+        self.items[identity] = item
+        self.names[identity] = name
+        self.order[identity] = next(self.counter)
+        self.by_name.setdefault(name, {})[identity] = item
+        for word_start in self.get_word_starts(name):
+            insort(self.word_starts, (word_start, self.order[identity], identity))
+
+    def remove(self, item: WorldItem) -> None:
+        identity: int = id(item)
+        if identity not in self.items:
+            raise ValueError(f"{item.name} is not here")
+        del self.items[identity]
+        name: str = self.names.pop(identity)
+        order: int = self.order.pop(identity)
+        del self.by_name[name][identity]
+        if not self.by_name[name]:
+            del self.by_name[name]
+        for word_start in self.get_word_starts(name):
+            del self.word_starts[
+                bisect_left(self.word_starts, (word_start, order, identity))
+            ]
+
+    # Find an item by name: "all" gives the first item, then an exact match is preferred,
+    # then the earliest item with a word starting with the name, then any item whose name contains it
+    def find(self, item_name: str, exact_match: bool = False) -> Optional[WorldItem]:
+        if not item_name:
+            return None
+        item_name = item_name.lower()
+        if item_name == "all":
+            return next(iter(self.items.values()), None)
+        named: Optional[Dict[int, WorldItem]] = self.by_name.get(item_name)
+        if named:
+            return next(iter(named.values()))
+        if exact_match:
+            return None
+        earliest: Optional[Tuple[int, int]] = None
+        i: int = bisect_left(self.word_starts, (item_name,))
+        while i < len(self.word_starts) and self.word_starts[i][0].startswith(
+            item_name
+        ):
+            if earliest is None or self.word_starts[i][1:] < earliest:
+                earliest = self.word_starts[i][1:]
+            i += 1
+        if earliest is not None:
+            return self.items[earliest[1]]
+        for identity, name in self.names.items():
+            if item_name in name:
+                return self.items[identity]
+        return None
+
+    # All the items whose name contains the given name, or all items for "all"
+    def find_all(self, item_name: str) -> List[WorldItem]:
+        item_name = item_name.lower()
+        if item_name == "all":
+            return list(self.items.values())
+        return [
+            self.items[identity]
+            for identity, name in self.names.items()
+            if item_name in name
+        ]
+
+    def copy(self) -> List[WorldItem]:
+        return list(self.items.values())
+
+    # Iterate over a copy, so items can be moved elsewhere while iterating
+    def __iter__(self) -> Iterator[WorldItem]:
+        return iter(self.copy())
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: object) -> bool:
+        return id(item) in self.items
@@ -9,6 +9,9 @@ logger = set_up_logger()
 
 # Merchant class
 class Merchant(Entity):
+
+    __slots__ = ()
+
     def __init__(
         self,
         world: "World",
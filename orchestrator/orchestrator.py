@@ -6,17 +6,29 @@ from sys import argv
 import time
 from os import path, makedirs
 import asyncio
+import re
 
 # Set up logger before importing other own modules
 logger = set_up_logger("Orchestrator")
 
-from azurestoragemanager import AzureStorageManager
+from storagemanager import StorageManager
+from storagefactory import create_storage_manager
 from worldmanager import WorldManager
 from person import Person
 from user_input_processor import UserInputProcessor
-from messagebroker_helper import MessageBrokerHelper
+from messagebroker_helper import MessageBrokerHelper, MessageBrokerNamespace
+from shard_map import ShardMap
 from shutdownexception import ShutdownException
 
+# Queues to and from the back-end services which serve every world hosted in a process
+SHARED_QUEUES: Tuple[str, ...] = (
+    "image_creation_request",
+    "image_creation_response",
+    "image_prefetch_hint",
+    "ai_request",
+    "ai_response",
+)
+
 
 class Orchestrator:
     """Manage interactions between Front End / AI agents and all the back-end services"""
@@ -72,7 +84,17 @@ class Orchestrator:
         user_id: str = data["user_id"]
         user_input: str = data["user_input"]
 
-        if user_id in self.world_manager.people:
+        if user_id in self.world_manager.handing_off:
+            # Held back until the shard the person is moving to has confirmed it has them
+            self.world_manager.handing_off[user_id]["user_actions"].append(data)
+        elif user_id in self.world_manager.handed_off:
+            # Sent before the shard router heard the person had moved shard - pass it on
+            await self.mbh.publish(
+                "shard_user_action",
+                data,
+                str(self.world_manager.handed_off[user_id]),
+            )
+        elif user_id in self.world_manager.people:
             person: Person = self.world_manager.people[user_id]
             logger.info(
                 f"Received user action: {user_input} from {user_id} ({person.name})"
@@ -162,61 +184,149 @@ class Orchestrator:
                 person.name, "[AI response]", response_to_person
             )
 
+        elif self.world_manager.shard_map:
+            # Every shard hears every AI response, most are for other shards
+            logger.info(f"Ignoring AI response for another shard: {data}")
         else:
             exit(logger, f"Valid request ID not found: data {data}")
 
+    # Person handed over from another shard
+    async def shard_handoff(self, data: Dict) -> None:
+        logger.info(f"Received shard handoff for {data['user_id']}")
+        await self.world_manager.receive_person(data)
+
+    # Another shard has taken over (or refused) a person handed over by this one
+    async def shard_handoff_response(self, data: Dict) -> None:
+        logger.info(f"Received shard handoff response for {data['user_id']}")
+        await self.world_manager.finish_handoff(data)
+
+    # Rooms built or changed on another shard
+    async def shard_room_update(self, data: Dict) -> None:
+        self.world_manager.receive_room_changes(data)
+
     # End of event handlers
 
     # Constructor
-    def __init__(self, world_name: str) -> None:
+    # The message broker class and storage manager can be swapped out e.g. for benchmarking.
+    # If hosted alongside other worlds, the host's message broker and storage manager are shared.
+    def __init__(
+        self,
+        world_name: str,
+        mbh_class: type = MessageBrokerHelper,
+        storage_manager: Optional[StorageManager] = None,
+        shared_mbh: Optional[MessageBrokerHelper] = None,
+    ) -> None:
+
+        # Optionally share the world with other orchestrators, each looking after the rooms in some regions of the grid
+        shard_count: int = int(environ.get("ORCHESTRATOR_SHARD_COUNT", 1))
+        self.shard_id: int = int(environ.get("ORCHESTRATOR_SHARD_ID", 0))
+        self.shard_map: Optional[ShardMap] = None
+        if shard_count > 1:
+            self.shard_map = ShardMap(
+                shard_count, int(environ.get("ORCHESTRATOR_SHARD_REGION_SIZE", 8))
+            )
+            logger.info(f"Running as shard {self.shard_id} of {shard_count}")
 
         # Set up the message broker
         logger.info("Setting up message broker")
-        self.mbh = MessageBrokerHelper(
-            get_critical_env_variable("ORCHESTRATOR_HOSTNAME"),
-            get_critical_env_variable("ORCHESTRATOR_PORT"),
-            {
-                # Client messages
-                "instructions": {"mode": "publish"},
-                "name_invalid": {"mode": "publish"},
-                "room_update": {"mode": "publish"},
-                "world_update": {"mode": "publish"},
-                "world_data_update": {"mode": "publish"},
-                "logout": {"mode": "publish"},
-                # Image creation
-                "image_creation_request": {"mode": "publish"},
-                "image_creation_response": {
-                    "mode": "subscribe",
-                    "callback": self.image_creation_response,
-                },
-                # General AI requests
-                "ai_request": {"mode": "publish"},
-                "ai_response": {"mode": "subscribe", "callback": self.ai_response},
-                # Summon person
-                "summon_agent_request": {"mode": "publish"},
-                "summon_agent_response": {
-                    "mode": "subscribe",
-                    "callback": self.summon_agent_response,
-                },
-                "user_disconnect": {
-                    "mode": "subscribe",
-                    "callback": self.user_disconnect,
-                },
-                "set_user_name": {"mode": "subscribe", "callback": self.set_user_name},
-                "user_action": {"mode": "subscribe", "callback": self.user_action},
+        queue_map: Dict[str, Dict] = {
+            # Client messages
+            "instructions": {"mode": "publish"},
+            "name_invalid": {"mode": "publish"},
+            "room_update": {"mode": "publish"},
+            "world_update": {"mode": "publish"},
+            # Room-local messages, if published per room (room.<world>.<room>)
+            "room": {"mode": "publish"},
+            "world_data_update": {"mode": "publish"},
+            "logout": {"mode": "publish"},
+            # Image creation
+            "image_creation_request": {"mode": "publish"},
+            "image_creation_response": {
+                "mode": "subscribe",
+                "callback": self.image_creation_response,
             },
-        )
+            "image_prefetch_hint": {"mode": "publish"},
+            # General AI requests
+            "ai_request": {"mode": "publish"},
+            "ai_response": {"mode": "subscribe", "callback": self.ai_response},
+            # Summon person
+            "summon_agent_request": {"mode": "publish"},
+            "summon_agent_response": {
+                "mode": "subscribe",
+                "callback": self.summon_agent_response,
+            },
+            "user_disconnect": {
+                "mode": "subscribe",
+                "callback": self.user_disconnect,
+            },
+            "set_user_name": {"mode": "subscribe", "callback": self.set_user_name},
+            "user_action": {"mode": "subscribe", "callback": self.user_action},
+        }
+        if self.shard_map:
+            # Person messages come via the shard router, on this shard's own subjects
+            for queue_name in ("user_disconnect", "set_user_name", "user_action"):
+                queue_map[f"shard_{queue_name}.{self.shard_id}"] = queue_map.pop(
+                    queue_name
+                )
+            queue_map[f"shard_handoff.{self.shard_id}"] = {
+                "mode": "subscribe",
+                "callback": self.shard_handoff,
+            }
+            queue_map[f"shard_handoff_response.{self.shard_id}"] = {
+                "mode": "subscribe",
+                "callback": self.shard_handoff_response,
+            }
+            queue_map["shard_room_update"] = {
+                "mode": "subscribe",
+                "callback": self.shard_room_update,
+            }
+            queue_map["shard_handoff"] = {"mode": "publish"}
+            queue_map["shard_handoff_response"] = {"mode": "publish"}
+            queue_map["shard_route"] = {"mode": "publish"}
+            queue_map["shard_user_action"] = {"mode": "publish"}
+            queue_map["shard_user_disconnect"] = {"mode": "publish"}
+        self.hosted: bool = shared_mbh is not None
+        if self.hosted:
+            # This world's subjects are prefixed with its namespace (e.g. jaysgame.user_action),
+            # and the host passes on the responses from shared back-end services
+            for queue_name in SHARED_QUEUES:
+                queue_map.pop(queue_name)
+            self.mbh = MessageBrokerNamespace(
+                shared_mbh, get_world_namespace(world_name), queue_map
+            )
+        else:
+            self.mbh = mbh_class(
+                get_critical_env_variable("ORCHESTRATOR_HOSTNAME"),
+                get_critical_env_variable("ORCHESTRATOR_PORT"),
+                queue_map,
+                # Flush the messages published by each event handler once, when it completes
+                buffer_callback_publishes=True,
+            )
         logger.info("Message broker set up")
 
         logger.info(f"Starting up world manager - world '{world_name}'")
-        storage_manager: AzureStorageManager = AzureStorageManager()
+        if not storage_manager:
+            storage_manager = create_storage_manager(
+                # Write-behind keeps storage round trips off the event loop
+                write_behind=environ.get("STORAGE_WRITE_BEHIND", "True").lower()
+                == "true",
+                # Optional local snapshots for fast restarts
+                snapshot_folder=environ.get("STORAGE_SNAPSHOT_FOLDER", ""),
+            )
+        self.storage_manager: StorageManager = storage_manager
         self.world_manager: WorldManager = WorldManager(
             self.mbh,
-            storage_manager,
+            self.storage_manager,
             world_name=world_name,
             model_name=environ.get("MODEL_NAME"),
             landscape=environ.get("LANDSCAPE_DESCRIPTION"),
             animals_active=environ.get("ANIMALS_ACTIVE", "True").lower() == "true",
+            room_subjects=environ.get("ROOM_SUBJECTS", "False").lower() == "true",
+            shard_map=self.shard_map,
+            shard_id=self.shard_id,
+            shard_handoff_timeout=float(
+                environ.get("ORCHESTRATOR_SHARD_HANDOFF_TIMEOUT_SECS", 10)
+            ),
         )
 
         # User transcript management
@@ -238,6 +348,16 @@ class Orchestrator:
         for user_name, f in self.user_transcripts.items():
             f.close()
             logger.info(f"Closed transcript file for {user_name}")
+        # Keep AI translations for next time
+        self.user_input_processor.translation_cache.save()
+        # Make sure all world changes are stored (the host does this for hosted worlds)
+        if not self.hosted:
+            self.storage_manager.close()
+
+
+# Prefix for a hosted world's subjects
+def get_world_namespace(world_name: str) -> str:
+    return re.sub(r"[^a-z0-9_-]+", "_", world_name.lower())
 
 
 async def main() -> None:
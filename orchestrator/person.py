@@ -12,6 +12,17 @@ logger = set_up_logger()
 
 # Person class
 class Person(Entity):
+
+    __slots__ = (
+        "money",
+        "seen_rooms",
+        "max_input_history_length",
+        "input_history",
+        "max_inventory",
+        "last_login",
+        "last_action_time",
+    )
+
     def __init__(
         self,
         world: Any,
@@ -43,7 +54,9 @@ class Person(Entity):
 
         if stored_user_data:
             logger.info(f"Retrieved person {user_name} data from database")
-            self.__dict__.update(stored_user_data)
+            self.load_dict(stored_user_data)
+            # Only changes from here on need storing
+            self.mark_stored()
             # But use latest user_id and make world object
             self.user_id = user_id
             self.world = world
@@ -136,7 +149,8 @@ class Person(Entity):
 
     # Override for person's location change
     def set_location(self, next_room: str) -> None:
+        # Flag this room as seen, first so that it is stored with the change of location
+        self.seen_rooms[next_room] = True
+        self.mark_changed("seen_rooms")
         # Superclass behaviour
         super().set_location(next_room)
-        # Also flag this room as seen
-        self.seen_rooms[self.location] = True
@@ -1,12 +1,25 @@
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
 from utils import set_up_logger, exit
+from storedobject import StoredObject
 
 # Set up logger
 logger = set_up_logger()
 
 
 # Person class
-class Room:
+class Room(StoredObject):
+
+    __slots__ = (
+        "name",
+        "description",
+        "exits",
+        "creator",
+        "image",
+        "grid_reference",
+        "x",
+        "y",
+        "world",
+    )
 
     def __init__(
         self,
@@ -20,7 +33,7 @@ class Room:
         grid_reference: Optional[str] = None,
     ) -> None:
         if init_dict:
-            self.__dict__.update(init_dict)
+            self.load_dict(init_dict)
             # Create blank image if not provided
             if not hasattr(self, "image"):
                 self.image = None
@@ -36,3 +49,14 @@ class Room:
         self.world: "World" = world
 
         logger.debug(f"Creating room {self.name}")
+
+    # Position on the world grid. The string form is kept for storage.
+    def set_coordinates(self, x: int, y: int) -> None:
+        self.x: int = x
+        self.y: int = y
+        self.grid_reference: str = f"{x},{y}"
+
+    def get_coordinates(self) -> Optional[Tuple[int, int]]:
+        if not hasattr(self, "x"):
+            return None
+        return (self.x, self.y)
@@ -0,0 +1,37 @@
+from typing import Optional, Tuple
+from utils import set_up_logger
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Assignment of a world's rooms to orchestrator shards, by region of the grid.
+# Every orchestrator shard and the shard router build the same map from the same settings,
+# so they agree on which shard owns each room without needing to talk to each other.
+class ShardMap:
+
+    def __init__(self, shard_count: int, region_size: int = 8) -> None:
+        if shard_count < 1:
+            raise ValueError(f"Shard count must be at least 1, not {shard_count}")
+        self.shard_count: int = shard_count
+        # Regions are squares of this many rooms along each side
+        self.region_size: int = region_size
+
+    # Region of the grid a position is in
+    def get_region(self, x: int, y: int) -> Tuple[int, int]:
+        return x // self.region_size, y // self.region_size
+
+    # Shard that owns a position. Regions are spread across shards by a fixed hash,
+    # so neighbouring regions usually belong to different shards.
+    def get_shard_for_coordinates(self, x: int, y: int) -> int:
+        region_x, region_y = self.get_region(x, y)
+        return ((region_x * 73856093) ^ (region_y * 19349663)) % self.shard_count
+
+    # Shard that owns a room. Rooms which are not on the grid belong to the first shard.
+    def get_shard_for_room(self, world: "World", room_name: str) -> int:
+        coordinates: Optional[Tuple[int, int]] = None
+        if room_name in world.rooms:
+            coordinates = world.rooms[room_name].get_coordinates()
+        if not coordinates:
+            return 0
+        return self.get_shard_for_coordinates(*coordinates)
@@ -0,0 +1,137 @@
+# Set up logger first
+from utils import set_up_logger, get_critical_env_variable
+from typing import Dict, Any, Optional
+from os import environ
+from sys import argv
+import asyncio
+
+# Set up logger before importing other own modules
+logger = set_up_logger("ShardRouter")
+
+from storagemanager import StorageManager
+from storagefactory import create_storage_manager
+from messagebroker_helper import MessageBrokerHelper
+from shard_map import ShardMap
+from world import World
+from shutdownexception import ShutdownException
+
+
+class ShardRouter:
+    """Route person messages to the orchestrator shard that owns the room the person is in"""
+
+    # Event handlers
+
+    # New person - send them to the shard that owns the room they will start in
+    async def set_user_name(self, data: Dict[str, Any]) -> None:
+        user_id: str = data["user_id"]
+        shard: int = self.shard_map.get_shard_for_room(
+            self.world, self.get_start_location(data.get("name", ""))
+        )
+        logger.info(f"Routing new person {user_id} to shard {shard}")
+        self.routes[user_id] = shard
+        await self.mbh.publish("shard_set_user_name", data, str(shard))
+
+    async def user_action(self, data: Dict[str, Any]) -> None:
+        await self.mbh.publish(
+            "shard_user_action", data, str(self.get_route(data["user_id"]))
+        )
+
+    async def user_disconnect(self, data: Dict[str, Any]) -> None:
+        await self.mbh.publish(
+            "shard_user_disconnect", data, str(self.get_route(data["user_id"]))
+        )
+        self.routes.pop(data["user_id"], None)
+
+    # A shard has handed a person over to another shard
+    async def shard_route(self, data: Dict[str, Any]) -> None:
+        logger.info(f"Routing {data['user_id']} to shard {data['shard']}")
+        self.routes[data["user_id"]] = int(data["shard"])
+
+    # A shard has built or changed rooms, which may change which shard people start on
+    async def shard_room_update(self, data: Dict[str, Any]) -> None:
+        self.world.apply_room_changes(data["rooms"], data["deleted_rooms"])
+
+    # End of event handlers
+
+    def __init__(
+        self,
+        world_name: str,
+        storage_manager: Optional[StorageManager] = None,
+    ) -> None:
+        self.shard_map: ShardMap = ShardMap(
+            int(get_critical_env_variable("ORCHESTRATOR_SHARD_COUNT")),
+            int(environ.get("ORCHESTRATOR_SHARD_REGION_SIZE", 8)),
+        )
+        self.storage_manager: StorageManager = (
+            storage_manager or create_storage_manager()
+        )
+        # Only the rooms are needed, to know which shard owns them
+        self.world: World = World(world_name, self.storage_manager, mode="router")
+
+        # Shard each person is currently routed to, by user ID
+        self.routes: Dict[str, int] = {}
+
+        self.mbh = MessageBrokerHelper(
+            get_critical_env_variable("ORCHESTRATOR_HOSTNAME"),
+            get_critical_env_variable("ORCHESTRATOR_PORT"),
+            {
+                # Messages from clients, passed on to the right shard
+                "set_user_name": {"mode": "subscribe", "callback": self.set_user_name},
+                "user_action": {"mode": "subscribe", "callback": self.user_action},
+                "user_disconnect": {
+                    "mode": "subscribe",
+                    "callback": self.user_disconnect,
+                },
+                "shard_set_user_name": {"mode": "publish"},
+                "shard_user_action": {"mode": "publish"},
+                "shard_user_disconnect": {"mode": "publish"},
+                # Updates from shards when people move between them
+                "shard_route": {"mode": "subscribe", "callback": self.shard_route},
+                "shard_room_update": {
+                    "mode": "subscribe",
+                    "callback": self.shard_room_update,
+                },
+            },
+        )
+
+    # Where a person will start: where they last were if they have played before, otherwise the default
+    def get_start_location(self, user_name: str) -> str:
+        stored_user_data: Optional[Dict[str, Any]] = (
+            self.storage_manager.get_world_object(
+                self.world.name,
+                object_type="Person",
+                rowkey_value=user_name.strip().title(),
+            )
+        )
+        if stored_user_data and stored_user_data.get("location") in self.world.rooms:
+            return stored_user_data["location"]
+        return self.world.get_location()
+
+    # Unknown people go to the first shard, which will tell them to log in again
+    def get_route(self, user_id: str) -> int:
+        if user_id not in self.routes:
+            logger.warning(f"No route for {user_id}")
+        return self.routes.get(user_id, 0)
+
+    async def start_routing(self) -> None:
+        await self.mbh.set_up_nats()
+
+
+async def main() -> None:
+    # Get world name from command line or environment variable
+    world_name: str
+    if len(argv) > 1:
+        world_name = argv[1]
+    else:
+        world_name = environ.get("ORCHESTRATOR_WORLD_NAME", "corvid")
+
+    shard_router: ShardRouter = ShardRouter(world_name)
+    try:
+        await shard_router.start_routing()
+        await asyncio.Event().wait()  # Keeps the event loop running
+    except ShutdownException as e:
+        logger.critical(f"Shutdown initiated: {e}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
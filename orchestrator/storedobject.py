@@ -0,0 +1,73 @@
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+# Superclass for world objects kept in storage (rooms, items, entities).
+# Each subclass declares its fields in __slots__, so instances have no per-object dict.
+# Tracks the fields changed since the object was last stored or loaded, so only those need writing.
+class StoredObject:
+
+    # changed_fields is None until the object is known to match storage, meaning it has to be stored in full.
+    # extra_fields keeps any stored values the object has no field for, so they are not lost when it is stored again.
+    __slots__ = ("changed_fields", "extra_fields")
+
+    # Fields that are not stored, so changes to them don't count
+    untracked_fields: Tuple[str, ...] = (
+        "world",
+        "inventory",
+        "input_history",
+        "changed_fields",
+        "extra_fields",
+    )
+
+    # Keys in stored data that are derived when storing, so not loaded into fields
+    storage_keys: Tuple[str, ...] = ("PartitionKey", "RowKey", "world")
+
+    # All the fields of each subclass, including those of its superclasses
+    fields: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        fields: Dict[str, None] = {}
+        for klass in reversed(cls.__mro__):
+            for field in klass.__dict__.get("__slots__", ()):
+                if field not in StoredObject.__slots__:
+                    fields[field] = None
+        cls.fields = tuple(fields)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        changed_fields: Optional[Set[str]] = getattr(self, "changed_fields", None)
+        if (
+            changed_fields is not None
+            and name not in self.untracked_fields
+            and getattr(self, name, StoredObject) != value
+        ):
+            changed_fields.add(name)
+        object.__setattr__(self, name, value)
+
+    # Set fields from stored (or default) data
+    def load_dict(self, data: Dict[str, Any]) -> None:
+        for key, value in data.items():
+            if key in self.fields:
+                object.__setattr__(self, key, value)
+            elif key not in self.storage_keys:
+                if not hasattr(self, "extra_fields"):
+                    object.__setattr__(self, "extra_fields", {})
+                self.extra_fields[key] = value
+
+    # The object's values as a dict, leaving out references to other objects
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = dict(getattr(self, "extra_fields", {}))
+        for field in self.fields:
+            if field not in ("world", "inventory") and hasattr(self, field):
+                data[field] = getattr(self, field)
+        return data
+
+    # Fields changed in place (e.g. a dict of exits) are not seen by __setattr__, so must be flagged
+    def mark_changed(self, field: str) -> None:
+        changed_fields: Optional[Set[str]] = getattr(self, "changed_fields", None)
+        if changed_fields is not None:
+            changed_fields.add(field)
+
+    # The object now matches what is stored
+    def mark_stored(self) -> None:
+        object.__setattr__(self, "changed_fields", set())
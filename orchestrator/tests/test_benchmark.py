@@ -0,0 +1,38 @@
+import unittest
+import asyncio
+from os import environ
+from unittest.mock import patch
+from benchmark import OrchestratorBenchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_benchmark_runs_offline(self):
+        benchmark = OrchestratorBenchmark(
+            world_name="mansion", players=3, animals=2, commands=5, animal_every=2
+        )
+        benchmark.set_up()
+        self.addCleanup(benchmark.tear_down)
+        results = asyncio.run(benchmark.run())
+        self.assertEqual(results["commands"], 15)
+        self.assertGreater(results["commands_per_sec"], 0)
+        self.assertLessEqual(results["latency_p50_ms"], results["latency_p99_ms"])
+        # Every command gets at least the echo of the person's input
+        self.assertGreaterEqual(results["messages_per_command"], 1)
+
+    @patch.dict(environ, {"MODEL_NAME": "some-model", "ANIMALS_ACTIVE": "True"})
+    def test_environment_restored(self):
+        environ.pop("ROOM_SUBJECTS", None)
+        benchmark = OrchestratorBenchmark(
+            world_name="mansion", players=1, animals=0, commands=1, room_subjects=True
+        )
+        benchmark.set_up()
+        self.assertNotIn("MODEL_NAME", environ)
+        self.assertEqual(environ["ROOM_SUBJECTS"], "True")
+        benchmark.tear_down()
+        self.assertEqual(environ["MODEL_NAME"], "some-model")
+        self.assertEqual(environ["ANIMALS_ACTIVE"], "True")
+        self.assertNotIn("ROOM_SUBJECTS", environ)
+
+
+if __name__ == "__main__":
+    unittest.main()
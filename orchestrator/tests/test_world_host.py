@@ -0,0 +1,82 @@
+import unittest
+import asyncio
+from os import environ
+from typing import List
+from storagemanager import StorageManager
+from benchmark import InMemoryMessageBrokerHelper
+from world_host import WorldHost
+
+
+class TestWorldHost(unittest.TestCase):
+    def setUp(self) -> None:
+        environ.setdefault("ORCHESTRATOR_HOSTNAME", "localhost")
+        environ.setdefault("ORCHESTRATOR_PORT", "4222")
+        environ.setdefault("IMAGESERVER_HOSTNAME", "localhost")
+        environ.setdefault("IMAGESERVER_PORT", "5000")
+        environ.pop("MODEL_NAME", None)
+        environ["ANIMALS_ACTIVE"] = "False"
+        environ["TRANSLATION_CACHE_FILE"] = ""
+        self.world_host = WorldHost(
+            ["mansion", "unittest"],
+            mbh_class=InMemoryMessageBrokerHelper,
+            storage_manager=StorageManager(),
+        )
+
+    def test_worlds_share_connection_and_storage(self):
+        mansion = self.world_host.orchestrators["mansion"]
+        unittest_world = self.world_host.orchestrators["unittest"]
+        self.assertIs(mansion.mbh.mbh, unittest_world.mbh.mbh)
+        self.assertIs(
+            mansion.storage_manager,
+            unittest_world.storage_manager,
+        )
+
+    def test_subjects_namespaced_per_world(self):
+        async def run() -> List[str]:
+            mbh = self.world_host.mbh
+            await self.world_host.start_hosting()
+            self.assertIn("mansion.user_action", mbh.nc.subscriptions)
+            self.assertIn("unittest.user_action", mbh.nc.subscriptions)
+            # Shared back-end services are not namespaced
+            self.assertIn("ai_response", mbh.nc.subscriptions)
+
+            published: List[str] = []
+            publish = mbh.nc.publish
+
+            async def record_publish(subject: str, data: bytes) -> None:
+                published.append(subject)
+                await publish(subject, data)
+
+            mbh.nc.publish = record_publish
+            await mbh.deliver(
+                "mansion.set_user_name",
+                {"user_id": "jay", "name": "Jay", "role": "player"},
+            )
+            for orchestrator in self.world_host.orchestrators.values():
+                orchestrator.world_manager.deactivate_background_loop()
+            return published
+
+        published = asyncio.run(run())
+        self.assertIn("mansion.instructions.jay", published)
+        # Except hints to the image server, which is shared by all the worlds
+        self.assertIn("image_prefetch_hint", published)
+        self.assertTrue(
+            all(
+                subject.startswith("mansion.")
+                for subject in published
+                if subject != "image_prefetch_hint"
+            )
+        )
+        self.assertIn(
+            "jay", self.world_host.orchestrators["mansion"].world_manager.people
+        )
+        self.assertNotIn(
+            "jay", self.world_host.orchestrators["unittest"].world_manager.people
+        )
+
+    def tearDown(self) -> None:
+        self.world_host.clean_up()
+
+
+if __name__ == "__main__":
+    unittest.main()
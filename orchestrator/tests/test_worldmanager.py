@@ -3,7 +3,14 @@ from worldmanager import WorldManager
 from person import Person
 from storagemanager import StorageManager
 from user_input_processor import UserInputProcessor
+from translation_cache import TranslationCache
+from worlditem import WorldItem
+from room import Room
+from shard_map import ShardMap
+from messagebroker_helper import MessageBrokerHelper, current_publish_buffer
 import asyncio
+from unittest.mock import AsyncMock, patch
+from os import environ
 
 
 class Testworldmanager(unittest.TestCase):
@@ -44,6 +51,420 @@ class Testworldmanager(unittest.TestCase):
         # Check min length of description
         self.assertGreater(len(description), 28, "Description too short")
 
+    def test_room_occupancy_index(self):
+        world = self.world_manager.world
+        start_room = self.person.get_current_location()
+        # People are only indexed once they are registered as being in the world
+        self.assertNotIn(self.person, world.get_people_in_room(start_room))
+        self.world_manager.register_person(
+            self.person.user_id, self.person, self.person.name
+        )
+        self.assertIn(self.person, world.get_people_in_room(start_room))
+
+        # Moving updates the index for both rooms
+        world.add_room(
+            self.person, start_room, "north", "Test Annex", "A test annex.", "0,1"
+        )
+        self.person.set_location("Test Annex")
+        self.assertNotIn(self.person, world.get_people_in_room(start_room))
+        self.assertEqual(world.get_people_in_room("Test Annex"), [self.person])
+        self.assertEqual(
+            self.world_manager.get_others_in_room("Test Annex", self.person.user_id),
+            [],
+        )
+
+    def test_command_resolver(self):
+        world = self.world_manager.world
+        start_room = self.person.get_current_location()
+        world.add_room(
+            self.person, start_room, "north", "Test Kitchen", "A test kitchen.", "0,1"
+        )
+        world.add_item_to_room(
+            WorldItem(world, "brass lamp", "A shiny lamp.", location=start_room),
+            start_room,
+        )
+        resolver = self.user_input_processor.command_resolver
+        for user_input, expected in (
+            ("noth", "north"),
+            ("lok at lmp", "look at brass lamp"),
+            ("go kichen", "go north"),
+            ("kitchen", "north"),
+            ("tke lamp", "get lamp"),
+            # Only the command is matched in lower case, the rest keeps its case
+            ("lok at LAMP", "look at LAMP"),
+            ("invntory", "inventory"),
+        ):
+            command, rest_of_response = self.user_input_processor.parse_user_input(
+                user_input
+            )
+            self.assertEqual(
+                resolver.resolve(self.person, command, rest_of_response), expected
+            )
+        # Not confident, so left for the AI
+        for user_input in (
+            "dance wildly",
+            "lok at the unicorn",
+            "quti",
+            "tak lamp",
+            # Free text and broadcast commands are never guessed at
+            "shut the door",
+            "shot",
+            "shuot Where is EVERYONE?",
+            "bulid west 'Secluded Clearing' 'A quiet clearing.'",
+        ):
+            command, rest_of_response = self.user_input_processor.parse_user_input(
+                user_input
+            )
+            self.assertIsNone(resolver.resolve(self.person, command, rest_of_response))
+        # Corrected input is processed without an AI request
+        command_function, _, _ = asyncio.run(
+            self.user_input_processor.process_user_input(self.person, "lok")
+        )
+        self.assertEqual(command_function, self.world_manager.do_look)
+
+    def test_room_render_cache(self):
+        world = self.world_manager.world
+        room = self.person.get_current_location()
+        description = world.get_room_description(room)
+        # Served from the cache the second time
+        self.assertIs(world.get_room_description(room), description)
+
+        # Each mutation invalidates the cached text
+        world.add_item_to_room(
+            WorldItem(world, "brass lamp", "A shiny lamp.", location=room), room
+        )
+        self.assertIn("brass lamp", world.get_room_description(room))
+        world.update_room_description(room, "A freshly painted test room.")
+        self.assertIn("freshly painted", world.get_room_description(room))
+        world.add_room(self.person, room, "north", "Test Attic", "A test attic.", "0,1")
+        self.assertIn("north: Test Attic", world.get_room_exits_description(room))
+        world.remove_item_from_room(world.search_item("brass lamp", room), room)
+        self.assertNotIn("brass lamp", world.get_room_description(room))
+        world.delete_room("Test Attic")
+        self.assertNotIn("Test Attic", world.get_room_description(room))
+
+    def test_grid_index(self):
+        world = self.world_manager.world
+        room = self.person.get_current_location()
+        x, y = world.rooms[room].get_coordinates()
+        world.add_room(
+            self.person, room, "north", "Test Loft", "A test loft.", f"{x},{y + 1}"
+        )
+        self.assertEqual(world.get_rooms_at(x, y + 1), ["Test Loft"])
+        self.assertEqual(world.get_neighbouring_rooms(room)["north"], ["Test Loft"])
+        self.assertNotIn("north", world.get_room_build_options(room))
+        world.delete_room("Test Loft")
+        self.assertEqual(world.get_rooms_at(x, y + 1), [])
+
+        # A long corridor of rooms is placed without recursing through it
+        world.grid_references = {}
+        corridor_length = 20000
+        rooms = {}
+        for i in range(corridor_length):
+            exits = {}
+            if i > 0:
+                exits["west"] = f"Corridor {i - 1}"
+            if i < corridor_length - 1:
+                exits["east"] = f"Corridor {i + 1}"
+            rooms[f"Corridor {i}"] = Room(world, f"Corridor {i}", "A corridor.", exits)
+        world.add_grid_references(rooms, "Corridor 0", rooms["Corridor 0"], 0, 0)
+        self.assertEqual(
+            rooms[f"Corridor {corridor_length - 1}"].get_coordinates(),
+            (corridor_length - 1, 0),
+        )
+        self.assertEqual(rooms["Corridor 5"].grid_reference, "5,0")
+        self.assertEqual(len(world.grid_references), corridor_length)
+
+    def test_room_subjects(self):
+        self.world_manager.mbh = AsyncMock()
+        room = self.person.get_current_location()
+        listener = Person(self.world_manager.world, "listener", "Listener")
+        for person in (self.person, listener):
+            self.world_manager.register_person(person.user_id, person, person.name)
+        self.assertRegex(
+            self.world_manager.get_room_subject("Dark Room's End"),
+            r"^unittest_[0-9a-f]{8}\.dark_room_s_end_[0-9a-f]{8}$",
+        )
+        # Names that only differ in characters NATS doesn't allow still get their own subject
+        self.assertNotEqual(
+            self.world_manager.get_room_subject("Tom's Shop"),
+            self.world_manager.get_room_subject("Tom_s Shop"),
+        )
+
+        # By default, a message is published to each other person in the room
+        asyncio.run(self.world_manager.tell_room(room, "Hello", self.person.user_id))
+        self.world_manager.mbh.publish_many.assert_awaited_once_with(
+            [("world_update", "Hello", "listener")]
+        )
+
+        # With room subjects, once for the room
+        self.world_manager.room_subjects = True
+        asyncio.run(self.world_manager.tell_room(room, "Hello", self.person.user_id))
+        self.world_manager.mbh.publish.assert_awaited_once_with(
+            "room",
+            {"message": "Hello", "exclude": [self.person.user_id]},
+            self.world_manager.get_room_subject(room),
+        )
+        self.world_manager.remove_person(listener.user_id, "Cleanup after testing")
+
+    def test_shard_handoff(self):
+        shard_map = ShardMap(2, region_size=1)
+        self.assertEqual(shard_map.get_shard_for_coordinates(0, 0), 0)
+        self.assertEqual(shard_map.get_shard_for_coordinates(0, 1), 1)
+
+        # Two shards of the same world
+        shards = []
+        for shard_id in (0, 1):
+            shards.append(
+                WorldManager(
+                    mbh=AsyncMock(),
+                    storage_manager=self.storage_manager,
+                    world_name="unittest",
+                    shard_map=shard_map,
+                    shard_id=shard_id,
+                )
+            )
+        start_room = shards[0].world.get_location()
+
+        # A room built to the north by the first shard is owned by the second, which is told about it
+        asyncio.run(
+            shards[0].build_room(
+                self.person, start_room, "north", "Test Tower", "A tower.", "0,1"
+            )
+        )
+        self.assertNotIn("Test Tower", shards[1].world.rooms)
+        room_update = shards[0].mbh.publish.await_args_list[-1]
+        self.assertEqual(room_update.args[0], "shard_room_update")
+        shards[1].receive_room_changes(room_update.args[1])
+        self.assertEqual(shards[1].world.get_exits("Test Tower"), ["south"])
+        self.assertEqual(
+            shards[1].world.get_next_room(start_room, "north"), "Test Tower"
+        )
+        self.assertTrue(shards[0].owns_room(start_room))
+        self.assertFalse(shards[0].owns_room("Test Tower"))
+        self.assertTrue(shards[1].owns_room("Test Tower"))
+
+        person = Person(shards[0].world, "walker", "Walker")
+        shards[0].register_person(person.user_id, person, person.name)
+        item = WorldItem(shards[0].world, "brass lamp", "A lamp.", location=person.name)
+        person.add_item(item)
+
+        # Moving north hands the person, and what they carry, over to the other shard.
+        # They stay on this shard until it confirms it has them.
+        self.assertEqual(asyncio.run(shards[0].move_entity(person, "north")), "")
+        self.assertIn("walker", shards[0].people)
+        self.assertIn("walker", shards[0].handing_off)
+        handoff = shards[0].mbh.publish.await_args_list[-1]
+        self.assertEqual(handoff.args[0], "shard_handoff")
+        self.assertEqual(handoff.args[2], "1")
+        shards[0].handing_off["walker"]["user_actions"].append(
+            {"user_id": "walker", "user_input": "look"}
+        )
+
+        asyncio.run(shards[1].receive_person(handoff.args[1]))
+        arrived = shards[1].people["walker"]
+        self.assertEqual(arrived.get_current_location(), "Test Tower")
+        self.assertEqual([i.name for i in arrived.get_inventory()], ["brass lamp"])
+        self.assertIn(arrived, shards[1].world.get_people_in_room("Test Tower"))
+        shards[1].mbh.publish.assert_any_await(
+            "shard_route", {"user_id": "walker", "shard": 1}
+        )
+        shards[1].mbh.publish.assert_any_await(
+            "shard_handoff_response",
+            {"user_id": "walker", "accepted": True, "shard": 1},
+            "0",
+        )
+
+        # Once confirmed, the person leaves the first shard and what they sent meanwhile is passed on
+        asyncio.run(
+            shards[0].finish_handoff(
+                {"user_id": "walker", "accepted": True, "shard": 1}
+            )
+        )
+        self.assertNotIn("walker", shards[0].people)
+        self.assertNotIn("walker", shards[0].handing_off)
+        self.assertEqual(shards[0].handed_off, {"walker": 1})
+        shards[0].mbh.publish.assert_any_await(
+            "shard_user_action", {"user_id": "walker", "user_input": "look"}, "1"
+        )
+
+    def test_shard_handoff_room_missing(self):
+        shard_map = ShardMap(2, region_size=1)
+        shards = [
+            WorldManager(
+                mbh=AsyncMock(),
+                storage_manager=self.storage_manager,
+                world_name="unittest",
+                shard_map=shard_map,
+                shard_id=shard_id,
+            )
+            for shard_id in (0, 1)
+        ]
+        start_room = shards[0].world.get_location()
+        shards[0].world.add_room(
+            self.person, start_room, "north", "Test Tower", "A tower.", "0,1"
+        )
+        person = Person(shards[0].world, "walker", "Walker")
+        shards[0].register_person(person.user_id, person, person.name)
+        asyncio.run(shards[0].move_entity(person, "north"))
+        handoff = shards[0].mbh.publish.await_args_list[-1].args[1]
+
+        # The other shard refuses a person arriving in a room it doesn't know about
+        del handoff["room"]
+        asyncio.run(shards[1].receive_person(handoff))
+        self.assertNotIn("walker", shards[1].people)
+        response = shards[1].mbh.publish.await_args_list[-1]
+        self.assertEqual(response.args[0], "shard_handoff_response")
+        self.assertFalse(response.args[1]["accepted"])
+        self.assertEqual(response.args[2], "0")
+
+        # So the person stays where they were
+        asyncio.run(shards[0].finish_handoff(response.args[1]))
+        self.assertIs(shards[0].people["walker"], person)
+        self.assertEqual(person.get_current_location(), start_room)
+        self.assertEqual(shards[0].handing_off, {})
+        self.assertEqual(shards[0].handed_off, {})
+
+    def test_changed_fields(self):
+        start_room = self.person.get_current_location()
+        # Not known to be stored yet, so stored in full
+        self.assertIsNone(self.storage_manager.get_changed_fields(self.person))
+        self.person.mark_stored()
+
+        # Setting a field to the value it already has is not a change
+        self.person.location = start_room
+        self.assertEqual(self.person.changed_fields, set())
+        # Nor are fields that are not stored
+        self.person.input_history = ["look"]
+        self.assertEqual(self.person.changed_fields, set())
+
+        self.person.set_location("Test Tower")
+        self.assertEqual(self.person.changed_fields, {"location", "seen_rooms"})
+        entity = self.storage_manager.get_storage_entity(
+            "unittest", self.person, self.person.changed_fields
+        )
+        self.assertEqual(
+            set(entity), {"PartitionKey", "RowKey", "world", "location", "seen_rooms"}
+        )
+        self.assertEqual(entity["RowKey"], "TestPerson")
+        self.assertNotIn(
+            "changed_fields",
+            self.storage_manager.get_storage_entity("unittest", self.person),
+        )
+
+    def test_slotted_objects(self):
+        world = self.world_manager.world
+        item = WorldItem(
+            world,
+            init_dict={
+                "PartitionKey": "unittest__WorldItem",
+                "RowKey": "Old Boot",
+                "world": "unittest",
+                "name": "Old Boot",
+                "description": "A boot.",
+                "price": 2,
+                "location": world.get_location(),
+                "colour": "brown",
+            },
+        )
+        self.assertFalse(hasattr(item, "__dict__"))
+        self.assertIs(item.world, world)
+        # Values with no field are kept, so they are stored again
+        self.assertEqual(item.to_dict()["colour"], "brown")
+        self.assertNotIn("PartitionKey", item.to_dict())
+        entity = self.storage_manager.get_storage_entity("unittest", item)
+        self.assertEqual(entity["RowKey"], "Old Boot")
+        self.assertEqual(entity["world"], "unittest")
+        self.assertEqual(entity["starting_location"], world.get_location())
+        with self.assertRaises(AttributeError):
+            item.not_a_field = True
+
+    def test_item_index(self):
+        world = self.world_manager.world
+        location = world.get_location()
+        for name in ("Lock Box", "Grandfather Clock", "Dusty Clock", "Clock"):
+            world.create_item(name, "Test item.", 1, location)
+        # An exact match comes first, then the start of a word, then any part of the name
+        self.assertEqual(world.search_item("clock", location).name, "Clock")
+        self.assertEqual(world.search_item("clo", location).name, "Grandfather Clock")
+        self.assertEqual(world.search_item("dusty c", location).name, "Dusty Clock")
+        self.assertEqual(world.search_item("ock b", location).name, "Lock Box")
+        self.assertIsNone(world.search_item("clo", location, exact_match=True))
+        self.assertIsNone(world.search_item("cuckoo", location))
+
+        # Picking up takes the item out of the room's index and into the inventory's
+        clock = world.search_item("grandfather", location)
+        self.assertEqual(clock.set_possession(self.person), "")
+        self.assertNotIn(clock, world.get_room_items(location))
+        self.assertEqual(world.search_item("clo", location).name, "Dusty Clock")
+        self.assertEqual(
+            self.world_manager.find_item_in_user_inventory(self.person, "grand"), clock
+        )
+        self.assertEqual(
+            [item.name for item in self.person.drop_items("all")], ["Grandfather Clock"]
+        )
+        self.assertEqual(world.search_item("grand", location), clock)
+
+    def test_background_loop_not_buffered(self):
+        self.world_manager.mbh = MessageBrokerHelper("localhost", 4222, {})
+        buffers = []
+
+        async def world_background_loop() -> None:
+            buffers.append(current_publish_buffer.get())
+
+        self.world_manager.world_background_loop = world_background_loop
+
+        async def run() -> None:
+            # Started by a handler whose messages are buffered
+            async with self.world_manager.mbh.buffered_publishing():
+                await self.world_manager.activate_background_loop()
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        # The loop does its own buffering, so it must not add to the handler's buffer
+        self.assertEqual(buffers, [None])
+        self.world_manager.deactivate_background_loop()
+
+    def test_prefetch_hint(self):
+        self.world_manager.mbh = AsyncMock()
+        world = self.world_manager.world
+        room = self.person.get_current_location()
+        world.rooms["Garden"] = Room(
+            world, "Garden", "A garden.", {}, image="garden.png"
+        )
+        world.rooms["Shed"] = Room(world, "Shed", "A shed.", {})
+        world.rooms[room].exits = {"north": "Garden", "south": "Shed"}
+        with patch.dict(
+            environ, {"IMAGESERVER_HOSTNAME": "localhost", "IMAGESERVER_PORT": "3002"}
+        ):
+            asyncio.run(self.world_manager.emit_user_room_update(self.person, room))
+        # The image server is told about the images of the rooms next door
+        self.world_manager.mbh.publish.assert_awaited_with(
+            "image_prefetch_hint", {"images": ["unittest.garden.png"]}
+        )
+
+    def test_translation_cache(self):
+        cache = TranslationCache(max_entries=2)
+        key = cache.make_key("Look  around!", "Road", ["north"], ["Lamp"], [])
+        # Same input and context gives the same key, whatever the case and spacing
+        self.assertEqual(
+            key, cache.make_key("look around", "Road", ["north"], ["lamp"], [])
+        )
+        # Different context gives a different key
+        self.assertNotEqual(
+            key, cache.make_key("look around", "Road", ["north"], [], [])
+        )
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "look")
+        self.assertEqual(cache.get(key), "look")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Least recently used entry is evicted
+        cache.put("b", "go north")
+        cache.get(key)
+        cache.put("c", "go south")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get(key), "look")
+
     async def test_do_say(self):
         person = Person(self.world_manager.world, 0, "TestPerson")
         description = await self.world_manager.do_say(person, "Hello")
@@ -0,0 +1,123 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from os import path
+import hashlib
+import json
+import re
+import time
+from utils import set_up_logger
+
+# Set up logger
+logger = set_up_logger()
+
+
+# Cache of AI translations of person input into commands.
+# Entries are keyed on the normalised input plus a fingerprint of what the person could see,
+# since the same words can mean different things in different places.
+class TranslationCache:
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_secs: float = 24 * 60 * 60,
+        cache_file: Optional[str] = None,
+        save_every: int = 20,
+    ) -> None:
+        self.max_entries: int = max_entries
+        self.ttl_secs: float = ttl_secs
+        self.cache_file: Optional[str] = cache_file
+        # Number of new entries after which the cache is saved to file
+        self.save_every: int = save_every
+        self.unsaved_count: int = 0
+
+        # Key -> (translation, time stored), least recently used first
+        self.entries: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+
+        # Hit / miss counters
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self.load()
+
+    # Normalise person input so trivial differences still hit the cache
+    def normalise_input(self, user_input: str) -> str:
+        user_input = re.sub(r"\s+", " ", str(user_input).lower()).strip()
+        return user_input.strip(".!?,;: ")
+
+    # Build a cache key from the input and the context the translation depends on
+    def make_key(
+        self,
+        user_input: str,
+        location: str,
+        exits: List[str],
+        visible_items: List[str],
+        inventory: List[str],
+    ) -> str:
+        context: str = "|".join(
+            (
+                str(location).lower(),
+                ",".join(sorted(str(exit).lower() for exit in exits)),
+                ",".join(sorted(str(item).lower() for item in visible_items)),
+                ",".join(sorted(str(item).lower() for item in inventory)),
+            )
+        )
+        fingerprint: str = hashlib.sha1(context.encode()).hexdigest()[:16]
+        return f"{self.normalise_input(user_input)}|{fingerprint}"
+
+    # Get a cached translation, or None if missing or expired
+    def get(self, key: str) -> Optional[str]:
+        entry: Optional[Tuple[str, float]] = self.entries.get(key)
+        if entry and time.time() - entry[1] < self.ttl_secs:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"Translation cache hit for '{key}' ({self.get_stats()})")
+            return entry[0]
+        if entry:
+            # Expired
+            del self.entries[key]
+        self.misses += 1
+        logger.info(f"Translation cache miss for '{key}' ({self.get_stats()})")
+        return None
+
+    # Store a translation, evicting the least recently used entries if full
+    def put(self, key: str, translation: str) -> None:
+        self.entries[key] = (translation, time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.unsaved_count += 1
+        if self.unsaved_count >= self.save_every:
+            self.save()
+
+    def get_stats(self) -> str:
+        lookups: int = self.hits + self.misses
+        hit_rate: float = self.hits / lookups if lookups else 0
+        return f"{self.hits} hits, {self.misses} misses, hit rate {hit_rate:.0%}, {len(self.entries)} entries"
+
+    # Warm start from the cache file, if there is one
+    def load(self) -> None:
+        if not self.cache_file or not path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r") as f:
+                stored_entries: Dict[str, List] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load translation cache {self.cache_file}: {e}")
+            return
+        now: float = time.time()
+        for key, (translation, stored_time) in stored_entries.items():
+            if now - stored_time < self.ttl_secs:
+                self.entries[key] = (translation, stored_time)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        logger.info(f"Loaded {len(self.entries)} translations from {self.cache_file}")
+
+    def save(self) -> None:
+        self.unsaved_count = 0
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(self.entries, f)
+        except OSError as e:
+            logger.error(f"Could not save translation cache {self.cache_file}: {e}")
@@ -7,6 +7,9 @@ from typing import Dict, Callable, Tuple, Optional, Union, List
 from person import Person
 from world import World
 from worldmanager import WorldManager
+from translation_cache import TranslationCache
+from command_resolver import CommandResolver
+from os import environ
 import re
 
 
@@ -16,6 +19,21 @@ class UserInputProcessor:
         self.world_manager = world_manager
         self.setup_commands()
 
+        # Corrects simple typos locally, before resorting to the AI
+        self.command_resolver: CommandResolver = CommandResolver(
+            world_manager, self.command_functions, self.synonyms, self.directions
+        )
+
+        # Cache of AI translations, so common fuzzy commands don't need a new AI request each time
+        self.translation_cache: TranslationCache = TranslationCache(
+            max_entries=int(environ.get("TRANSLATION_CACHE_SIZE", 1000)),
+            ttl_secs=float(environ.get("TRANSLATION_CACHE_TTL_SECS", 24 * 60 * 60)),
+            cache_file=environ.get(
+                "TRANSLATION_CACHE_FILE",
+                f"{world_manager.world.name}_translation_cache.json",
+            ),
+        )
+
     def setup_commands(self) -> None:
 
         self.directions = ["north", "east", "south", "west"]
@@ -232,10 +250,43 @@ class UserInputProcessor:
         rest = " ".join(words[1:])
         return verb, rest
 
+    # Build the translation cache key for some input, from what the person can see
+    def get_translation_cache_key(self, person: Person, user_input: str) -> str:
+        location: str = person.get_current_location()
+        return self.translation_cache.make_key(
+            user_input,
+            location,
+            self.world_manager.world.get_exits(location),
+            [
+                item.get_name()
+                for item in self.world_manager.world.get_room_items(location)
+            ],
+            [item.get_name() for item in person.get_inventory()],
+        )
+
+    # Resolve the command to run for an AI translation of the person's input
+    def resolve_translation(self, translation: str, user_input: str) -> str:
+        # If the AI translation is 'custom', the original input is a custom action
+        if translation == "custom":
+            if not user_input:
+                exit(logger, "Custom action requested but no context provided!")
+            translation += " " + user_input
+        return translation
+
     # Translate person input and try to process it again
     async def translate_and_process(
         self, person: Person, user_input: str
     ) -> Optional[Tuple[str, str, str]]:
+        # Use a previous translation if the same input was made in the same context
+        cache_key: str = self.get_translation_cache_key(person, user_input)
+        translation: Optional[str] = self.translation_cache.get(cache_key)
+        if translation:
+            return await self.process_user_input(
+                person,
+                self.resolve_translation(translation, user_input),
+                translated=True,
+            )
+
         # Try to translate the user input into a valid command using AI :-)
         # If output set, it shows the user something while the AI is working.
         output: str = ""  # Was: I'm trying to guess what you meant by that...
@@ -263,7 +314,7 @@ class UserInputProcessor:
             request_type="translation_request",
             prompt=prompt,
             system_message="You are a simulated world command interpreter",
-            user_context=user_input,
+            user_context={"user_input": user_input, "cache_key": cache_key},
         )
         return None, None, output
 
@@ -273,13 +324,11 @@ class UserInputProcessor:
         # Strip any leading/trailing whitespace or carriage returns
         ai_response = ai_response.strip()
         person = request_data["person"]
+        user_context: Dict[str, str] = request_data["user_context"]
         output: str = ""
         logger.info("AI translation: %s", ai_response)
-        # If the AI translation is 'custom', prompt the person for a custom action
-        if ai_response == "custom":
-            if not request_data["user_context"]:
-                exit(logger, "Custom action requested but no context provided!")
-            ai_response += " " + request_data["user_context"]
+        translation: str = ai_response
+        ai_response = self.resolve_translation(ai_response, user_context["user_input"])
         if ai_response:
             # Try to process the AI translation as a command, but only try this once
             output = (
@@ -289,6 +338,8 @@ class UserInputProcessor:
                 await self.process_user_input(person, ai_response, translated=True)
             )
             if command_function:
+                # Only remember translations that resolved to a command
+                self.translation_cache.put(user_context["cache_key"], translation)
                 # Run it
                 outcome = await command_function(*command_args)
                 return outcome
@@ -462,6 +513,17 @@ class UserInputProcessor:
         else:
             # If the command is not recognised, try to translate it using AI (unless this is already a translation)
             if not translated:
+                # Typos such as "noth" or "lok at lmp" can be corrected without asking the AI
+                resolved_input: Optional[str] = self.command_resolver.resolve(
+                    person, command, rest_of_response
+                )
+                if resolved_input:
+                    logger.info(
+                        f"Resolved '{user_input}' locally as '{resolved_input}'"
+                    )
+                    return await self.process_user_input(
+                        person, resolved_input, translated=True
+                    )
                 outcome = await self.translate_and_process(person, user_input)
                 return outcome
             # Invalid command
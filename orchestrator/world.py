@@ -3,16 +3,19 @@ from utils import set_up_logger, exit
 # Set up logger before all other imports
 logger = set_up_logger()
 
-from typing import Dict, Optional, Tuple, Any, List
+from typing import Dict, Optional, Tuple, Any, List, Callable
 from aimanager import AIManager
 from merchant import Merchant
 from room import Room
 from animal import Animal
 from worlditem import WorldItem
+from item_index import ItemIndex
 from person import Person
 from entity import Entity
 from worlditem import WorldItem
 from typing import List, Dict, Union, Optional
+from collections import deque
+from concurrent.futures import Future
 
 
 class World:
@@ -47,11 +50,28 @@ class World:
             "east": (1, 0, "west"),
             "west": (-1, 0, "east"),
         }
-        self.grid_references: Dict = {}
-        self.room_items: Dict = {}
+        # Spatial index of room names by (x, y) grid position
+        self.grid_references: Dict[Tuple[int, int], List[str]] = {}
+        # Items in each room, indexed by name
+        self.room_items: Dict[str, ItemIndex] = {}
         # Register of entities with name as key
         self.entities: Dict[str, Entity] = {}
-        self.done_path: Dict[str, bool] = {}
+        # Index of who is in each room, kept in sync as entities move
+        # People currently in the world (keyed by user_id), and other entities (keyed by name)
+        self.room_people: Dict[str, Dict[str, Person]] = {}
+        self.room_entities: Dict[str, Dict[str, Entity]] = {}
+        # Pre-rendered room text (description, exits, items etc.) keyed by room then part.
+        # Entries are dropped by the methods that change what they depend on.
+        self.room_render_cache: Dict[str, Dict[str, str]] = {}
+
+        # Start fetching every type of stored object at once. Each type is built as soon as it
+        # has arrived, in the order they depend on each other (rooms, then entities, then items)
+        self.stored_objects: Dict[str, Future] = (
+            self.storage_manager.start_getting_world_objects(
+                self.name,
+                ["Room"] if mode else ["Room", "Animal", "Merchant", "WorldItem"],
+            )
+        )
 
         # Populate dictionary of room items, keyed off room name (aka location)
         self.rooms: Dict = self.load_rooms()
@@ -80,14 +100,18 @@ class World:
         # )
         return f"Welcome to this world: {world_theme}\nYour objective for now is simply to explore and have fun!"
 
+    # Wait for the stored objects of a type, if already being fetched, otherwise get them now
+    def get_stored_objects(self, object_type: str) -> List[Dict[str, Any]]:
+        if object_type in self.stored_objects:
+            return self.stored_objects.pop(object_type).result()
+        return self.storage_manager.get_world_objects(self.name, object_type)
+
     def load_rooms(self) -> Dict[str, Room]:
 
         logger.info("Loading rooms...")
 
         # Get rooms from storage
-        rooms_list: List[Dict[str, Any]] = self.storage_manager.get_world_objects(
-            self.name, "Room"
-        )
+        rooms_list: List[Dict[str, Any]] = self.get_stored_objects("Room")
         store_default_rooms = False
         if not rooms_list:
             logger.warning("No rooms found in cloud - loading from static")
@@ -102,6 +126,8 @@ class World:
         rooms_dict: Dict[str, Room] = {}
         for room in rooms_list:
             r = Room(world=self, init_dict=room)
+            if not store_default_rooms:
+                r.mark_stored()
             rooms_dict[r.name] = r
 
         # Set default room
@@ -123,6 +149,8 @@ class World:
             )
         return rooms_dict
 
+    # Assign grid positions to all rooms reachable from the given room, walking the exits breadth first.
+    # This is iterative rather than recursive so that large worlds don't hit the recursion limit.
     def add_grid_references(
         self,
         rooms: Dict[str, Room],
@@ -130,53 +158,86 @@ class World:
         room: Room,
         x: int,
         y: int,
-        prv_direction: str = None,
-        indent: int = 0,
     ) -> None:
-        grid_ref_str: str = f"{x},{y}"
-        logger.debug(
-            " " * indent + f"Checking grid reference {grid_ref_str} at {room_name}"
-        )
-        room.grid_reference: str = grid_ref_str
-        if grid_ref_str in self.grid_references:
-            if room_name not in self.grid_references[grid_ref_str]:
-                logger.error(
-                    f"{room_name} has the same grid reference as {self.grid_references[grid_ref_str]}"
-                )
-                self.grid_references[grid_ref_str].append(room_name)
-        else:
-            # logger.info(f"Adding grid reference {grid_ref_str} to {room_name}")
-            self.grid_references[grid_ref_str] = [room_name]
-        # Go through each exit and recursively add grid references
-        for direction, next_room in room.exits.items():
-            # Get the next x and y
-            next_x: int = x + self.directions[direction][0]
-            next_y: int = y + self.directions[direction][1]
-            # Add the grid reference to the next room and recursively add grid references
-            # Keep track of each step taken so that we don't go back on ourselves
-            key: str = room_name + " " + direction
-            if not (
-                key in self.done_path
-                or (
-                    prv_direction
-                    and direction == self.get_opposite_direction(prv_direction)
-                )
-            ):
-                self.done_path[key] = True
+        positions: Dict[str, Tuple[int, int]] = {room_name: (x, y)}
+        self.index_room(room, x, y)
+        to_visit: deque = deque([room_name])
+        while to_visit:
+            current_name: str = to_visit.popleft()
+            current_x, current_y = positions[current_name]
+            for direction, next_room in rooms[current_name].exits.items():
                 if next_room not in rooms:
                     exit(
                         logger,
-                        f"Next room {next_room} not found in rooms but referenced by {room_name}",
+                        f"Next room {next_room} not found in rooms but referenced by {current_name}",
                     )
-                self.add_grid_references(
-                    rooms,
-                    next_room,
-                    rooms[next_room],
-                    next_x,
-                    next_y,
-                    direction,
-                    indent + 1,
+                next_position: Tuple[int, int] = self.get_adjacent_coordinates(
+                    current_x, current_y, direction
                 )
+                if next_room in positions:
+                    if positions[next_room] != next_position:
+                        logger.warning(
+                            f"{next_room} is {direction} of {current_name} but is already placed at {positions[next_room]}"
+                        )
+                    continue
+                positions[next_room] = next_position
+                self.index_room(rooms[next_room], *next_position)
+                to_visit.append(next_room)
+
+        # Rooms that can't be reached keep any position they were stored with
+        for other_name, other_room in rooms.items():
+            if other_name not in positions:
+                logger.warning(f"{other_name} cannot be reached from {room_name}")
+                if getattr(other_room, "grid_reference", None):
+                    self.index_room(
+                        other_room,
+                        *self.parse_grid_reference(other_room.grid_reference),
+                    )
+
+    # Grid reference strings are "x,y"
+    def parse_grid_reference(self, grid_reference: str) -> Tuple[int, int]:
+        x, y = grid_reference.split(",")
+        return int(x), int(y)
+
+    # Position one step from (x, y) in the given direction
+    def get_adjacent_coordinates(
+        self, x: int, y: int, direction: str
+    ) -> Tuple[int, int]:
+        return x + self.directions[direction][0], y + self.directions[direction][1]
+
+    # Place a room on the grid and add it to the spatial index
+    def index_room(self, room: Room, x: int, y: int) -> None:
+        room.set_coordinates(x, y)
+        occupants: List[str] = self.grid_references.setdefault((x, y), [])
+        if room.name not in occupants:
+            if occupants:
+                logger.error(f"{room.name} has the same grid reference as {occupants}")
+            occupants.append(room.name)
+
+    # Remove a room from the spatial index
+    def unindex_room(self, room: Room) -> None:
+        coordinates: Optional[Tuple[int, int]] = room.get_coordinates()
+        occupants: List[str] = self.grid_references.get(coordinates, [])
+        if room.name in occupants:
+            occupants.remove(room.name)
+            if not occupants:
+                del self.grid_references[coordinates]
+
+    # Names of the rooms at a grid position
+    def get_rooms_at(self, x: int, y: int) -> List[str]:
+        return self.grid_references.get((x, y), [])
+
+    # Rooms on the grid next to a room in each direction, whether or not there is an exit to them
+    def get_neighbouring_rooms(self, room_name: str) -> Dict[str, List[str]]:
+        x, y = self.rooms[room_name].get_coordinates()
+        neighbours: Dict[str, List[str]] = {}
+        for direction in self.directions:
+            rooms_at: List[str] = self.get_rooms_at(
+                *self.get_adjacent_coordinates(x, y, direction)
+            )
+            if rooms_at:
+                neighbours[direction] = rooms_at
+        return neighbours
 
     def get_rooms(self) -> Dict[str, Room]:
         return self.rooms
@@ -206,11 +267,11 @@ class World:
             min_y = 0
             max_y = 0
             for room in rooms:
-                if not hasattr(rooms[room], "grid_reference"):
+                coordinates: Optional[Tuple[int, int]] = rooms[room].get_coordinates()
+                if not coordinates:
                     logger.error(f"No grid reference for {room}")
                 else:
-                    x = int(rooms[room].grid_reference.split(",")[0])
-                    y = int(rooms[room].grid_reference.split(",")[1])
+                    x, y = coordinates
                     if x < min_x:
                         min_x = x
                     if x > max_x:
@@ -222,9 +283,7 @@ class World:
             # Generate the map
             for y in range(max_y, min_y - 1, -1):
                 for x in range(min_x, max_x + 1):
-                    world_map += (
-                        "&".join(self.grid_references.get(f"{x},{y}", [])) + "\t"
-                    )
+                    world_map += "&".join(self.get_rooms_at(x, y)) + "\t"
                 world_map += "\n"
             return world_map
         else:
@@ -241,37 +300,51 @@ class World:
     def get_next_room(self, location: str, direction: str) -> str:
         return self.rooms[location].exits[direction]
 
+    # Return a rendered part of a room's text, rendering it only if not already cached
+    def get_cached_render(self, room: str, part: str, render: Callable[[], str]) -> str:
+        room_cache: Dict[str, str] = self.room_render_cache.setdefault(room, {})
+        if part not in room_cache:
+            room_cache[part] = render()
+        return room_cache[part]
+
+    # Drop cached text for a room, or for all rooms if none is given
+    def invalidate_room_render(self, room: Optional[str] = None) -> None:
+        if room is None:
+            self.room_render_cache.clear()
+        else:
+            self.room_render_cache.pop(room, None)
+
     def get_room_exits_description(self, room: str) -> str:
-        exits: str = " "
-        for exit in self.rooms[room].exits:
-            if exits == " ":
-                exits += "Available exits: "
-            exits += exit + ": " + self.rooms[room].exits[exit] + "; "
-        # Replace last semicolon with a full stop
-        if exits != " ":
-            exits = exits[:-2] + "."
-        return exits
+        return self.get_cached_render(
+            room, "exits", lambda: self.render_room_exits_description(room)
+        )
+
+    def render_room_exits_description(self, room: str) -> str:
+        exits: Dict[str, str] = self.rooms[room].exits
+        if not exits:
+            return " "
+        return (
+            " Available exits: "
+            + "; ".join(f"{exit}: {exits[exit]}" for exit in exits)
+            + "."
+        )
 
     def get_room_build_options(self, location_name: str) -> str:
-        # Check that there is not already a room in this location based on the grid reference
-        # Get the grid reference of the current room
-        current_room_grid_reference: str = self.rooms[location_name].grid_reference
+        return self.get_cached_render(
+            location_name,
+            "build_options",
+            lambda: self.render_room_build_options(location_name),
+        )
 
-        build_directions: List[str] = []
-        for direction in self.directions:
-            if direction not in self.rooms[location_name].exits:
-                # Get the hypothetical x and y of this direction
-                x: int = (
-                    int(current_room_grid_reference.split(",")[0])
-                    + self.directions[direction][0]
-                )
-                y: int = (
-                    int(current_room_grid_reference.split(",")[1])
-                    + self.directions[direction][1]
-                )
-                # Check if there is already a room in this location
-                if f"{x},{y}" not in self.grid_references:
-                    build_directions.append(direction)
+    def render_room_build_options(self, location_name: str) -> str:
+        # Check that there is not already a room in this location based on the grid reference
+        neighbours: Dict[str, List[str]] = self.get_neighbouring_rooms(location_name)
+        build_directions: List[str] = [
+            direction
+            for direction in self.directions
+            if direction not in self.rooms[location_name].exits
+            and direction not in neighbours
+        ]
 
         if build_directions:
             return (
@@ -291,30 +364,57 @@ class World:
         show_exits: bool = True,
     ) -> str:
         # TODO #77 Review logic around deciding when to show build options in room description
-        description: str = ""
+        is_builder: bool = role == "builder"
+        return self.get_cached_render(
+            room,
+            f"description:{brief}:{is_builder}:{show_items}:{show_exits}",
+            lambda: self.render_room_description(
+                room, brief, is_builder, show_items, show_exits
+            ),
+        )
+
+    def render_room_description(
+        self,
+        room: str,
+        brief: bool,
+        is_builder: bool,
+        show_items: bool,
+        show_exits: bool,
+    ) -> str:
+        parts: List[str] = []
         if not brief:
             # Contents of curly brackets removed from AI description,
             # Actual brackets removed in UI
-            description = "{" + self.rooms[room].description + "\n" + "}"
+            parts.append("{" + self.rooms[room].description + "\n" + "}")
 
         if show_exits:
-            description += self.get_room_exits_description(room)
+            parts.append(self.get_room_exits_description(room))
 
         # Only show build options to builders
-        if role == "builder":
-            description += " " + self.get_room_build_options(room)
+        if is_builder:
+            parts.append(" " + self.get_room_build_options(room))
 
         if show_items:
-            description += self.get_room_items_description(room)
-        return description
+            parts.append(self.get_room_items_description(room))
+        return "".join(parts)
 
     def get_room_items_description(self, room: str, detail: bool = False) -> str:
-        description: str = ""
-        for item in self.room_items.get(room, []):
-            description += f" There is {item.get_name(article='a')} here."
-            if detail:
-                description = description[:-1] + f": {item.description}"
-        return description
+        return self.get_cached_render(
+            room,
+            f"items:{detail}",
+            lambda: self.render_room_items_description(room, detail),
+        )
+
+    def render_room_items_description(self, room: str, detail: bool) -> str:
+        if detail:
+            return "".join(
+                f" There is {item.get_name(article='a')} here: {item.description}"
+                for item in self.room_items.get(room, [])
+            )
+        return "".join(
+            f" There is {item.get_name(article='a')} here."
+            for item in self.room_items.get(room, [])
+        )
 
     def get_room_image_url(self, room_name: str) -> str:
         url: str = self.storage_manager.get_image_url(
@@ -323,6 +423,14 @@ class World:
         logger.info(f"URL for {self.rooms[room_name].name}: {url}")
         return url
 
+    # Stored names of the images of the rooms next to a room, which a person there may see next
+    def get_adjacent_room_images(self, room_name: str) -> List[str]:
+        return [
+            self.storage_manager.get_blob_name(self.name, self.rooms[next_room].image)
+            for next_room in self.rooms[room_name].exits.values()
+            if next_room in self.rooms and self.rooms[next_room].image
+        ]
+
     def get_opposite_direction(self, direction: str) -> Optional[str]:
         # Return the opposite direction
         return self.directions[direction][2]
@@ -353,21 +461,18 @@ class World:
 
         # Check that there is not already a room in this location based on the grid reference
         # Get the next x and y
-        next_x: int = (
-            int(current_room.grid_reference.split(",")[0])
-            + self.directions[direction][0]
-        )
-        next_y: int = (
-            int(current_room.grid_reference.split(",")[1])
-            + self.directions[direction][1]
+        next_x: int
+        next_y: int
+        next_x, next_y = self.get_adjacent_coordinates(
+            *current_room.get_coordinates(), direction
         )
         # Check if there is already a room in this location
         new_grid_reference: str = f"{next_x},{next_y}"
-        if new_grid_reference in self.grid_references:
+        if self.get_rooms_at(next_x, next_y):
             return (
                 (
                     f"Sorry, there is already a room to the {direction} of {current_location}, "
-                    + f"called {self.grid_references[f'{next_x},{next_y}']}. It must be accessed from somewhere else. "
+                    + f"called {self.get_rooms_at(next_x, next_y)}. It must be accessed from somewhere else. "
                     + self.get_room_build_options(current_location)
                 ),
                 "",
@@ -443,12 +548,16 @@ class World:
             image=None,
             creator=person.name or "system",
         )
+        self.index_room(new_room, *self.parse_grid_reference(new_grid_reference))
         self.storage_manager.store_world_object(self.name, new_room)
         self.rooms[room_name] = new_room
+        # Exits and build options of neighbouring rooms change too
+        self.invalidate_room_render()
 
         # Add the new room to the exits of the current room
         if current_location in self.rooms:
             self.rooms[current_location].exits[direction] = room_name
+            self.rooms[current_location].mark_changed("exits")
             #  TODO #86 Effect transactionality around storage of new room
             self.storage_manager.store_world_object(
                 self.name, self.rooms[current_location]
@@ -461,10 +570,23 @@ class World:
 
     def update_room_description(self, room_name: str, description: str) -> None:
         self.rooms[room_name].description = description
+        self.invalidate_room_render(room_name)
         self.storage_manager.store_world_object(self.name, self.rooms[room_name])
 
     def delete_room(self, room_name: str) -> str:
         logger.info(f"Deleting room {room_name}")
+        # Remove the room, and store the rooms whose exits led to it
+        for room in self.forget_room(room_name):
+            self.storage_manager.store_world_object(self.name, self.rooms[room])
+
+        self.storage_manager.delete_world_object(
+            self.name, "Room", room_name, location=""
+        )
+        logger.info(f"Room {room_name} has been deleted.")
+        return f"Room {room_name} has been deleted."
+
+    # Remove a room from this copy of the world, returning the rooms whose exits led to it
+    def forget_room(self, room_name: str) -> List[str]:
         # Remove the room from the exits of all other rooms
         rooms_to_update = []
         for room in self.rooms:
@@ -475,53 +597,72 @@ class World:
             for direction in list(self.rooms[room].exits.keys()):
                 if self.rooms[room].exits[direction] == room_name:
                     del self.rooms[room].exits[direction]
-                    self.storage_manager.store_world_object(self.name, self.rooms[room])
+                    self.rooms[room].mark_changed("exits")
         # Delete the room
-        del self.grid_references[self.rooms[room_name].grid_reference]
+        self.unindex_room(self.rooms[room_name])
         del self.rooms[room_name]
+        self.invalidate_room_render()
         # Change default room
         if self.default_location == room_name:
             self.default_location = list(self.rooms.keys())[0]
+        return rooms_to_update
 
-        self.storage_manager.delete_world_object(
-            self.name, "Room", room_name, location=""
-        )
-        logger.info(f"Room {room_name} has been deleted.")
-        return f"Room {room_name} has been deleted."
+    # Take copies of rooms built, changed or deleted by another orchestrator shard, which has stored them
+    def apply_room_changes(
+        self, rooms: List[Dict[str, Any]], deleted_rooms: List[str]
+    ) -> None:
+        for room_data in rooms:
+            room: Room = Room(world=self, init_dict=room_data)
+            room.mark_stored()
+            if room.name in self.rooms:
+                self.unindex_room(self.rooms[room.name])
+            if getattr(room, "grid_reference", None):
+                self.index_room(room, *self.parse_grid_reference(room.grid_reference))
+            self.rooms[room.name] = room
+            # Once a room has been built the world is no longer empty
+            self.is_empty = False
+        for room_name in deleted_rooms:
+            if room_name in self.rooms:
+                self.forget_room(room_name)
+        self.invalidate_room_render()
 
     # Search room for item by name and return reference to it if found
     def search_item(
         self, item_name: str, location: str, exact_match: bool = False
     ) -> Optional[WorldItem]:
-        for item in self.room_items.get(location, []):
-            # Return the first item that includes the given item name
-            # So "get clock" will find "dusty clock" and "grandfather clock"
-            if item_name and (
-                (item_name.lower() in item.get_name().lower() and exact_match is False)
-                or item_name.lower() == item.get_name().lower()
-                or item_name.lower() == "all"
-            ):
-                return item
+        # Unless an exact match is required, "get clock" will find "dusty clock" and "grandfather clock"
+        if location in self.room_items:
+            return self.room_items[location].find(item_name, exact_match)
         return None
 
     # Room items getter
-    def get_room_items(self, location: str) -> List[WorldItem]:
-        return self.room_items.get(location, [])
+    def get_room_items(self, location: str) -> ItemIndex:
+        if location in self.room_items:
+            return self.room_items[location]
+        return ItemIndex()
 
     # Room items setter
     def add_item_to_room(self, item: WorldItem, room_name: str) -> None:
+        self.invalidate_room_render(room_name)
         if room_name in self.room_items:
             self.room_items[room_name].append(item)
         else:
-            self.room_items[room_name] = [item]
+            self.room_items[room_name] = ItemIndex([item])
 
     # Room items setter
     def remove_item_from_room(self, world_item: WorldItem, room_name: str) -> None:
         if room_name in self.room_items:
-            for i, o in enumerate(self.room_items[room_name]):
-                if o.name == world_item.name:
-                    self.room_items[room_name].pop(i)
-                    return
+            room_items: ItemIndex = self.room_items[room_name]
+            # The item itself, or failing that another copy of it
+            item: Optional[WorldItem] = (
+                world_item
+                if world_item in room_items
+                else room_items.find(world_item.name, exact_match=True)
+            )
+            if item:
+                room_items.remove(item)
+                self.invalidate_room_render(room_name)
+                return
             # If item not found in room, log error
             logger.error(f"Item {world_item.name} not found in room {room_name}")
         else:
@@ -531,9 +672,10 @@ class World:
     def load_room_items(self) -> None:
         logger.info("Loading room items...")
         item_load_count: int = 0
-        for this_item in self.storage_manager.get_world_objects(self.name, "WorldItem"):
+        for this_item in self.get_stored_objects("WorldItem"):
             # Populate the room_item_map with item versions of the items
             o: WorldItem = WorldItem(world=self, init_dict=this_item)
+            o.mark_stored()
             self.register_item(o)
             item_load_count += 1
         if not item_load_count:
@@ -609,6 +751,9 @@ class World:
     # Update item description and store in database
     def update_item_description(self, item: WorldItem, description: str) -> None:
         item.description = description
+        # Detailed item descriptions are part of the room's cached text
+        if item.location in self.rooms:
+            self.invalidate_room_render(item.location)
         self.storage_manager.store_world_object(self.name, item)
 
     def load_entities(self) -> None:
@@ -616,9 +761,7 @@ class World:
             exit(logger, "Load_entities called when entities are already registered!")
         logger.info("Loading entities...")
         for entity_role in ("Animal", "Merchant"):
-            for this_item in self.storage_manager.get_world_objects(
-                self.name, entity_role
-            ):
+            for this_item in self.get_stored_objects(entity_role):
                 logger.debug(f"Loading entity {this_item['name']}")
                 # Populate the room_item_map with object versions of the items
                 # TODO #79 Streamline merchant and animal DB->object loading
@@ -642,6 +785,7 @@ class World:
                     )
                 else:
                     exit(logger, "Invalid or unsupported entity role")
+                entity_object.mark_stored()
                 self.register_entity(entity_object)
             # Storage empties - load from file
             # TODO #80 Consider moving default data loading from file down from world to storage manager
@@ -683,7 +827,51 @@ class World:
 
     def register_entity(self, entity: Union[Merchant, Animal]) -> None:
         # TODO #81 Implement unique entity and object ID to allow ants coins etc
+        previous_entity: Optional[Entity] = self.entities.get(entity.name)
+        if previous_entity and previous_entity is not entity:
+            self.remove_occupant(previous_entity)
         self.entities[entity.name] = entity
+        # People are only added to the occupancy index while they are in the world
+        if not isinstance(entity, Person):
+            self.add_occupant(entity)
+
+    # Add an entity to the occupancy index for its room
+    def add_occupant(self, entity: Entity, room_name: Optional[str] = None) -> None:
+        room_name = room_name or entity.get_current_location()
+        if isinstance(entity, Person):
+            self.room_people.setdefault(room_name, {})[entity.user_id] = entity
+        else:
+            self.room_entities.setdefault(room_name, {})[entity.name] = entity
+
+    # Remove an entity from the occupancy index, returning whether it was there
+    def remove_occupant(self, entity: Entity, room_name: Optional[str] = None) -> bool:
+        room_name = room_name or entity.get_current_location()
+        index: Dict[str, Dict[str, Entity]]
+        key: str
+        if isinstance(entity, Person):
+            index, key = self.room_people, entity.user_id
+        else:
+            index, key = self.room_entities, entity.name
+        occupants: Optional[Dict[str, Entity]] = index.get(room_name)
+        if not occupants or occupants.get(key) is not entity:
+            return False
+        del occupants[key]
+        if not occupants:
+            del index[room_name]
+        return True
+
+    # Keep the occupancy index in sync when an indexed entity changes room
+    def move_occupant(self, entity: Entity, previous_room: str, next_room: str) -> None:
+        if self.remove_occupant(entity, previous_room):
+            self.add_occupant(entity, next_room)
+
+    # People currently in the world who are in a room
+    def get_people_in_room(self, room_name: str) -> List[Person]:
+        return list(self.room_people.get(room_name, {}).values())
+
+    # Non-person entities (animals, merchants) in a room
+    def get_entities_in_room(self, room_name: str) -> List[Entity]:
+        return list(self.room_entities.get(room_name, {}).values())
 
     # Return list of entity names (e.g. for checking valid item starting locations)
     def get_entity_names(self) -> List[str]:
@@ -719,13 +907,13 @@ class World:
         )
         if stored_user_data:
             logger.info(f"Person {name} has played before")
-            # Check room is still valid
-            if stored_user_data["location"] not in self.rooms:
-                stored_user_data["location"] = self.default_location
-                logger.info(
-                    f"Person {name} has invalid location, resetting to {self.default_location}"
-                )
         p: Person = Person(self, user_id, name, role, stored_user_data=stored_user_data)
+        # Check room is still valid
+        if p.location not in self.rooms:
+            logger.info(
+                f"Person {name} has invalid location, resetting to {self.default_location}"
+            )
+            p.location = self.default_location
         # Store person's data again (updates last login timestamp if nothing else)
         self.storage_manager.store_world_object(self.name, p)
 
@@ -0,0 +1,119 @@
+# Set up logger first
+from utils import set_up_logger, exit, get_critical_env_variable
+from typing import Dict, List, Optional
+from os import environ
+from sys import argv
+import asyncio
+
+# Set up logger before importing other own modules
+logger = set_up_logger("World Host")
+
+from storagemanager import StorageManager
+from storagefactory import create_storage_manager
+from messagebroker_helper import MessageBrokerHelper
+from orchestrator import Orchestrator
+from shutdownexception import ShutdownException
+
+
+class WorldHost:
+    """Host several worlds in one process, each with its own Orchestrator, sharing the NATS connection and storage"""
+
+    # Event handlers for the back-end services shared by all the worlds
+
+    # AI responses go to the world that made the request
+    async def ai_response(self, data: Dict) -> None:
+        for orchestrator in self.orchestrators.values():
+            ai_manager = orchestrator.world_manager.ai_manager
+            if ai_manager and data.get("request_id") in ai_manager.remote_requests:
+                await orchestrator.ai_response(data)
+                return
+        logger.warning(f"No hosted world made AI request: {data}")
+
+    async def image_creation_response(self, data: Dict) -> None:
+        if data.get("world_name") in self.orchestrators:
+            await self.orchestrators[data["world_name"]].image_creation_response(data)
+        else:
+            logger.warning(f"Image created for a world not hosted here: {data}")
+
+    # End of event handlers
+
+    # The message broker class and storage manager can be swapped out e.g. for testing
+    def __init__(
+        self,
+        world_names: List[str],
+        mbh_class: type = MessageBrokerHelper,
+        storage_manager: Optional[StorageManager] = None,
+    ) -> None:
+        if int(environ.get("ORCHESTRATOR_SHARD_COUNT", 1)) > 1:
+            exit(logger, "Hosted worlds cannot also be sharded")
+
+        # One connection to the message broker for all worlds
+        self.mbh: MessageBrokerHelper = mbh_class(
+            get_critical_env_variable("ORCHESTRATOR_HOSTNAME"),
+            get_critical_env_variable("ORCHESTRATOR_PORT"),
+            {
+                "image_creation_request": {"mode": "publish"},
+                "image_prefetch_hint": {"mode": "publish"},
+                "image_creation_response": {
+                    "mode": "subscribe",
+                    "callback": self.image_creation_response,
+                },
+                "ai_request": {"mode": "publish"},
+                "ai_response": {"mode": "subscribe", "callback": self.ai_response},
+            },
+            # Flush the messages published by each event handler once, when it completes
+            buffer_callback_publishes=True,
+        )
+
+        # One storage manager (and so one set of storage clients) for all worlds
+        if not storage_manager:
+            storage_manager = create_storage_manager(
+                write_behind=environ.get("STORAGE_WRITE_BEHIND", "True").lower()
+                == "true",
+                # Optional local snapshots for fast restarts
+                snapshot_folder=environ.get("STORAGE_SNAPSHOT_FOLDER", ""),
+            )
+        self.storage_manager: StorageManager = storage_manager
+
+        self.orchestrators: Dict[str, Orchestrator] = {}
+        for world_name in world_names:
+            logger.info(f"Hosting world '{world_name}'")
+            self.orchestrators[world_name] = Orchestrator(
+                world_name,
+                storage_manager=self.storage_manager,
+                shared_mbh=self.mbh,
+            )
+
+    # This is async so cannot be in the constructor
+    async def start_hosting(self) -> None:
+        await self.mbh.set_up_nats()
+
+    def clean_up(self) -> None:
+        for orchestrator in self.orchestrators.values():
+            orchestrator.clean_up()
+        # Make sure all world changes are stored
+        self.storage_manager.close()
+
+
+async def main() -> None:
+    # Get world names from command line or environment variable (comma-separated)
+    world_names: List[str]
+    if len(argv) > 1:
+        world_names = argv[1:]
+    else:
+        world_names = environ.get("ORCHESTRATOR_WORLD_NAMES", "corvid").split(",")
+
+    world_host: WorldHost = WorldHost(
+        [world_name.strip() for world_name in world_names if world_name.strip()]
+    )
+    try:
+        await world_host.start_hosting()
+        await asyncio.Event().wait()  # Keeps the event loop running
+    except ShutdownException as e:
+        logger.critical(f"Shutdown initiated: {e}")
+        world_host.clean_up()
+        logger.info("Cleanup complete. Exiting.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
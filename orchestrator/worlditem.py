@@ -1,12 +1,23 @@
 from typing import Optional, Dict, Any
 from utils import set_up_logger, exit
+from storedobject import StoredObject
 
 # Set up logger
 logger = set_up_logger()
 
 
 # Person class
-class WorldItem:
+class WorldItem(StoredObject):
+
+    __slots__ = (
+        "name",
+        "description",
+        "location",
+        "price",
+        "starting_location",
+        "world",
+    )
+
     def __init__(
         self,
         world: "World",
@@ -17,7 +28,7 @@ class WorldItem:
         init_dict: Optional[Dict[str, Any]] = None,
     ) -> None:
         if init_dict:
-            self.__dict__.update(init_dict)
+            self.load_dict(init_dict)
         elif name:
             self.name: str = name
             self.description: Optional[str] = description
@@ -1,9 +1,12 @@
 from utils import set_up_logger, exit
 import asyncio
+import contextvars
 from typing import Any, Dict, List, Tuple, Optional, Union
 import time
 import sys
 import json
+import re
+import hashlib
 
 # Set up logger first
 logger = set_up_logger()
@@ -16,6 +19,7 @@ from worlditem import WorldItem
 from room import Room
 from aimanager import AIManager
 from storagemanager import StorageManager
+from shard_map import ShardMap
 from shutdownexception import ShutdownException
 
 
@@ -31,6 +35,10 @@ class WorldManager:
         model_name: Optional[str] = None,
         landscape: Optional[str] = None,
         animals_active: bool = True,
+        room_subjects: bool = False,
+        shard_map: Optional[ShardMap] = None,
+        shard_id: int = 0,
+        shard_handoff_timeout: float = 10,
     ) -> None:
 
         # Static variables
@@ -38,6 +46,19 @@ class WorldManager:
         self.background_loop_active: bool = False
         self.world_loop_time_secs: int = 30  # Animals etc move on this cycle
         self.animals_active: bool = animals_active
+        # If set, room-local messages are published once on the room's subject (room.<world>.<room>)
+        # rather than once per person in the room. Clients subscribe to it on entering the room.
+        self.room_subjects: bool = room_subjects
+
+        # If the world is sharded, this orchestrator only looks after the people, animals etc in its own rooms
+        self.shard_map: Optional[ShardMap] = shard_map
+        self.shard_id: int = shard_id
+        # People who have been handed over to another shard, and which one
+        self.handed_off: Dict[str, int] = {}
+        # People being handed over, who stay on this shard until the other shard confirms it has them
+        self.handing_off: Dict[str, Dict[str, Any]] = {}
+        # Seconds to wait for that confirmation before the person stays here after all
+        self.shard_handoff_timeout: float = shard_handoff_timeout
 
         # Set up world state
         self.mbh: object = mbh
@@ -100,18 +121,17 @@ class WorldManager:
         self, person: Person, item_name: str
     ) -> Optional[WorldItem]:
         """Try to find the item in the person's inventory."""
-        for inv_item in person.get_inventory():
-            if item_name.lower() in inv_item.get_name().lower():
-                return inv_item
-        return None
+        return person.get_inventory().find(item_name)
 
     def find_item_in_merchant_inventory(
         self, person: Person, item_name: str
     ) -> Optional[WorldItem]:
         for merchant in self.get_entities("merchant", person.get_current_location()):
-            for merchant_item in merchant.get_inventory():
-                if item_name and item_name.lower() in merchant_item.get_name().lower():
-                    return merchant_item
+            merchant_item: Optional[WorldItem] = merchant.get_inventory().find(
+                item_name
+            )
+            if merchant_item:
+                return merchant_item
         return None
 
     def do_look(self, person: Person, rest_of_response: str) -> str:
@@ -363,6 +383,11 @@ class WorldManager:
             self.world.delete_room(current_location)
             return_message += " Congratulations, it is the first location in this world! You move there immediately."
 
+        # The room the person built from now has an exit to the new room too
+        await self.share_room_changes(
+            [room_name, current_location],
+            [] if current_location in self.world.rooms else [current_location],
+        )
         return return_message
 
     async def request_room_image_creation(
@@ -495,10 +520,11 @@ class WorldManager:
     # Check if an item is an entity
     def get_entity_by_name(self, item_name: str) -> Optional["Entity"]:
         if item_name:
+            item_name = str(item_name).lower()
             for other_entity in self.get_other_entities():
                 if (
-                    str(other_entity.name).lower() == str(item_name).lower()
-                    or other_entity.get_role() == item_name.lower()
+                    str(other_entity.name).lower() == item_name
+                    or other_entity.get_role() == item_name
                 ):
                     return other_entity
         return None
@@ -510,6 +536,11 @@ class WorldManager:
         # Merchants are entities of a certain type.
         # If a room is specified, only return merchants in that room
         merchants = []
+        if room is not None:
+            for entity in self.world.get_entities_in_room(room):
+                if entity.get_role() == entity_type:
+                    merchants.append(entity)
+            return merchants
         for entity in self.world.entities.values():
             if entity.get_role() == entity_type:
                 if room is None or entity.get_current_location() == room:
@@ -518,17 +549,19 @@ class WorldManager:
 
     # Sale transaction
     def transact_sale(self, item_name: str, person: Person, merchant: Merchant) -> str:
-        for item in person.get_inventory():
-            if item.get_name().lower() == item_name.lower():
-                # Change item ownership
-                transfer_outcome: str = item.transfer(person, merchant)
-                if not transfer_outcome:
-                    # Add the money to the person's inventory
-                    person.add_money(item.get_price())
-                    # NOTE: Merchant has unlimited money for now at least
-                    return f"You sell {item.get_name(article='the')} to {merchant.get_name()} for {self.world.get_currency(item.get_price())}."
-                else:
-                    return "The sale fell through: " + transfer_outcome
+        item: Optional[WorldItem] = person.get_inventory().find(
+            item_name, exact_match=True
+        )
+        if item:
+            # Change item ownership
+            transfer_outcome: str = item.transfer(person, merchant)
+            if not transfer_outcome:
+                # Add the money to the person's inventory
+                person.add_money(item.get_price())
+                # NOTE: Merchant has unlimited money for now at least
+                return f"You sell {item.get_name(article='the')} to {merchant.get_name()} for {self.world.get_currency(item.get_price())}."
+            else:
+                return "The sale fell through: " + transfer_outcome
         return f"'{item_name}' is not in your inventory."
 
     async def make_purchase(
@@ -551,21 +584,16 @@ class WorldManager:
     async def transact_buy_get(
         self, action: str, item_name: str, person: Person, merchant: Merchant
     ) -> str:
-        found_count: int = 0
-        for item in merchant.get_inventory():
-            if (
-                item_name.lower() in item.get_name().lower()
-                or item_name.lower() == "all"
-            ):
-                found_count += 1
-                if action == "get":
-                    # Simply return True if the item is in the merchant's possession and the person said to get not buy
-                    # As we can't assume they were willing to buy it
-                    return f"The item '{item.get_name()}' is in the possession of a merchant. Perhaps you can purchase it?"
-                elif action == "buy":
-                    outcome: str = await self.make_purchase(item, person, merchant)
-                    return outcome
-        if found_count == 0:
+        item: Optional[WorldItem] = merchant.get_inventory().find(item_name)
+        if item:
+            if action == "get":
+                # Simply return True if the item is in the merchant's possession and the person said to get not buy
+                # As we can't assume they were willing to buy it
+                return f"The item '{item.get_name()}' is in the possession of a merchant. Perhaps you can purchase it?"
+            elif action == "buy":
+                outcome: str = await self.make_purchase(item, person, merchant)
+                return outcome
+        else:
             return f"There is no {item_name} to be found here."
 
     # Check if an item is in a merchant's possession
@@ -726,18 +754,13 @@ class WorldManager:
 
         # Check if the item is in the person's inventory
         found_count: int = 0
-        tmp_inv: List[WorldItem] = person.get_inventory().copy()
-        for item in tmp_inv:
-            if (
-                item_name.lower() in item.get_name().lower()
-                or item_name.lower() == "all"
-            ):
-                found_count += 1
-                if not item.get_price():
-                    return f"You can't sell {item.get_name(article='the')} - it is valueless (or priceless!)."
-                # Try to sell it to a merchant
-                outcome: str = await self.transact_item(item.get_name(), person, "sell")
-                await self.tell_person(person, outcome)
+        for item in person.get_inventory().find_all(item_name):
+            found_count += 1
+            if not item.get_price():
+                return f"You can't sell {item.get_name(article='the')} - it is valueless (or priceless!)."
+            # Try to sell it to a merchant
+            outcome: str = await self.transact_item(item.get_name(), person, "sell")
+            await self.tell_person(person, outcome)
         if item_name != "all" and found_count == 0:
             return f"You are not carrying '{item_name}'."
 
@@ -763,13 +786,14 @@ class WorldManager:
         # Check for any objects in this location
         prompt += f" {self.world.get_room_items_description(person.get_current_location(), detail=True):}"
         # Check for any entities in this location
-        for other_entity in self.get_other_entities(person.user_id):
-            if other_entity.get_current_location() == person.get_current_location():
-                prompt += (
-                    f" {other_entity.get_name().capitalize()} is here: "
-                    + other_entity.get_description()
-                    + "\n"
-                )
+        for other_entity in self.get_others_in_room(
+            person.get_current_location(), person.user_id
+        ):
+            prompt += (
+                f" {other_entity.get_name().capitalize()} is here: "
+                + other_entity.get_description()
+                + "\n"
+            )
 
         prompt += (
             f"\nThe person issues this command: {action}"
@@ -834,6 +858,7 @@ class WorldManager:
                 self.world.update_room_description(
                     person.get_current_location(), response_json["updated_location"]
                 )
+                await self.share_room_changes([person.get_current_location()])
             if response_json.get("updated_entities"):
                 for entity_name, new_description in response_json[
                     "updated_entities"
@@ -1007,11 +1032,10 @@ class WorldManager:
             message += f": {self.world.get_room_description(next_room, role=person.get_role())}"
             # Check for other entities who are already where you are arriving.
         logger.info(f"Checking for other entities than {person.user_id}")
-        for other_entity in self.get_other_entities(person.user_id):
-            if other_entity.get_current_location() == next_room:
-                message += f" {other_entity.get_name().capitalize()} is here."
-                if other_entity.get_role() == "merchant":
-                    message += " " + other_entity.get_inventory_description()
+        for other_entity in self.get_others_in_room(next_room, person.user_id):
+            message += f" {other_entity.get_name().capitalize()} is here."
+            if other_entity.get_role() == "merchant":
+                message += " " + other_entity.get_inventory_description()
         return message
 
     # Resolve move action
@@ -1071,18 +1095,16 @@ class WorldManager:
                 + self.world.get_room_exits_description(entity.get_current_location())
             )
 
-        # Check for other people you are leaving / joining
-        for other_entity in self.get_other_entities(entity.user_id, people_only=True):
-            if other_entity.get_current_location() == entity.get_current_location():
-                await self.tell_person(
-                    other_entity,
-                    departure_message,
-                )
-            elif other_entity.get_current_location() == next_room:
-                await self.tell_person(
-                    other_entity,
-                    arrival_message,
-                )
+        # People moving into a room owned by another shard are handed over to it,
+        # and only leave this room once it has them
+        if entity.is_person and not self.owns_room(next_room):
+            return await self.hand_off_person(
+                entity, direction, next_room, departure_message, arrival_message
+            )
+        # Tell other people you are leaving / joining
+        await self.tell_room(previous_room, departure_message, entity.user_id)
+        if next_room != previous_room:
+            await self.tell_room(next_room, arrival_message, entity.user_id)
 
         message: str = ""
         if entity.is_person:
@@ -1097,9 +1119,208 @@ class WorldManager:
 
         return message
 
+    # Sharding
+
+    # Shard that owns a room (always this one if the world isn't sharded)
+    def get_room_shard(self, room: str) -> int:
+        if not self.shard_map:
+            return self.shard_id
+        return self.shard_map.get_shard_for_room(self.world, room)
+
+    def owns_room(self, room: str) -> bool:
+        return self.get_room_shard(room) == self.shard_id
+
+    # Hand a person over to the shard that owns the room they are moving into
+    async def hand_off_person(
+        self,
+        person: Person,
+        direction: str,
+        next_room: str,
+        departure_message: str,
+        arrival_message: str,
+    ) -> str:
+        target_shard: int = self.get_room_shard(next_room)
+        logger.info(f"Handing {person.name} over to shard {target_shard}")
+
+        # The person stays here until the other shard confirms it has them.
+        # Anything they send in the meantime is held back until then.
+        self.handing_off[person.user_id] = {
+            "shard": target_shard,
+            "departure_message": departure_message,
+            "user_actions": [],
+            "timeout": asyncio.create_task(self.expire_handoff(person.user_id)),
+        }
+        await self.mbh.publish(
+            "shard_handoff",
+            {
+                "user_id": person.user_id,
+                "from_shard": self.shard_id,
+                "direction": direction,
+                "next_room": next_room,
+                # In case the other shard has not heard about the room yet
+                "room": self.world.rooms[next_room].to_dict(),
+                "arrival_message": arrival_message,
+                "person": person.to_dict(),
+                "inventory": [item.to_dict() for item in person.get_inventory()],
+            },
+            str(target_shard),
+        )
+        # The new shard tells the person where they have arrived
+        return ""
+
+    # If the other shard doesn't answer in time, the person stays on this shard
+    async def expire_handoff(self, user_id: str) -> None:
+        await asyncio.sleep(self.shard_handoff_timeout)
+        if user_id in self.handing_off:
+            logger.warning(f"Shard handoff of {user_id} timed out")
+            await self.finish_handoff(
+                {"user_id": user_id, "accepted": False, "reason": "timed out"}
+            )
+
+    # The other shard has taken over the person (or refused to)
+    async def finish_handoff(self, data: Dict[str, Any]) -> None:
+        user_id: str = data["user_id"]
+        handoff: Optional[Dict[str, Any]] = self.handing_off.pop(user_id, None)
+        if handoff:
+            handoff["timeout"].cancel()
+        person: Optional[Person] = self.people.get(user_id)
+
+        if not data["accepted"]:
+            logger.warning(f"Shard handoff of {user_id} failed: {data['reason']}")
+            if not handoff:
+                return
+            if person:
+                await self.tell_person(
+                    person, "You can't go that way right now. Try again in a moment."
+                )
+            # Deal with what they sent while they were being handed over here after all
+            for user_action in handoff["user_actions"]:
+                await self.mbh.publish(
+                    "shard_user_action", user_action, str(self.shard_id)
+                )
+            return
+
+        # Even if this shard gave up waiting, the other shard now has the person
+        # (and routes their messages to itself), so it is the one that counts
+        target_shard: int = data["shard"]
+        logger.info(f"{user_id} has been handed over to shard {target_shard}")
+        self.handed_off[user_id] = target_shard
+        if person:
+            if handoff:
+                await self.tell_room(
+                    person.get_current_location(),
+                    handoff["departure_message"],
+                    user_id,
+                )
+            self.world.remove_occupant(person)
+            del self.people[user_id]
+            self.world.entities.pop(person.name, None)
+        else:
+            # They left while being handed over, so the other shard lets them go too
+            await self.mbh.publish(
+                "shard_user_disconnect", {"user_id": user_id}, str(target_shard)
+            )
+        # Pass on what they sent while they were being handed over
+        for user_action in handoff["user_actions"] if handoff else []:
+            await self.mbh.publish("shard_user_action", user_action, str(target_shard))
+
+    # Take over a person handed over by another shard
+    async def receive_person(self, data: Dict[str, Any]) -> None:
+        user_id: str = data["user_id"]
+        next_room: str = data["next_room"]
+        # Rooms are built on one shard and shared with the others, so this may be the first this shard has heard of it
+        if next_room not in self.world.rooms and data.get("room"):
+            self.world.apply_room_changes([data["room"]], [])
+        if next_room not in self.world.rooms or not self.owns_room(next_room):
+            await self.mbh.publish(
+                "shard_handoff_response",
+                {
+                    "user_id": user_id,
+                    "accepted": False,
+                    "reason": f"shard {self.shard_id} does not own {next_room}",
+                },
+                str(data["from_shard"]),
+            )
+            return
+
+        person_data: Dict[str, Any] = data["person"]
+        person: Person = Person(
+            self.world,
+            user_id,
+            person_data["name"],
+            person_data["role"],
+            stored_user_data=person_data,
+        )
+        # Input history usually resets on login, but not on moving shard
+        person.input_history = person_data.get("input_history", [])
+        logger.info(
+            f"Received {person.name} from another shard, arriving in {next_room}"
+        )
+
+        # Items they are carrying replace any out of date copies loaded when this shard started
+        for item_data in data["inventory"]:
+            for room, room_items in self.world.room_items.items():
+                item: Optional[WorldItem] = room_items.find(
+                    item_data["name"], exact_match=True
+                )
+                if item:
+                    self.world.remove_item_from_room(item, room)
+            self.world.register_item(WorldItem(self.world, init_dict=item_data))
+
+        # This shard looks after the person now, including storing them
+        person.location = next_room
+        self.handed_off.pop(user_id, None)
+        self.register_person(user_id, person, person.name)
+        self.world.storage_manager.store_world_object(self.world.name, person)
+
+        # Make sure later input from the person comes here, then let the old shard know
+        await self.mbh.publish(
+            "shard_route", {"user_id": user_id, "shard": self.shard_id}
+        )
+        await self.mbh.publish(
+            "shard_handoff_response",
+            {"user_id": user_id, "accepted": True, "shard": self.shard_id},
+            str(data["from_shard"]),
+        )
+
+        await self.tell_room(next_room, data["arrival_message"], user_id)
+        message: str = self.build_move_outcome_message(
+            person, self.resolve_move_action(data["direction"]), next_room
+        )
+        await self.emit_user_room_update(person, next_room)
+        person.seen_rooms[next_room] = True
+        person.mark_changed("seen_rooms")
+        await self.tell_person(person, message)
+        await self.activate_background_loop()
+
+    # Each shard (and the shard router) loads the rooms once, so rooms built or changed here are passed on
+    async def share_room_changes(
+        self, room_names: List[str], deleted_rooms: Optional[List[str]] = None
+    ) -> None:
+        if not self.shard_map:
+            return
+        await self.mbh.publish(
+            "shard_room_update",
+            {
+                "shard": self.shard_id,
+                "rooms": [
+                    self.world.rooms[room_name].to_dict()
+                    for room_name in room_names
+                    if room_name in self.world.rooms
+                ],
+                "deleted_rooms": deleted_rooms or [],
+            },
+        )
+
+    # Rooms built or changed by another shard
+    def receive_room_changes(self, data: Dict[str, Any]) -> None:
+        if data["shard"] != self.shard_id:
+            self.world.apply_room_changes(data["rooms"], data["deleted_rooms"])
+
     def register_person(self, user_id: str, person: Person, user_name: str) -> Person:
         self.people[user_id] = person
         self.user_id_to_name_map[user_id] = user_name
+        self.world.add_occupant(person)
         return person
 
     # Emit a message about a room to a specific person
@@ -1118,9 +1339,19 @@ class WorldManager:
                     show_exits=False,
                 ),
                 "exits": self.world.get_room_exits_description(room),
+                # Subject for messages about this room, if they're published per room
+                "room_subject": (
+                    f"room.{self.get_room_subject(room)}" if self.room_subjects else ""
+                ),
             },
             person.user_id,
         )
+        # So the image server can have the next room's image ready before the person gets there
+        adjacent_room_images: List[str] = self.world.get_adjacent_room_images(room)
+        if adjacent_room_images:
+            await self.mbh.publish(
+                "image_prefetch_hint", {"images": adjacent_room_images}
+            )
 
     # Emit a message to all people
     async def tell_everyone(self, message: str) -> None:
@@ -1130,18 +1361,70 @@ class WorldManager:
     async def tell_others(
         self, user_id: Optional[str], message: str, shout: bool = False
     ) -> int:
-        told_count = 0
-        if message.strip():
-            for other_user_id, other_person in self.people.items():
-                # Only tell another person if they are in the same room
-                if user_id != other_user_id and (
-                    shout
-                    or other_person.get_current_location()
-                    == self.people[user_id].get_current_location()
-                ):
-                    await self.tell_person(other_person, message)
-                    told_count += 1
-        return told_count
+        message = message.strip()
+        if not message:
+            return 0
+        recipients: List[Person]
+        if shout:
+            recipients = [
+                other_person
+                for other_user_id, other_person in self.people.items()
+                if user_id != other_user_id
+            ]
+        else:
+            # Only tell other people in the same room
+            return await self.tell_room(
+                self.people[user_id].get_current_location(), message, user_id
+            )
+        if recipients:
+            # Publish to all recipients with a single flush
+            await self.mbh.publish_many(
+                [("world_update", message, person.user_id) for person in recipients]
+            )
+            for person in recipients:
+                person.add_input_history(f"World: {message}")
+        return len(recipients)
+
+    # Emit a message to the people in a room, except the one specified (if any)
+    async def tell_room(
+        self, room: str, message: str, user_id: Optional[str] = None
+    ) -> int:
+        message = message.strip()
+        if not message:
+            return 0
+        recipients: List[Person] = self.get_others_in_room(
+            room, user_id, people_only=True
+        )
+        if not recipients:
+            return 0
+        if self.room_subjects:
+            # One message for the whole room; clients ignore it if they are excluded
+            await self.mbh.publish(
+                "room",
+                {
+                    "message": message,
+                    "exclude": [user_id] if user_id is not None else [],
+                },
+                self.get_room_subject(room),
+            )
+        else:
+            # Publish to all recipients with a single flush
+            await self.mbh.publish_many(
+                [("world_update", message, person.user_id) for person in recipients]
+            )
+        for person in recipients:
+            person.add_input_history(f"World: {message}")
+        return len(recipients)
+
+    # Subject suffix for a room: <world>.<room>, lower case with anything NATS doesn't allow in a token replaced.
+    # A short hash of the original name keeps names that only differ in those characters apart
+    def get_room_subject(self, room: str) -> str:
+        return ".".join(
+            re.sub(r"[^a-z0-9_-]+", "_", name.lower())
+            + "_"
+            + hashlib.sha256(name.encode()).hexdigest()[:8]
+            for name in (self.world.name, room)
+        )
 
     # Emit a message to a specific person
     async def tell_person(
@@ -1167,6 +1450,19 @@ class WorldManager:
                     other_entities.append(entity)
         return other_entities
 
+    # Get the other people (and optionally entities) in a room, using the world's occupancy index
+    def get_others_in_room(
+        self, room: str, user_id: Optional[str] = None, people_only: bool = False
+    ) -> List[Union[Person, Entity]]:
+        others: List[Union[Person, Entity]] = [
+            other_person
+            for other_person in self.world.get_people_in_room(room)
+            if user_id is None or other_person.user_id != user_id
+        ]
+        if not people_only:
+            others.extend(self.world.get_entities_in_room(room))
+        return others
+
     # Emit world data update to all people
     async def emit_world_data_update(self) -> None:
         if self.get_user_count() > 0:
@@ -1217,6 +1513,7 @@ class WorldManager:
             await self.mbh.publish("logout", reason, user_id)
             # Check again (race condition)
             if user_id in self.people:
+                self.world.remove_occupant(self.people[user_id])
                 del self.people[user_id]
             # If there are no people left, stop the background loop
             if self.get_user_count() == 0:
@@ -1251,7 +1548,10 @@ class WorldManager:
         if not self.background_loop_active:
             logger.info("Activating background loop.")
             self.background_loop_active = True
-            asyncio.create_task(self.world_background_loop())
+            # Started with a fresh context, so it has no publish buffer of the handler that started it
+            asyncio.create_task(
+                self.world_background_loop(), context=contextvars.Context()
+            )
 
     # Cause the world background loop to exit
     def deactivate_background_loop(self) -> None:
@@ -1268,29 +1568,32 @@ class WorldManager:
             # Time out people who do nothing for too long.
             await self.check_people_activity()
 
-            # Move animals around
+            # Move animals around, flushing all resulting messages together
             if self.animals_active:
-                direction: str
-                for animal in self.get_entities("animal"):
-                    direction = animal.maybe_pick_direction_to_move()
-                    if direction:
-                        logger.info(f"Moving {animal.name} {direction}")
-                        await self.move_entity(animal, direction)
-                    else:
-                        gesture_description: str = animal.maybe_gesture()
-                        if gesture_description:
-                            logger.info(
-                                f"{animal.name} will gesture {gesture_description}"
-                            )
-                            # Check for other people who will witness the gesture
-                            for other_entity in self.get_other_entities(
-                                None, people_only=True
-                            ):
-                                if (
-                                    other_entity.get_current_location()
-                                    == animal.get_current_location()
-                                ):
-                                    await self.tell_person(
-                                        other_entity,
-                                        gesture_description,
-                                    )
+                async with self.mbh.buffered_publishing():
+                    await self.move_animals()
+
+    # Move or animate each animal, telling the people who witness it
+    async def move_animals(self) -> None:
+        direction: str
+        for animal in self.get_entities("animal"):
+            # Animals in other shards' rooms are looked after by those shards
+            if not self.owns_room(animal.get_current_location()):
+                continue
+            direction = animal.maybe_pick_direction_to_move()
+            # Animals stay within this shard's rooms
+            if direction and not self.owns_room(
+                self.world.get_next_room(animal.get_current_location(), direction)
+            ):
+                direction = ""
+            if direction:
+                logger.info(f"Moving {animal.name} {direction}")
+                await self.move_entity(animal, direction)
+            else:
+                gesture_description: str = animal.maybe_gesture()
+                if gesture_description:
+                    logger.info(f"{animal.name} will gesture {gesture_description}")
+                    # Tell other people who will witness the gesture
+                    await self.tell_room(
+                        animal.get_current_location(), gesture_description
+                    )
@@ -1,5 +1,6 @@
 import asyncio
 import signal
+from os import environ
 from utils import set_up_logger, exit
 from typing import List, Dict
 from utils import get_critical_env_variable
@@ -60,9 +61,31 @@ async def main() -> None:
         await mbh.publish("logout", {"reason": data.get("reason", "unknown")})
         exit(logger, "Logout received.")
 
+    # Subject of the messages to everyone in the person's room, if they are published per room
+    room_subject: str = ""
+
     # Room update event handler
     async def room_update(data: Dict) -> None:
+        nonlocal room_subject
         print("ROOM UPDATE:", data)
+        # Follow the person into the new room
+        new_room_subject: str = (
+            data.get("room_subject", "") if isinstance(data, dict) else ""
+        )
+        if new_room_subject != room_subject:
+            if room_subject:
+                await mbh.unsubscribe(room_subject)
+            if new_room_subject:
+                await mbh.subscribe(new_room_subject, room_message)
+            room_subject = new_room_subject
+
+    # Message to everyone in the room, unless it's about this person's own action
+    async def room_message(data: Dict) -> None:
+        if not isinstance(data, dict) or "message" not in data:
+            logger.warning(f"Ignoring unexpected room message: {data}")
+            return
+        if str(user_name).lower() not in data.get("exclude", []):
+            print(data["message"])
 
     # Person update event handler
     async def world_data_update(data: Dict) -> None:
@@ -90,9 +113,12 @@ async def main() -> None:
             "shutdown": {"mode": "subscribe", "callback": shutdown},
             "logout": {"mode": "both", "callback": logout},
             "room_update": {"mode": "subscribe", "callback": room_update},
+            "room": {"mode": "subscribe", "callback": room_message},
             "world_data_update": {"mode": "subscribe", "callback": world_data_update},
             "name_invalid": {"mode": "subscribe", "callback": name_invalid},
         },
+        # Set if the world is hosted alongside others, e.g. its name
+        namespace=environ.get("ORCHESTRATOR_NAMESPACE", ""),
     )
 
     # Start consuming messages